@@ -1,15 +1,32 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Book
+from .models import Author, Book, Publisher
+from .filters import build_book_search
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ['name', 'author', 'publisher', 'publication_date', 'isbn']
+    list_select_related = ['author', 'publisher']
+    autocomplete_fields = ['author', 'publisher']
     list_filter = ['publication_date']
-    search_fields = ['name', 'author', 'publisher', 'isbn']
+    search_fields = ['name', 'author__name', 'publisher__name', 'isbn']
     ordering = ['id']
     list_per_page = 10
     list_max_show_all = 100
     list_editable = ['publication_date']
-    list_display_links = ['name']
\ No newline at end of file
+    list_display_links = ['name']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the indexed full-text / trigram search instead of LIKE scans
+        condition, _ = build_book_search(search_term.split())
+        if condition is None:
+            return queryset, False
+        return queryset.filter(condition), False
+
+
+@admin.register(Author, Publisher)
+class NamedEntityAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
+    ordering = ['name']
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.books'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import signals  # noqa: F401
+        from .suggest import preload
+
+        # Build the typeahead index in the background as soon as a worker
+        # serves its first request, rather than on the first keystroke
+        # (BOOK_SUGGEST_PRELOAD)
+        request_started.connect(preload, dispatch_uid='books_suggest_preload')
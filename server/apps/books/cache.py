@@ -0,0 +1,103 @@
+"""
+Cache keys for derived book data (facets, list pages).
+
+Instead of deleting every cached entry when a book changes, all keys include a
+generation number that is bumped on each write (see signals.py). Entries of
+older generations are simply never read again and expire on their own. The
+generation lives in the cache itself, so a bump only reaches the workers that
+share it: with the local-memory cache, other workers keep serving their
+entries until BOOK_LIST_CACHE_TIMEOUT / BOOK_FACETS_CACHE_TIMEOUT.
+
+get_or_compute() adds a stampede guard: when a popular entry is missing, one
+caller rebuilds it while concurrent callers wait for the result instead of
+all running the same query.
+"""
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from project.metrics import record_cache
+
+GENERATION_KEY = 'books:generation'
+
+
+def get_generation():
+    """Return the current catalog generation."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        _init_generation()
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Invalidate every cached facet and list entry after a catalog write."""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        _init_generation()
+        return cache.incr(GENERATION_KEY)
+
+
+def _init_generation():
+    # Start from the clock rather than 1: if the counter is evicted (e.g. by
+    # the local-memory cache's MAX_ENTRIES), entries written under the old
+    # numbers must not become readable again
+    cache.add(GENERATION_KEY, time.time_ns() // 1000, timeout=None)
+
+
+def make_cache_key(prefix, params):
+    """
+    Build a cache key for a normalised set of request parameters.
+
+    Args:
+        prefix: Kind of entry, e.g. 'facets'
+        params: Dict of parameter name to list of values, already normalised
+
+    Returns:
+        str: Key that changes with the parameters and the catalog generation
+    """
+    payload = json.dumps(sorted(params.items()), separators=(',', ':'))
+    digest = hashlib.sha1(payload.encode()).hexdigest()
+    return f"books:{prefix}:{get_generation()}:{digest}"
+
+
+def get_or_compute(key, compute, timeout):
+    """
+    Return the cached value for key, computing and caching it when missing.
+
+    Only one caller computes a missing entry: it holds a short lock entry
+    while the others poll for the result for up to BOOK_CACHE_LOCK_WAIT
+    seconds, and then compute it themselves rather than wait any longer.
+
+    Args:
+        key: Cache key (see make_cache_key)
+        compute: Callable returning the value; must not return None
+        timeout: Seconds to keep the value
+
+    Returns:
+        The cached or freshly computed value
+    """
+    value = cache.get(key)
+    # 'books:list', 'books:facets', ...
+    record_cache(key.rsplit(':', 2)[0], value is not None)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, timeout=settings.BOOK_CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + settings.BOOK_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
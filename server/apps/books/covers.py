@@ -0,0 +1,153 @@
+"""
+Cover photo derivatives: fixed-size JPEG and WebP thumbnails.
+
+Originals and derivatives are stored under the SHA-256 of the original's
+content, so identical covers are stored and resized only once, and a
+derivative's URL never changes meaning. That makes them safe to cache
+forever.
+
+    books/covers/ab/abcdef....jpg             original
+    books/derived/ab/abcdef.../thumbnail.webp derivatives
+
+Resizing runs in a small thread pool (Pillow releases the GIL while it
+decodes, resizes and encodes), so uploads return before the thumbnails are
+ready. A derivative that is requested before it exists is queued on demand.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# format name -> (Pillow format, file extension, content type, save options)
+COVER_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+}
+CONTENT_TYPES = {extension: content_type for _, extension, content_type, _ in COVER_FORMATS.values()}
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = {}
+
+
+def hash_file(file):
+    """Return the hex SHA-256 of a file's content, leaving it rewound."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(1024 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def cover_upload_to(instance, filename):
+    """upload_to for Book.cover_photo: books/covers/<sha[:2]>/<sha><ext>."""
+    extension = os.path.splitext(filename)[1].lower()
+    sha = instance.cover_sha256 or hash_file(instance.cover_photo.file)
+    return f"books/covers/{sha[:2]}/{sha}{extension}"
+
+
+def derivative_name(sha, size, extension):
+    """Storage name of one derivative, e.g. books/derived/ab/ab12.../thumbnail.webp."""
+    return f"books/derived/{sha[:2]}/{sha}/{size}.{extension}"
+
+
+def prepare_cover(book):
+    """
+    Hash a newly assigned cover before the book is saved.
+
+    Sets book.cover_sha256 and, when the same content is already stored,
+    points the field at the stored file instead of writing a copy.
+    """
+    cover = book.cover_photo
+    if not cover:
+        book.cover_sha256 = ''
+        return
+    if cover._committed:
+        return
+
+    book.cover_sha256 = hash_file(cover.file)
+    name = cover.field.generate_filename(book, cover.name)
+    if cover.storage.exists(name):
+        cover.name = name
+        cover._committed = True
+
+
+def schedule_derivatives(name, sha):
+    """
+    Render the derivatives of a stored original in the worker pool.
+
+    Concurrent requests for the same content share one job.
+
+    Args:
+        name: Storage name of the original
+        sha: SHA-256 of the original
+
+    Returns:
+        concurrent.futures.Future: Resolves to the number of files written
+    """
+    global _executor
+
+    with _executor_lock:
+        future = _in_flight.get(sha)
+        if future is not None:
+            return future
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BOOK_COVER_WORKERS,
+                thread_name_prefix='book-covers'
+            )
+        future = _executor.submit(render_derivatives, name, sha)
+        _in_flight[sha] = future
+
+    def done(finished):
+        with _executor_lock:
+            _in_flight.pop(sha, None)
+        if finished.exception() is not None:
+            logger.error("Rendering cover %s failed", name, exc_info=finished.exception())
+
+    future.add_done_callback(done)
+    return future
+
+
+def render_derivatives(name, sha):
+    """
+    Write every missing size and format of one cover.
+
+    Args:
+        name: Storage name of the original
+        sha: SHA-256 of the original
+
+    Returns:
+        int: Number of derivatives written (0 when all of them existed)
+    """
+    missing = [
+        (size, dimensions, image_format)
+        for size, dimensions in settings.BOOK_COVER_SIZES.items()
+        for image_format in COVER_FORMATS.values()
+        if not default_storage.exists(derivative_name(sha, size, image_format[1]))
+    ]
+    if not missing:
+        return 0
+
+    with default_storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    resized = {}
+    for size, dimensions, (pillow_format, extension, _, options) in missing:
+        if size not in resized:
+            # Crop to the target aspect ratio, so every thumbnail has the same size
+            resized[size] = ImageOps.fit(image, dimensions, Image.LANCZOS)
+        output = io.BytesIO()
+        resized[size].save(output, pillow_format, **options)
+        default_storage.save(derivative_name(sha, size, extension), ContentFile(output.getvalue()))
+    return len(missing)
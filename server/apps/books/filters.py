@@ -0,0 +1,121 @@
+import re
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.settings import api_settings
+from .models import Book
+
+# Text search configuration used by the search_vector trigger (migration 0003)
+BOOK_SEARCH_CONFIG = 'simple'
+
+# Trigram indexes only help for terms of at least three characters
+TRIGRAM_MIN_LENGTH = 3
+
+_WORD = re.compile(r'\w+')
+
+
+def build_book_search(terms):
+    """
+    Build the indexed search condition for a list of search terms.
+
+    Every term must match, either as a word prefix anywhere in the search
+    vector (name, isbn, author, publisher) or as a substring of the name or
+    ISBN. The first uses the GIN index on search_vector, the second the
+    pg_trgm indexes on UPPER(name) and UPPER(isbn).
+
+    Args:
+        terms: Search terms as split by SearchFilter.get_search_terms
+
+    Returns:
+        tuple: (Q condition, SearchQuery for ranking), or (None, None) when the
+        terms contain no searchable characters
+    """
+    condition = Q()
+    prefixes = []
+
+    for term in terms:
+        words = _WORD.findall(term)
+        if not words:
+            continue
+        prefix = ' & '.join(f"{word}:*" for word in words)
+        prefixes.append(prefix)
+
+        term_condition = Q(search_vector=SearchQuery(prefix, config=BOOK_SEARCH_CONFIG, search_type='raw'))
+        if len(term) >= TRIGRAM_MIN_LENGTH:
+            term_condition |= Q(name__icontains=term) | Q(isbn__icontains=term)
+        condition &= term_condition
+
+    if not prefixes:
+        return None, None
+
+    # Rank on any of the words so substring-only matches still get a score
+    rank_query = SearchQuery(' | '.join(f"({prefix})" for prefix in prefixes), config=BOOK_SEARCH_CONFIG, search_type='raw')
+    return condition, rank_query
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter backed by PostgreSQL full-text search.
+
+    Keeps the ?search= parameter. Instead of UPPER(...) LIKE '%x%' on every
+    column it matches word prefixes through the search_vector GIN index and
+    substrings of name/ISBN through pg_trgm. Without an explicit ?ordering=
+    the results are sorted by relevance (SearchRank), best first.
+    """
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        condition, rank_query = build_book_search(terms)
+        if condition is None:
+            return queryset.none()
+
+        queryset = queryset.filter(condition)
+        if request.query_params.get(self.ordering_param):
+            return queryset
+        # Cast the float4 rank to double precision so it survives the round
+        # trip through a keyset pagination cursor exactly
+        return queryset.annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), rank_query), FloatField())
+        ).order_by('-search_rank', 'id')
+
+
+class BookFilter(django_filters.FilterSet):
+    """
+    Equality filters for the book list.
+
+    author and publisher match names case-insensitively through the
+    UPPER(name) unique index of their tables; author_id / publisher_id filter
+    on the integer keys directly.
+    """
+    author = django_filters.CharFilter(field_name='author__name', lookup_expr='iexact')
+    publisher = django_filters.CharFilter(field_name='publisher__name', lookup_expr='iexact')
+    author_id = django_filters.NumberFilter(field_name='author_id')
+    publisher_id = django_filters.NumberFilter(field_name='publisher_id')
+
+    class Meta:
+        model = Book
+        fields = ['name', 'author', 'author_id', 'publisher', 'publisher_id', 'publication_date', 'isbn']
+
+
+class BookOrderingFilter(OrderingFilter):
+    """OrderingFilter that sorts ?ordering=author / publisher by name."""
+    ordering_aliases = {
+        'author': 'author__name',
+        'publisher': 'publisher__name',
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [self._resolve_alias(field) for field in ordering]
+
+    def _resolve_alias(self, field):
+        prefix = '-' if field.startswith('-') else ''
+        return prefix + self.ordering_aliases.get(field.lstrip('-'), field.lstrip('-'))
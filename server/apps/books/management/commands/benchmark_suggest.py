@@ -0,0 +1,139 @@
+import math
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.books import suggest, views
+from apps.users.models import User
+
+WORDS = (
+    'the of and a in to is was for on with his as at by from this had not are but or have an they which one you '
+    'were her all she there would their we him been has when who will more no if out so said what up its about '
+    'into than them can only other new some could time these two may then do first any my now such like our over '
+    'man me even most made after also did many before must through back years where much your way well down should '
+    'because each just those people how too little state good very make world still own see men work long get here '
+    'between both life being under never day same another know while last might us great old year off come since '
+    'against go came right used take three garden river stone night history ocean silent code machine learning war '
+    'peace kitchen shadow empire winter summer dragon secret letters journey city house island mountain forest king '
+    'queen child mother father brother sister daughter son love death light dark fire water earth wind star moon'
+).split()
+
+
+class Command(BaseCommand):
+    """
+    Measure typeahead latency of the book suggestion index.
+
+    Builds a synthetic index (no database needed), replays random prefixes of
+    the indexed titles and author names as a user would type them, and reports
+    the latency percentiles. Fails when p99 is above the target.
+
+    Usage:
+        python manage.py benchmark_suggest
+        python manage.py benchmark_suggest --size 1000000 --queries 50000
+        python manage.py benchmark_suggest --through-view
+        python manage.py benchmark_suggest --from-db
+    """
+    help = 'Benchmark /api/books/suggest/ prefix lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1000000, help='Number of synthetic titles')
+        parser.add_argument('--authors', type=int, default=100000, help='Number of synthetic authors')
+        parser.add_argument('--queries', type=int, default=20000, help='Number of lookups to time')
+        parser.add_argument('--limit', type=int, default=10, help='Completions per kind')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--target-p99-ms', type=float, default=5.0, help='Fail when p99 exceeds this')
+        parser.add_argument(
+            '--through-view', action='store_true',
+            help='Time full requests through the DRF view instead of bare index lookups'
+        )
+        parser.add_argument(
+            '--from-db', action='store_true',
+            help='Index the real catalog instead of synthetic titles'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        started = time.perf_counter()
+        index = suggest.BookSuggestions()
+        if options['from_db']:
+            index.build()
+            titles = index.books._names
+            authors = index.authors._names
+        else:
+            titles = [self._title(rng) for _ in range(options['size'])]
+            authors = [self._author(rng) for _ in range(options['authors'])]
+            index.books.load(enumerate(titles, start=1))
+            index.authors.load(enumerate(authors, start=1))
+            index.built_at = index._checked_at = time.monotonic()
+            index.generation = None
+        if not titles:
+            raise CommandError("The index is empty.")
+        self.stdout.write(
+            f"Indexed {len(index.books)} titles and {len(index.authors)} authors "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+        # What a user types: the first 1-12 characters of a real title or author
+        samples = []
+        for _ in range(options['queries']):
+            source = rng.choice(titles) if rng.random() < 0.8 else rng.choice(authors)
+            samples.append(source[:rng.randint(1, 12)])
+
+        if options['through_view']:
+            timings = self._time_view(index, samples, options['limit'])
+        else:
+            timings = self._time_index(index, samples, options['limit'])
+
+        timings.sort()
+        p50, p95, p99 = (self._percentile(timings, pct) for pct in (50, 95, 99))
+        self.stdout.write(
+            f"{len(timings)} lookups: p50 {p50:.3f} ms, p95 {p95:.3f} ms, "
+            f"p99 {p99:.3f} ms, max {timings[-1]:.3f} ms"
+        )
+
+        if p99 > options['target_p99_ms']:
+            raise CommandError(f"p99 {p99:.3f} ms is above the {options['target_p99_ms']} ms target.")
+        self.stdout.write(self.style.SUCCESS(f"p99 is within the {options['target_p99_ms']} ms target."))
+
+    def _time_index(self, index, samples, limit):
+        timings = []
+        for query in samples:
+            started = time.perf_counter()
+            index.suggest(query, limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def _time_view(self, index, samples, limit):
+        factory = APIRequestFactory()
+        view = views.BookViewSet.as_view({'get': 'suggest'})
+        user = User(username='benchmark', is_active=True)
+
+        # Serve the requests from the benchmark index instead of the process-wide one
+        shared = views.suggestions
+        views.suggestions = index
+        try:
+            timings = []
+            for query in samples:
+                request = factory.get('/api/books/suggest/', {'q': query, 'limit': limit})
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"Unexpected status {response.status_code} for {query!r}")
+            return timings
+        finally:
+            views.suggestions = shared
+
+    def _title(self, rng):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6))).title()
+
+    def _author(self, rng):
+        return f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}{rng.randint(1, 999)}"
+
+    def _percentile(self, ordered, pct):
+        """Nearest-rank percentile of an already sorted list."""
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
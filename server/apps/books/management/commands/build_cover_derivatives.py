@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from apps.books.cache import bump_generation
+from apps.books.covers import hash_file, schedule_derivatives
+from apps.books.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Hash existing cover photos and render their missing thumbnails.
+
+    New uploads are handled by the book signals; this backfills covers that
+    were stored before thumbnails existed, and re-renders everything after
+    BOOK_COVER_SIZES changes (existing derivatives are kept).
+
+    Usage:
+        python manage.py build_cover_derivatives
+        python manage.py build_cover_derivatives --all
+    """
+    help = 'Backfill cover hashes and render missing cover thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Check every book with a cover, not only the ones without a hash'
+        )
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(Q(cover_photo='') | Q(cover_photo__isnull=True))
+        if not options['all']:
+            books = books.filter(cover_sha256='')
+
+        hashed = rendered = failed = 0
+        jobs = {}
+        for pk, name, sha in books.values_list('id', 'cover_photo', 'cover_sha256').iterator():
+            if not sha:
+                try:
+                    with Book.cover_photo.field.storage.open(name, 'rb') as original:
+                        sha = hash_file(original)
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"Book {pk} ({name}): {exc}")
+                    continue
+                # The serialized book changes, so move updated_at for its ETag
+                Book.objects.filter(pk=pk).update(cover_sha256=sha, updated_at=timezone.now())
+                hashed += 1
+            if sha not in jobs:
+                jobs[sha] = (name, schedule_derivatives(name, sha))
+
+        for sha, (name, job) in jobs.items():
+            try:
+                rendered += job.result()
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"{name}: {exc}")
+
+        if hashed:
+            bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Hashed {hashed} covers, wrote {rendered} thumbnails for {len(jobs)} distinct covers, "
+            f"{failed} failed."
+        ))
@@ -0,0 +1,79 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.books.services import IMPORT_CONFLICT_MODES, import_books
+from project.streaming import FEED_FORMATS, FeedReadError, detect_format, iter_records, open_text
+
+
+class Command(BaseCommand):
+    """
+    Stream books from a CSV or NDJSON file into the catalog.
+    
+    Rows are validated and written in chunks (COPY into a staging table, then
+    INSERT ... ON CONFLICT (isbn)), so memory use stays flat no matter how
+    large the file is. Every row needs name, author, publisher,
+    publication_date and isbn; unknown authors and publishers are created.
+    
+    Usage:
+        python manage.py import_books books.csv
+        python manage.py import_books books.ndjson.gz --chunk-size 10000
+        python manage.py import_books books.csv --on-conflict skip
+        cat books.ndjson | python manage.py import_books - --format ndjson
+    """
+    help = 'Bulk create or update books from a CSV or NDJSON file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Import file, or '-' to read from stdin")
+        parser.add_argument(
+            '--format', dest='feed_format', choices=FEED_FORMATS,
+            help='File format (detected from the file name when omitted)'
+        )
+        parser.add_argument(
+            '--on-conflict', choices=IMPORT_CONFLICT_MODES, default='update',
+            help='Update or skip books whose isbn already exists'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.BOOK_IMPORT_CHUNK_SIZE,
+            help='Rows validated and written per transaction'
+        )
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['feed_format'] or detect_format(path)
+        if feed_format is None:
+            raise CommandError('Could not detect the file format, pass --format.')
+        
+        def on_chunk(report):
+            self.stdout.write(
+                f"Chunk {report['chunk']}: {report['rows']} rows, {report['inserted']} inserted, "
+                f"{report['updated']} updated, {report['rejected']} rejected in {report['seconds']}s "
+                f"({report['rows_per_second']} rows/s)"
+            )
+        
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        
+        try:
+            stream = open_text(binary, filename=path)
+            summary = import_books(
+                iter_records(stream, feed_format),
+                chunk_size=options['chunk_size'],
+                on_conflict=options['on_conflict'],
+                on_chunk=on_chunk
+            )
+        except FeedReadError as exc:
+            raise CommandError(f"{exc} (the chunks reported above were imported)")
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+        
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows in {summary['seconds']}s "
+            f"({summary['rows_per_second']} rows/s): {summary['inserted']} inserted, "
+            f"{summary['updated']} updated, {summary['unchanged']} unchanged, "
+            f"{summary['rejected']} rejected."
+        ))
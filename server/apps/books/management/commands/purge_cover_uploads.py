@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.books.models import CoverUpload
+from apps.books.services import abort_cover_upload
+
+
+class Command(BaseCommand):
+    """
+    Delete chunked cover uploads that were abandoned, with their parts.
+
+    Usage:
+        python manage.py purge_cover_uploads
+        python manage.py purge_cover_uploads --hours 6
+    """
+    help = 'Delete cover uploads that have not received a part for a while'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.BOOK_COVER_UPLOAD_EXPIRY_HOURS,
+            help='Delete uploads idle for longer than this'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        purged = 0
+        for upload in CoverUpload.objects.filter(updated_at__lt=cutoff).iterator():
+            abort_cover_upload(upload)
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} abandoned cover uploads."))
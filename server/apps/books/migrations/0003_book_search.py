@@ -0,0 +1,77 @@
+# Generated by Django 4.2 on 2026-10-19 08:44
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Keep in sync with BOOK_SEARCH_CONFIG in apps/books/filters.py. The 'simple'
+# configuration does no stemming or stop-word removal, which suits names,
+# authors and publishers in any language.
+CREATE_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION books_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.isbn, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.author, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.publisher, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, isbn, author, publisher ON books_book
+    FOR EACH ROW EXECUTE FUNCTION books_book_search_vector_update();
+
+UPDATE books_book SET name = name;
+"""
+
+DROP_SEARCH_TRIGGER = """
+DROP TRIGGER IF EXISTS books_book_search_vector_update ON books_book;
+DROP FUNCTION IF EXISTS books_book_search_vector_update();
+"""
+
+# pg_trgm ships with postgresql-contrib but not with every build, so the
+# substring indexes are only created where the extension can be installed.
+# Without them icontains falls back to a scan but search keeps working.
+CREATE_TRIGRAM_INDEXES = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS books_book_name_trgm_idx ON books_book USING gin (UPPER(name) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS books_book_isbn_trgm_idx ON books_book USING gin (UPPER(isbn) gin_trgm_ops);
+    ELSE
+        RAISE WARNING 'pg_trgm is not available: substring search on books will not use an index';
+    END IF;
+END
+$$;
+"""
+
+DROP_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS books_book_name_trgm_idx;
+DROP INDEX IF EXISTS books_book_isbn_trgm_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfill before the GIN indexes exist so they are built in one pass
+        migrations.RunSQL(CREATE_SEARCH_TRIGGER, DROP_SEARCH_TRIGGER),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='books_book_search_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGRAM_INDEXES, DROP_TRIGRAM_INDEXES),
+    ]
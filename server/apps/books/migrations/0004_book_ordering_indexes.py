@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-19 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['name', 'id'], name='books_book_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'id'], name='books_book_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publisher', 'id'], name='books_book_publisher_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publication_date', 'id'], name='books_book_pubdate_id_idx'),
+        ),
+    ]
@@ -0,0 +1,215 @@
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+DROP_SEARCH_TRIGGER = """
+DROP TRIGGER IF EXISTS books_book_search_vector_update ON books_book;
+"""
+
+# Trigger from migration 0003, restored when migrating backwards
+CREATE_OLD_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION books_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.isbn, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.author, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.publisher, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, isbn, author, publisher ON books_book
+    FOR EACH ROW EXECUTE FUNCTION books_book_search_vector_update();
+"""
+
+# One row per distinct name, ignoring case, so 'Penguin' and 'PENGUIN' become
+# the same publisher. The most common spelling is kept.
+FILL_REFERENCES = """
+SET CONSTRAINTS ALL IMMEDIATE;
+
+INSERT INTO books_author (name)
+SELECT DISTINCT ON (UPPER(author)) author
+FROM (SELECT author, COUNT(*) AS uses FROM books_book GROUP BY author) spellings
+ORDER BY UPPER(author), uses DESC, author;
+
+INSERT INTO books_publisher (name)
+SELECT DISTINCT ON (UPPER(publisher)) publisher
+FROM (SELECT publisher, COUNT(*) AS uses FROM books_book GROUP BY publisher) spellings
+ORDER BY UPPER(publisher), uses DESC, publisher;
+
+UPDATE books_book b SET author_ref_id = a.id
+FROM books_author a WHERE UPPER(a.name) = UPPER(b.author);
+
+UPDATE books_book b SET publisher_ref_id = p.id
+FROM books_publisher p WHERE UPPER(p.name) = UPPER(b.publisher);
+"""
+
+# The foreign keys are deferrable; check them right away so no trigger events
+# are pending when the following operations alter the table.
+RESTORE_NAMES = """
+SET CONSTRAINTS ALL IMMEDIATE;
+UPDATE books_book b SET author = a.name FROM books_author a WHERE a.id = b.author_ref_id;
+UPDATE books_book b SET publisher = p.name FROM books_publisher p WHERE p.id = b.publisher_ref_id;
+"""
+
+# Author and publisher names now live in their own tables: the book trigger
+# looks them up, and renaming an author or publisher refreshes its books.
+# Keep in sync with BOOK_SEARCH_CONFIG in apps/books/filters.py.
+CREATE_SEARCH_TRIGGERS = """
+CREATE OR REPLACE FUNCTION books_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.isbn, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((SELECT name FROM books_author WHERE id = NEW.author_id), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((SELECT name FROM books_publisher WHERE id = NEW.publisher_id), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, isbn, author_id, publisher_id ON books_book
+    FOR EACH ROW EXECUTE FUNCTION books_book_search_vector_update();
+
+CREATE OR REPLACE FUNCTION books_author_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET author_id = author_id WHERE author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_author_name_update
+    AFTER UPDATE OF name ON books_author
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION books_author_name_update();
+
+CREATE OR REPLACE FUNCTION books_publisher_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET publisher_id = publisher_id WHERE publisher_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_publisher_name_update
+    AFTER UPDATE OF name ON books_publisher
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION books_publisher_name_update();
+
+UPDATE books_book SET name = name;
+"""
+
+DROP_SEARCH_TRIGGERS = """
+DROP TRIGGER IF EXISTS books_publisher_name_update ON books_publisher;
+DROP FUNCTION IF EXISTS books_publisher_name_update();
+DROP TRIGGER IF EXISTS books_author_name_update ON books_author;
+DROP FUNCTION IF EXISTS books_author_name_update();
+DROP TRIGGER IF EXISTS books_book_search_vector_update ON books_book;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['name', 'id'], name='books_author_name_idx')],
+                'constraints': [models.UniqueConstraint(django.db.models.functions.text.Upper('name'), name='books_author_name_ci_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Publisher',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['name', 'id'], name='books_publisher_name_idx')],
+                'constraints': [models.UniqueConstraint(django.db.models.functions.text.Upper('name'), name='books_publisher_name_ci_uniq')],
+            },
+        ),
+        migrations.RunSQL(DROP_SEARCH_TRIGGER, CREATE_OLD_SEARCH_TRIGGER),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='books_book_author_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='books_book_publisher_id_idx',
+        ),
+        # Nullable first, so that migrating backwards can re-add the columns
+        # and fill them with RESTORE_NAMES before they become NOT NULL again
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='publisher',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='books.author'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='publisher_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='books.publisher'),
+        ),
+        migrations.RunSQL(FILL_REFERENCES, RESTORE_NAMES),
+        migrations.RemoveField(
+            model_name='book',
+            name='author',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='publisher',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='author_ref',
+            new_name='author',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='publisher_ref',
+            new_name='publisher',
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='books.author'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='publisher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='books.publisher'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'publication_date', 'id'], name='books_book_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publisher', 'publication_date', 'id'], name='books_book_publisher_date_idx'),
+        ),
+        migrations.RunSQL(CREATE_SEARCH_TRIGGERS, DROP_SEARCH_TRIGGERS),
+    ]
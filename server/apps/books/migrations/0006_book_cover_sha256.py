@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 09:18
+
+import apps.books.covers
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_author_publisher'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='cover_photo',
+            field=models.FileField(blank=True, null=True, upload_to=apps.books.covers.cover_upload_to),
+        ),
+    ]
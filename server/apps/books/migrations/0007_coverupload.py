@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-19 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0006_book_cover_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('parts', models.JSONField(default=list, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cover_uploads', to='books.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cover_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+# Renaming an author or publisher changes the books that show the name: bump
+# their updated_at so the ETag / Last-Modified validators (which come from it)
+# change too. Setting author_id / publisher_id still fires the search vector
+# trigger of migration 0005. clock_timestamp(), like auto_now, is the time of
+# the rename itself rather than the start of its transaction.
+TOUCH_BOOKS_ON_RENAME = """
+CREATE OR REPLACE FUNCTION books_author_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET author_id = author_id, updated_at = clock_timestamp() WHERE author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION books_publisher_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET publisher_id = publisher_id, updated_at = clock_timestamp() WHERE publisher_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Functions from migration 0005, restored when migrating backwards
+REINDEX_BOOKS_ON_RENAME = """
+CREATE OR REPLACE FUNCTION books_author_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET author_id = author_id WHERE author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION books_publisher_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book SET publisher_id = publisher_id WHERE publisher_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_coverupload'),
+    ]
+
+    operations = [
+        migrations.RunSQL(TOUCH_BOOKS_ON_RENAME, REINDEX_BOOKS_ON_RENAME),
+    ]
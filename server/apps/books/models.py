@@ -1,12 +1,121 @@
-from django.db import models
+import uuid
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Upper
+from .covers import cover_upload_to
+
+
+class NamedEntityManager(models.Manager):
+    def get_for_name(self, name):
+        """
+        Return the entry with this name (case-insensitive), creating it if needed.
+
+        Args:
+            name: Display name, e.g. an author or publisher name
+
+        Returns:
+            The existing or newly created instance
+        """
+        name = name.strip()
+        entity = self.filter(name__iexact=name).first()
+        if entity is not None:
+            return entity
+        try:
+            with transaction.atomic():
+                return self.create(name=name)
+        except IntegrityError:
+            # Created concurrently under a different case or by another request
+            return self.get(name__iexact=name)
+
+
+class NamedEntity(models.Model):
+    """A name stored once and referenced by integer key from the books table."""
+    name = models.CharField(max_length=255)
+
+    objects = NamedEntityManager()
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+        constraints = [
+            # Also serves name__iexact lookups, which compare UPPER(name)
+            models.UniqueConstraint(Upper('name'), name='%(app_label)s_%(class)s_name_ci_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['name', 'id'], name='%(app_label)s_%(class)s_name_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Author(NamedEntity):
+    class Meta(NamedEntity.Meta):
+        pass
+
+
+class Publisher(NamedEntity):
+    class Meta(NamedEntity.Meta):
+        pass
+
 
 # Create your models here.
 class Book(models.Model):
     name = models.CharField(max_length=255)
-    author = models.CharField(max_length=255)
-    publisher = models.CharField(max_length=255)
+    # Indexed by the composite (author, publication_date, id) and
+    # (publisher, publication_date, id) indexes below
+    author = models.ForeignKey(Author, on_delete=models.PROTECT, related_name='books', db_index=False)
+    publisher = models.ForeignKey(Publisher, on_delete=models.PROTECT, related_name='books', db_index=False)
     publication_date = models.DateField()
     isbn = models.CharField(max_length=13,unique=True)
-    cover_photo = models.FileField(upload_to='books/covers/',null=True,blank=True)
+    # Stored under the SHA-256 of its content, which also names the
+    # thumbnails (see covers.py)
+    cover_photo = models.FileField(upload_to=cover_upload_to,null=True,blank=True)
+    cover_sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Maintained by the books_book_search_vector_update trigger (see migrations 0003 and 0005)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='books_book_search_idx'),
+            # The pg_trgm indexes on UPPER(name) and UPPER(isbn) used for
+            # substring matches are created in migration 0003 when the
+            # extension is available.
+            # Keyset pagination: one (field, id) index per ordering field.
+            # isbn is unique and needs no tiebreaker; author and publisher
+            # are ordered through the (name, id) indexes of their tables.
+            models.Index(fields=['name', 'id'], name='books_book_name_id_idx'),
+            models.Index(fields=['publication_date', 'id'], name='books_book_pubdate_id_idx'),
+            # Filter by author / publisher, optionally ordered by date
+            models.Index(fields=['author', 'publication_date', 'id'], name='books_book_author_date_idx'),
+            models.Index(fields=['publisher', 'publication_date', 'id'], name='books_book_publisher_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class CoverUpload(models.Model):
+    """
+    A resumable, chunked cover photo upload in progress.
+
+    Each part is stored as its own object under books/uploads/<id>/ as soon
+    as it arrives; offset is the number of bytes committed so far, and parts
+    lists them as [offset, storage name, length] in order. Completing the
+    upload concatenates the parts into the book's cover.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='cover_uploads')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cover_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    parts = models.JSONField(default=list, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.filename} ({self.offset}/{self.size})"
@@ -1,8 +1,94 @@
-from .models import Book
+from django.conf import settings
+from django.urls import reverse
+from .covers import COVER_FORMATS
+from .models import Author, Book, CoverUpload, Publisher
+from project.streaming import FEED_FORMATS
 
 from rest_framework import serializers
 
 class BookSerializer(serializers.ModelSerializer):
+    # Authors and publishers are stored in their own tables but read and
+    # written by name; unknown names are created on save
+    author = serializers.CharField(max_length=255)
+    publisher = serializers.CharField(max_length=255)
+    # Thumbnail URLs per size and format, e.g. covers['thumbnail']['webp']
+    covers = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Book
+        exclude = ['search_vector', 'cover_sha256']
+
+    def get_covers(self, book):
+        if not book.cover_sha256:
+            return None
+        request = self.context.get('request')
+        covers = {}
+        for size in settings.BOOK_COVER_SIZES:
+            covers[size] = {}
+            for format_name, (_, extension, _, _) in COVER_FORMATS.items():
+                url = reverse('book-cover', kwargs={'sha': book.cover_sha256, 'size': size, 'extension': extension})
+                covers[size][format_name] = request.build_absolute_uri(url) if request else url
+        return covers
+
+    def create(self, validated_data):
+        return super().create(self._resolve_names(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._resolve_names(validated_data))
+
+    def _resolve_names(self, validated_data):
+        if 'author' in validated_data:
+            validated_data['author'] = Author.objects.get_for_name(validated_data['author'])
+        if 'publisher' in validated_data:
+            validated_data['publisher'] = Publisher.objects.get_for_name(validated_data['publisher'])
+        return validated_data
+
+
+class BookImportSerializer(BookSerializer):
+    """
+    Validates one row of a bulk book import.
+
+    Same fields and rules as BookSerializer, but without the per-row
+    uniqueness query on isbn: imports dedupe on isbn in the database
+    (INSERT ... ON CONFLICT), so whole chunks validate without queries.
+    Author and publisher names are resolved per chunk, not per row.
+    """
+
     class Meta:
         model = Book
-        fields = '__all__'
\ No newline at end of file
+        fields = ['name', 'author', 'publisher', 'publication_date', 'isbn']
+        extra_kwargs = {'isbn': {'validators': []}}
+
+
+class BookImportUploadSerializer(serializers.Serializer):
+    """Serializer for uploading a book import file."""
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(
+        choices=FEED_FORMATS,
+        required=False,
+        help_text="'csv' or 'ndjson' (detected from the file name when omitted)"
+    )
+    on_conflict = serializers.ChoiceField(
+        choices=('update', 'skip'),
+        default='update',
+        help_text="What to do with books whose isbn already exists: 'update' or 'skip'"
+    )
+    chunk_size = serializers.IntegerField(
+        min_value=100,
+        max_value=50000,
+        default=settings.BOOK_IMPORT_CHUNK_SIZE
+    )
+
+
+class CoverUploadSerializer(serializers.ModelSerializer):
+    """Starts a chunked cover upload and reports its progress."""
+    size = serializers.IntegerField(min_value=1, max_value=settings.BOOK_COVER_UPLOAD_MAX_SIZE)
+
+    class Meta:
+        model = CoverUpload
+        fields = ['id', 'book', 'filename', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['offset']
+
+    def validate_filename(self, value):
+        # Only the extension is kept (see covers.cover_upload_to)
+        return value.replace('\\', '/').rsplit('/', 1)[-1]
@@ -0,0 +1,460 @@
+import csv
+import hashlib
+import io
+import time
+import uuid
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from project.streaming import chunked
+from .cache import bump_generation
+from .covers import cover_upload_to
+from .models import Book, CoverUpload
+from .serializers import BookImportSerializer
+from .suggest import suggestions
+
+IMPORT_CONFLICT_MODES = ('update', 'skip')
+
+# Columns of a catalog export; the files can be fed back to import_books
+EXPORT_FIELDS = (
+    'id', 'name', 'author', 'publisher', 'publication_date', 'isbn', 'cover_photo', 'updated_at',
+)
+
+IMPORT_STAGING_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS books_import_staging (
+        name varchar(255) NOT NULL,
+        author varchar(255) NOT NULL,
+        publisher varchar(255) NOT NULL,
+        publication_date date NOT NULL,
+        isbn varchar(13) NOT NULL
+    ) ON COMMIT DROP;
+    TRUNCATE books_import_staging;
+"""
+
+# New names only; existing ones match case-insensitively, like get_for_name()
+IMPORT_NAMES_SQL = """
+    INSERT INTO {table} (name)
+    SELECT DISTINCT ON (UPPER({column})) {column}
+    FROM books_import_staging
+    ORDER BY UPPER({column}), {column}
+    ON CONFLICT ((UPPER(name))) DO NOTHING
+"""
+
+IMPORT_BOOKS_SQL = """
+    WITH written AS (
+        INSERT INTO books_book (name, author_id, publisher_id, publication_date, isbn, updated_at)
+        SELECT s.name, a.id, p.id, s.publication_date, s.isbn, now()
+        FROM books_import_staging s
+        JOIN books_author a ON UPPER(a.name) = UPPER(s.author)
+        JOIN books_publisher p ON UPPER(p.name) = UPPER(s.publisher)
+        ON CONFLICT (isbn) {action}
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+    FROM written
+"""
+
+IMPORT_CONFLICT_ACTIONS = {
+    'skip': 'DO NOTHING',
+    # Rows that did not change are left alone, so updated_at and the ETags
+    # of unchanged books stay the same on re-import
+    'update': """
+        DO UPDATE SET
+            name = EXCLUDED.name,
+            author_id = EXCLUDED.author_id,
+            publisher_id = EXCLUDED.publisher_id,
+            publication_date = EXCLUDED.publication_date,
+            updated_at = EXCLUDED.updated_at
+        WHERE (books_book.name, books_book.author_id, books_book.publisher_id, books_book.publication_date)
+            IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.author_id, EXCLUDED.publisher_id, EXCLUDED.publication_date)
+    """,
+}
+
+
+def get_book_facets(queryset, limit=20):
+    """
+    Count the books of a filtered queryset per author, publisher and
+    publication year with a single GROUPING SETS query.
+
+    Args:
+        queryset: Filtered Book queryset (ordering and annotations are ignored)
+        limit: Maximum number of values returned per facet, most frequent first
+
+    Returns:
+        dict: {'count': total, 'authors': [{'id', 'name', 'count'}],
+        'publishers': [{'id', 'name', 'count'}], 'years': [{'year', 'count'}]}
+    """
+    facets = {'count': 0, 'authors': [], 'publishers': [], 'years': []}
+    if queryset.query.is_empty():
+        return facets
+
+    rows = queryset.order_by().annotate(
+        facet_author=F('author__name'),
+        facet_publisher=F('publisher__name'),
+        facet_year=ExtractYear('publication_date'),
+    ).values('author_id', 'facet_author', 'publisher_id', 'facet_publisher', 'facet_year')
+    inner_sql, params = rows.query.sql_with_params()
+
+    # GROUPING(...) tells the sets apart: every column that is not part of a
+    # row's set is flagged, so the author set is 0b011, publishers 0b101,
+    # years 0b110 and the grand total 0b111.
+    sql = f"""
+        SELECT facet, author_id, facet_author, publisher_id, facet_publisher, facet_year, total
+        FROM (
+            SELECT
+                GROUPING(author_id, publisher_id, facet_year) AS facet,
+                author_id, facet_author, publisher_id, facet_publisher, facet_year,
+                COUNT(*) AS total,
+                ROW_NUMBER() OVER (
+                    PARTITION BY GROUPING(author_id, publisher_id, facet_year)
+                    ORDER BY COUNT(*) DESC, MIN(facet_author), MIN(facet_publisher), facet_year DESC
+                ) AS position
+            FROM ({inner_sql}) AS filtered
+            GROUP BY GROUPING SETS (
+                (author_id, facet_author),
+                (publisher_id, facet_publisher),
+                (facet_year),
+                ()
+            )
+        ) AS grouped
+        WHERE position <= %s
+        ORDER BY facet, position
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        for facet, author_id, author, publisher_id, publisher, year, total in cursor.fetchall():
+            if facet == 0b011:
+                facets['authors'].append({'id': author_id, 'name': author, 'count': total})
+            elif facet == 0b101:
+                facets['publishers'].append({'id': publisher_id, 'name': publisher, 'count': total})
+            elif facet == 0b110:
+                facets['years'].append({'year': int(year), 'count': total})
+            else:
+                facets['count'] = total
+    return facets
+
+
+def iter_book_export(queryset, chunk_size=2000):
+    """
+    Yield the books of a filtered queryset as flat export records.
+
+    Rows are read through a server-side cursor chunk_size at a time, and only
+    the exported columns are fetched, so memory use does not grow with the
+    size of the catalog.
+
+    Args:
+        queryset: Filtered and ordered Book queryset
+        chunk_size: Rows fetched from the cursor per round trip
+
+    Yields:
+        dict: One record per book with the EXPORT_FIELDS keys; dates are ISO
+        8601 strings and author / publisher are names
+    """
+    rows = queryset.values_list(
+        'id', 'name', 'author__name', 'publisher__name',
+        'publication_date', 'isbn', 'cover_photo', 'updated_at'
+    )
+    for pk, name, author, publisher, publication_date, isbn, cover_photo, updated_at in rows.iterator(chunk_size=chunk_size):
+        yield {
+            'id': pk,
+            'name': name,
+            'author': author,
+            'publisher': publisher,
+            'publication_date': publication_date.isoformat(),
+            'isbn': isbn,
+            'cover_photo': cover_photo or None,
+            'updated_at': updated_at.isoformat(),
+        }
+
+
+def import_books(records, chunk_size=5000, on_conflict='update', on_chunk=None, max_errors=100):
+    """
+    Create or update books from a CSV / NDJSON feed, one chunk at a time.
+
+    Each chunk is validated with BookImportSerializer (no queries), deduped on
+    isbn (the last row wins), copied into a temporary staging table with COPY
+    and written with one INSERT ... ON CONFLICT (isbn). Unknown authors and
+    publishers are created on the way. Only one chunk is held in memory.
+
+    Args:
+        records: Iterable of (line_number, record, error) tuples, as produced
+            by project.streaming.iter_records
+        chunk_size: Number of rows validated and written per transaction
+        on_conflict: 'update' to overwrite books whose isbn exists, 'skip' to
+            keep them as they are
+        on_chunk: Optional callable receiving each chunk report
+        max_errors: Maximum number of rejected rows described in the summary
+
+    Returns:
+        dict: Totals ('rows', 'inserted', 'updated', 'unchanged', 'rejected',
+        'chunks', 'seconds', 'rows_per_second') and the first rejected rows
+        under 'errors'. 'unchanged' counts valid rows that did not change a
+        book: repeated isbns, skipped conflicts and identical rows.
+    """
+    if on_conflict not in IMPORT_CONFLICT_MODES:
+        raise ValueError(f"on_conflict must be one of: {', '.join(IMPORT_CONFLICT_MODES)}")
+
+    summary = {
+        'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0,
+        'chunks': 0, 'errors': [],
+    }
+    serializer = BookImportSerializer()
+    started = time.monotonic()
+
+    try:
+        for number, chunk in enumerate(chunked(records, chunk_size), start=1):
+            chunk_started = time.monotonic()
+            valid, rejected = _validate_book_chunk(serializer, chunk)
+
+            inserted = updated = 0
+            if valid:
+                with transaction.atomic():
+                    inserted, updated = _write_book_chunk(valid.values(), on_conflict)
+                    if inserted or updated:
+                        transaction.on_commit(bump_generation)
+
+            seconds = time.monotonic() - chunk_started
+            unchanged = len(chunk) - len(rejected) - inserted - updated
+            report = {
+                'chunk': number,
+                'rows': len(chunk),
+                'inserted': inserted,
+                'updated': updated,
+                'unchanged': unchanged,
+                'rejected': len(rejected),
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(len(chunk) / seconds) if seconds else None,
+            }
+
+            summary['chunks'] += 1
+            summary['rows'] += len(chunk)
+            summary['inserted'] += inserted
+            summary['updated'] += updated
+            summary['unchanged'] += unchanged
+            summary['rejected'] += len(rejected)
+            for line_number, errors in rejected:
+                if len(summary['errors']) >= max_errors:
+                    break
+                summary['errors'].append({'line': line_number, 'errors': errors})
+
+            if on_chunk:
+                on_chunk(report)
+    finally:
+        # Bulk writes send no post_save signals; reload this process's typeahead
+        # index (other processes follow the catalog generation), also when the
+        # file turns out to be unreadable after some chunks were written
+        if (summary['inserted'] or summary['updated']) and suggestions.is_built:
+            suggestions.build_in_background(force=True)
+
+    seconds = time.monotonic() - started
+    summary['seconds'] = round(seconds, 3)
+    summary['rows_per_second'] = round(summary['rows'] / seconds) if seconds else None
+    return summary
+
+
+def _validate_book_chunk(serializer, chunk):
+    """
+    Validate the rows of one import chunk.
+
+    Returns:
+        tuple: ({isbn: validated data}, [(line_number, errors)])
+    """
+    valid = {}
+    rejected = []
+
+    for line_number, record, error in chunk:
+        if error:
+            rejected.append((line_number, {'non_field_errors': [error]}))
+            continue
+        try:
+            data = serializer.run_validation(record)
+        except ValidationError as exc:
+            rejected.append((line_number, exc.detail))
+            continue
+        valid[data['isbn']] = data
+
+    return valid, rejected
+
+
+def _write_book_chunk(rows, on_conflict):
+    """
+    COPY validated rows into the staging table and upsert them into books_book.
+
+    Returns:
+        tuple: (inserted, updated) row counts
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for data in rows:
+        writer.writerow([
+            data['name'],
+            data['author'],
+            data['publisher'],
+            data['publication_date'].isoformat(),
+            data['isbn'],
+        ])
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.execute(IMPORT_STAGING_SQL)
+        cursor.copy_expert(
+            "COPY books_import_staging (name, author, publisher, publication_date, isbn) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute(IMPORT_NAMES_SQL.format(table='books_author', column='author'))
+        cursor.execute(IMPORT_NAMES_SQL.format(table='books_publisher', column='publisher'))
+        cursor.execute(IMPORT_BOOKS_SQL.format(action=IMPORT_CONFLICT_ACTIONS[on_conflict]))
+        return cursor.fetchone()
+
+
+class UploadOffsetConflict(Exception):
+    """A cover upload part does not start at the upload's committed offset."""
+
+    def __init__(self, offset):
+        super().__init__(f"The upload continues at offset {offset}.")
+        self.offset = offset
+
+
+def append_cover_part(upload, offset, stream, length):
+    """
+    Store one part of a chunked cover upload and commit its offset.
+
+    The part is streamed from the request straight into its own storage
+    object, so memory use does not depend on the part size. The offset only
+    moves once the whole part is stored; an interrupted part is discarded
+    and the client resumes from upload.offset.
+
+    Args:
+        upload: The CoverUpload
+        offset: Byte offset the part starts at, must equal upload.offset
+        stream: Readable binary stream (the request body)
+        length: Number of bytes in the part
+
+    Raises:
+        UploadOffsetConflict: The offset is not the committed one, e.g.
+            because the same part was sent twice
+        ValidationError: Fewer than length bytes arrived
+    """
+    if offset != upload.offset:
+        raise UploadOffsetConflict(upload.offset)
+
+    storage = Book.cover_photo.field.storage
+    reader = _LimitedReader(stream, length)
+    name = f"books/uploads/{upload.pk}/{offset:012d}-{uuid.uuid4().hex[:8]}.part"
+    name = storage.save(name, File(reader, name=name))
+    if reader.received != length:
+        storage.delete(name)
+        raise ValidationError({'offset': [
+            f"Expected {length} bytes but received {reader.received}; resend the part from offset {offset}."
+        ]})
+
+    parts = upload.parts + [[offset, name, length]]
+    # Only commit if no other request moved the offset in the meantime
+    updated = CoverUpload.objects.filter(pk=upload.pk, offset=offset).update(
+        offset=offset + length, parts=parts, updated_at=timezone.now()
+    )
+    if not updated:
+        storage.delete(name)
+        upload.refresh_from_db()
+        raise UploadOffsetConflict(upload.offset)
+    upload.offset, upload.parts = offset + length, parts
+
+
+def complete_cover_upload(upload, sha256=None):
+    """
+    Assemble a fully received upload into the book's cover photo.
+
+    The parts are read twice as a stream, first to hash them and then (unless
+    a cover with the same content is already stored) to write the
+    content-addressed original. The upload and its parts are then deleted.
+
+    Args:
+        upload: The CoverUpload, with offset == size
+        sha256: Optional hex SHA-256 the client computed over the whole file
+
+    Returns:
+        Book: The book with its new cover
+
+    Raises:
+        ValidationError: Parts are missing, or the checksum does not match
+            (the upload is discarded then)
+    """
+    if upload.offset != upload.size:
+        raise ValidationError({'offset': [f"Received {upload.offset} of {upload.size} bytes."]})
+
+    storage = Book.cover_photo.field.storage
+    names = [name for _, name, _ in upload.parts]
+    digest = hashlib.sha256()
+    for chunk in File(_PartsReader(storage, names)).chunks():
+        digest.update(chunk)
+    sha = digest.hexdigest()
+    if sha256 and sha256.lower() != sha:
+        abort_cover_upload(upload)
+        raise ValidationError({'sha256': ["Checksum mismatch, the upload was discarded. Please start over."]})
+
+    book = upload.book
+    book.cover_sha256 = sha
+    name = cover_upload_to(book, upload.filename)
+    if not storage.exists(name):
+        name = storage.save(name, File(_PartsReader(storage, names), name=name))
+    book.cover_photo = name
+    book.save(update_fields=['cover_photo', 'cover_sha256', 'updated_at'])
+
+    abort_cover_upload(upload)
+    return book
+
+
+def abort_cover_upload(upload):
+    """Delete a cover upload and its stored parts."""
+    storage = Book.cover_photo.field.storage
+    for _, name, _ in upload.parts:
+        storage.delete(name)
+    upload.delete()
+
+
+class _LimitedReader:
+    """Read at most length bytes from a stream and count what arrived."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+        self.received = 0
+
+    def read(self, size=-1):
+        remaining = self.length - self.received
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self.stream.read(size) if size else b''
+        self.received += len(data)
+        return data
+
+
+class _PartsReader:
+    """Read stored upload parts one after another as a single stream."""
+
+    def __init__(self, storage, names):
+        self.storage = storage
+        self.names = list(names)
+        self.current = None
+
+    def read(self, size=-1):
+        chunks = []
+        while size is None or size < 0 or size > 0:
+            if self.current is None:
+                if not self.names:
+                    break
+                self.current = self.storage.open(self.names.pop(0), 'rb')
+            data = self.current.read(size)
+            if not data:
+                self.current.close()
+                self.current = None
+                continue
+            chunks.append(data)
+            if size is not None and size > 0:
+                size -= len(data)
+        return b''.join(chunks)
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .cache import bump_generation
+from .covers import prepare_cover, schedule_derivatives
+from .models import Author, Book, Publisher
+from .suggest import suggestions
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+def invalidate_book_caches(sender, **kwargs):
+    """
+    Drop cached facets and list pages whenever the catalog changes.
+
+    The bump waits for the commit, so a concurrent request can't cache the old
+    data again under the new generation. The typeahead index of this process
+    is told which generation its own write produced.
+    """
+    transaction.on_commit(lambda: suggestions.record_own_generation(bump_generation()))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def update_suggestions(sender, instance, **kwargs):
+    """Add or rename the title / author in this process's typeahead index."""
+    index_name = 'books' if sender is Book else 'authors'
+    pk, name = instance.pk, instance.name
+    transaction.on_commit(lambda: suggestions.update(index_name, pk, name))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def remove_suggestions(sender, instance, **kwargs):
+    """Drop the title / author from this process's typeahead index."""
+    index_name = 'books' if sender is Book else 'authors'
+    pk = instance.pk
+    transaction.on_commit(lambda: suggestions.update(index_name, pk, None))
+
+
+@receiver(pre_save, sender=Book)
+def hash_cover(sender, instance, **kwargs):
+    """Name a newly uploaded cover after its content and skip storing duplicates."""
+    prepare_cover(instance)
+
+
+@receiver(post_save, sender=Book)
+def render_cover_derivatives(sender, instance, **kwargs):
+    """Resize the cover in the background once the book is committed."""
+    if instance.cover_sha256:
+        name, sha = instance.cover_photo.name, instance.cover_sha256
+        transaction.on_commit(lambda: schedule_derivatives(name, sha))
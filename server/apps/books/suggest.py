@@ -0,0 +1,269 @@
+"""
+In-process prefix index for book title and author typeahead.
+
+Each worker process keeps the normalised titles and author names in sorted
+arrays and answers a prefix query with a binary search, so suggestions never
+touch the database. The index is built once per process, kept current by the
+Book / Author signals of the same process, and rebuilt in the background when
+another process has changed the catalog (detected through the catalog
+generation in the shared cache). With a process-local cache other processes'
+generations are invisible, so the index is also rebuilt once it is older than
+BOOK_SUGGEST_MAX_AGE seconds.
+"""
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connection
+from .cache import get_generation
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse whitespace, so 'Émile  Zola' matches 'emile z'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted array of (normalised key, id) pairs searched with bisect.
+
+    Lookups are O(log n + k). Inserts and deletes shift the arrays and are
+    O(n), which is fine for the rate at which books change.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._ids = []
+        self._names = []
+        self._key_by_id = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, rows):
+        """
+        Replace the contents with (id, name) rows in any order.
+
+        Args:
+            rows: Iterable of (id, display name) tuples
+        """
+        entries = sorted((normalize(name), pk, name) for pk, name in rows)
+        self._keys = [key for key, _, _ in entries]
+        self._ids = [pk for _, pk, _ in entries]
+        self._names = [name for _, _, name in entries]
+        self._key_by_id = dict(zip(self._ids, self._keys))
+
+    def add(self, pk, name):
+        """Insert or replace the entry for pk."""
+        self.remove(pk)
+        key = normalize(name)
+        position = bisect_left(self._keys, key)
+        # Keep entries with equal keys ordered by id
+        while position < len(self._keys) and self._keys[position] == key and self._ids[position] < pk:
+            position += 1
+        self._keys.insert(position, key)
+        self._ids.insert(position, pk)
+        self._names.insert(position, name)
+        self._key_by_id[pk] = key
+
+    def remove(self, pk):
+        """Remove the entry for pk, if any."""
+        key = self._key_by_id.pop(pk, None)
+        if key is None:
+            return
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._ids[position] == pk:
+                del self._keys[position]
+                del self._ids[position]
+                del self._names[position]
+                return
+            position += 1
+
+    def search(self, prefix, limit):
+        """
+        Return up to limit {'id', 'name'} entries whose key starts with prefix.
+
+        Entries with the same normalised name are returned once (lowest id).
+        """
+        results = []
+        previous = None
+        position = bisect_left(self._keys, prefix)
+        keys = self._keys
+        while position < len(keys) and len(results) < limit:
+            key = keys[position]
+            if not key.startswith(prefix):
+                break
+            if key != previous:
+                results.append({'id': self._ids[position], 'name': self._names[position]})
+                previous = key
+            position += 1
+        return results
+
+
+class BookSuggestions:
+    """Title and author prefix indexes of one process, with their build state."""
+
+    def __init__(self):
+        self.books = PrefixIndex()
+        self.authors = PrefixIndex()
+        self.generation = None
+        self.built_at = None
+        self._checked_at = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._pending = None
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    def suggest(self, query, limit=10):
+        """
+        Return title and author completions for a typed prefix.
+
+        Builds the index on first use and schedules a background rebuild when
+        another process changed the catalog since the last build.
+
+        Args:
+            query: Text typed so far
+            limit: Maximum completions per kind
+
+        Returns:
+            dict: {'books': [{'id', 'name'}], 'authors': [{'id', 'name'}]}
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return {'books': [], 'authors': []}
+
+        if not self.is_built:
+            self.build()
+        else:
+            self._refresh_if_stale()
+
+        with self._lock:
+            return {
+                'books': self.books.search(prefix, limit),
+                'authors': self.authors.search(prefix, limit),
+            }
+
+    def build(self, force=False):
+        """
+        Load every title and author name from the database.
+
+        Concurrent callers wait for a build in progress instead of starting
+        another one.
+
+        Args:
+            force: Rebuild even if the index is already built
+        """
+        from .models import Author, Book
+
+        with self._build_lock:
+            if self.is_built and not force:
+                return
+
+            with self._lock:
+                self._pending = []
+            try:
+                started = time.perf_counter()
+                generation = get_generation()
+                books = PrefixIndex()
+                books.load(Book.objects.values_list('id', 'name').iterator(chunk_size=10000))
+                authors = PrefixIndex()
+                authors.load(Author.objects.values_list('id', 'name').iterator(chunk_size=10000))
+
+                with self._lock:
+                    # Replay changes made by this process while the rows were read
+                    for index_name, pk, name in self._pending:
+                        index = books if index_name == 'books' else authors
+                        if name is None:
+                            index.remove(pk)
+                        else:
+                            index.add(pk, name)
+                    self.books, self.authors = books, authors
+                    self.generation = generation
+                    self.built_at = self._checked_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._pending = None
+
+            logger.info(
+                "Built book suggestion index: %d titles, %d authors in %.2fs",
+                len(books), len(authors), time.perf_counter() - started
+            )
+
+    def build_in_background(self, force=False):
+        """Build or rebuild the index in a daemon thread."""
+        def run():
+            try:
+                self.build(force=force)
+            except Exception:
+                logger.exception("Building the book suggestion index failed")
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name='book-suggest-build', daemon=True).start()
+
+    def update(self, index_name, pk, name):
+        """
+        Apply one change made by this process (name None means deleted).
+
+        Args:
+            index_name: 'books' or 'authors'
+            pk: Primary key of the changed row
+            name: New display name, or None when the row was deleted
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((index_name, pk, name))
+            if not self.is_built:
+                return
+            index = self.books if index_name == 'books' else self.authors
+            if name is None:
+                index.remove(pk)
+            else:
+                index.add(pk, name)
+
+    def record_own_generation(self, generation):
+        """
+        Take note of the generation returned by this process's own bump.
+
+        The counter is incremented atomically, so when it is exactly one past
+        the generation the index reflects, no other process wrote in between
+        and the index (kept current by update()) is still up to date. Otherwise
+        the generation is left alone and the next check rebuilds.
+
+        Args:
+            generation: Value returned by bump_generation()
+        """
+        with self._lock:
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if now - self._checked_at < settings.BOOK_SUGGEST_REFRESH_SECONDS:
+            return
+        self._checked_at = now
+        max_age = settings.BOOK_SUGGEST_MAX_AGE
+        if get_generation() != self.generation or (max_age and now - self.built_at > max_age):
+            self.build_in_background(force=True)
+
+
+suggestions = BookSuggestions()
+
+
+def preload(**kwargs):
+    """request_started receiver: build the index when the first request arrives."""
+    from django.core.signals import request_started
+
+    request_started.disconnect(preload, dispatch_uid='books_suggest_preload')
+    if settings.BOOK_SUGGEST_PRELOAD and not suggestions.is_built:
+        suggestions.build_in_background()
@@ -1,3 +1,303 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from apps.store.tests import QueryPlanAssertions
+from apps.users.models import User
+from project.pagination import KeysetPagination
+from .cache import bump_generation
+from .models import Author, Book, Publisher
+from .suggest import BookSuggestions
 
-# Create your tests here.
+# The list requests the frontend makes, by name
+LIST_QUERIES = {
+    'plain': '',
+    'count': '?count=true',
+    'search': '?search=1234',
+    'order by author': '?ordering=author',
+    'order by date': '?ordering=-publication_date',
+    'author name': '?author=author 1',
+    'author id': '?author_id={author}',
+    'publisher id': '?publisher_id={publisher}&ordering=publication_date',
+    'name': '?name=River 7',
+    'isbn': '?isbn=9780000000007',
+}
+
+
+encode_cursor = KeysetPagination().encode_cursor
+
+
+def create_books(count, start=0):
+    """count books named 'River <n>', spread over three authors and one publisher."""
+    authors = [Author.objects.get_for_name(f"Author {n}") for n in range(3)]
+    publisher = Publisher.objects.get_for_name('Press')
+    return Book.objects.bulk_create([
+        Book(name=f"River {n}", author=authors[n % 3], publisher=publisher,
+             publication_date=date(2000, 1, 1) + timedelta(days=n), isbn=f"978{n:010d}")
+        for n in range(start, start + count)
+    ])
+
+
+class BookListQueryCountTests(TestCase):
+    """
+    Every variant of the book list runs the same number of queries on a
+    catalog of a few books as on one of several pages: related rows are
+    joined, not fetched per book.
+    """
+    SMALL_CATALOG = 8
+    LARGE_CATALOG = 60
+    # Books and their author and publisher in one query, plus ?count=true
+    QUERY_BUDGET = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader@example.com', email='reader@example.com')
+        create_books(cls.SMALL_CATALOG)
+        cls.author = Author.objects.get(name='Author 1')
+        cls.publisher = Publisher.objects.get(name='Press')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    @override_settings(BOOK_LIST_CACHE_TIMEOUT=0, BOOK_SUGGEST_PRELOAD=False)
+    def test_list_queries_do_not_grow_with_the_catalog(self):
+        paths = {
+            name: '/api/books/' + query.format(author=self.author.pk, publisher=self.publisher.pk)
+            for name, query in LIST_QUERIES.items()
+        }
+        small = {name: self.list_queries(path)[1] for name, path in paths.items()}
+        create_books(self.LARGE_CATALOG - self.SMALL_CATALOG, start=self.SMALL_CATALOG)
+
+        for name, path in paths.items():
+            with self.subTest(name):
+                _, large = self.list_queries(path)
+                listing = '\n'.join(large)
+                self.assertEqual(len(small[name]), len(large), f"{name}: queries grow with the catalog:\n{listing}")
+                self.assertLessEqual(len(large), self.QUERY_BUDGET, f"{name} ran too many queries:\n{listing}")
+
+    @override_settings(BOOK_LIST_CACHE_TIMEOUT=0, BOOK_SUGGEST_PRELOAD=False)
+    def test_cursor_pages(self):
+        create_books(self.LARGE_CATALOG - self.SMALL_CATALOG, start=self.SMALL_CATALOG)
+        response, _ = self.list_queries('/api/books/?cursor=&ordering=name')
+        self.assertIsNotNone(response.data['next'])
+        response, queries = self.list_queries(response.data['next'])
+        self.assertEqual(len(queries), 1, '\n'.join(queries))
+        self.assertEqual(len(response.data['results']), 20)
+
+
+@override_settings(BOOK_LIST_CACHE_TIMEOUT=0, BOOK_SUGGEST_PRELOAD=False)
+class BookListQueryPlanTests(QueryPlanAssertions, TestCase):
+    """The book list variants use indexes on a production-sized catalog."""
+    BOOKS = 30000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader@example.com', email='reader@example.com')
+        Author.objects.bulk_create([Author(name=f"Author {n}") for n in range(300)])
+        Publisher.objects.bulk_create([Publisher(name=f"Press {n}") for n in range(30)])
+        with connection.cursor() as cursor:
+            # In SQL for speed; the search vector trigger fills search_vector
+            cursor.execute(
+                "INSERT INTO books_book (name, author_id, publisher_id, publication_date, isbn, cover_sha256, "
+                "updated_at) "
+                "SELECT 'River ' || n, author.id, publisher.id, date '1900-01-01' + n %% 40000, "
+                "lpad(n::text, 13, '0'), '', now() FROM generate_series(1, %s) AS n "
+                "JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS position FROM books_author) AS author "
+                "ON author.position = n %% 300 "
+                "JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS position FROM books_publisher) "
+                "AS publisher ON publisher.position = n %% 30",
+                [cls.BOOKS]
+            )
+            for table in ('books_book', 'books_author', 'books_publisher'):
+                cursor.execute(f"ANALYZE {table}")
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'books_book_name_trgm_idx'")
+            cls.has_trigram_indexes = cursor.fetchone() is not None
+        cls.author = Author.objects.get(name='Author 1')
+        cls.publisher = Publisher.objects.get(name='Press 1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_variants_use_indexes(self):
+        for name, query in LIST_QUERIES.items():
+            if name == 'count':
+                # Counting every book reads the whole table by design
+                continue
+            with self.subTest(name):
+                if name == 'search' and not self.has_trigram_indexes:
+                    self.skipTest('pg_trgm is not available: substring search reads the whole table')
+                # Keyset pages: page numbers count the matching books too
+                query = query.format(author=self.author.pk, publisher=self.publisher.pk)
+                path = '/api/books/' + (f"{query}&cursor=" if query else '?cursor=')
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200, response.content[:500])
+                self.assertNoSeqScans(queries.captured_queries)
+
+
+@override_settings(BOOK_LIST_CACHE_TIMEOUT=0, BOOK_SUGGEST_PRELOAD=False)
+class BookConditionalGetTests(TestCase):
+    """ETag / Last-Modified answers of the book list and detail."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader@example.com', email='reader@example.com')
+        cls.book = create_books(1)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_malformed_id_is_not_found(self):
+        response = self.client.get('/api/books/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_renamed_author_or_publisher_changes_the_etag(self):
+        for related in ('author', 'publisher'):
+            with self.subTest(related):
+                paths = [f"/api/books/{self.book.pk}/", f"/api/books/?isbn={self.book.isbn}"]
+                etags = [self.client.get(path)['ETag'] for path in paths]
+
+                entity = getattr(self.book, related)
+                entity.name = f"{entity.name} renamed"
+                entity.save()
+
+                for path, etag in zip(paths, etags):
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200, path)
+
+
+@override_settings(BOOK_LIST_CACHE_TIMEOUT=0, BOOK_SUGGEST_PRELOAD=False)
+class BookCursorTests(TestCase):
+    """Tampered keyset cursors are answered with 404, never a server error."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader@example.com', email='reader@example.com')
+        create_books(3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_values_of_the_wrong_type(self):
+        cursors = {
+            'text id': ('id', ['abc']),
+            'nested list': ('id', [[1]]),
+            'null': ('id', [None]),
+            'out of range id': ('id', [10 ** 30]),
+            'bad date': ('publication_date,id', ['2020-13-45', 1]),
+            'date of the wrong type': ('publication_date,id', [{'d': 1}, 1]),
+        }
+        for name, (ordering, values) in cursors.items():
+            with self.subTest(name):
+                cursor = encode_cursor(ordering.split(','), values)
+                response = self.client.get(f"/api/books/?ordering={ordering}&cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+    def test_next_cursor_still_works(self):
+        response = self.client.get('/api/books/?ordering=publication_date&cursor=&page_size=2')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+@override_settings(BOOK_SUGGEST_PRELOAD=False)
+class BookImportUploadTests(TestCase):
+    """Malformed import uploads are client errors, not server errors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff@example.com', email='staff@example.com', is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_unreadable_files(self):
+        files = {
+            'not gzip': ('books.csv.gz', b'name,isbn\n'),
+            'not utf-8': ('books.csv', 'name,author\nCaf\xe9,Someone\n'.encode('latin-1')),
+        }
+        for name, (filename, content) in files.items():
+            with self.subTest(name):
+                response = self.client.post('/api/books/import/', {'file': SimpleUploadedFile(filename, content)})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('file', response.data)
+
+
+@override_settings(BOOK_SUGGEST_PRELOAD=False, BOOK_SUGGEST_REFRESH_SECONDS=0, BOOK_SUGGEST_MAX_AGE=0)
+class BookSuggestionRefreshTests(TestCase):
+    """The typeahead index rebuilds for other processes' writes, not for its own."""
+
+    def setUp(self):
+        create_books(2)
+        self.suggestions = BookSuggestions()
+        self.suggestions.build()
+        patcher = mock.patch.object(self.suggestions, 'build_in_background')
+        self.rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_own_write_does_not_rebuild(self):
+        self.suggestions.record_own_generation(bump_generation())
+        self.suggestions.suggest('river')
+        self.rebuild.assert_not_called()
+
+    def test_write_of_another_process_rebuilds(self):
+        bump_generation()
+        self.suggestions.suggest('river')
+        self.rebuild.assert_called_once_with(force=True)
+
+    def test_write_of_another_process_before_an_own_write_rebuilds(self):
+        bump_generation()
+        self.suggestions.record_own_generation(bump_generation())
+        self.suggestions.suggest('river')
+        self.rebuild.assert_called_once_with(force=True)
+
+    def test_old_index_rebuilds(self):
+        with override_settings(BOOK_SUGGEST_MAX_AGE=60):
+            self.suggestions.built_at -= 61
+            self.suggestions.suggest('river')
+        self.rebuild.assert_called_once_with(force=True)
+
+    def test_saved_author_is_suggested_without_rebuild(self):
+        with mock.patch('apps.books.signals.suggestions', self.suggestions):
+            with self.captureOnCommitCallbacks(execute=True):
+                Author.objects.create(name='Rivera')
+        self.assertEqual(self.suggestions.suggest('rivera')['authors'][0]['name'], 'Rivera')
+        self.rebuild.assert_not_called()
+
+
+class CoverDerivativeTests(TestCase):
+    """Thumbnails not rendered yet are queued, never rendered in the request."""
+    SHA = 'ab' * 32
+
+    @classmethod
+    def setUpTestData(cls):
+        book = create_books(1)[0]
+        Book.objects.filter(pk=book.pk).update(cover_photo=f"books/covers/ab/{cls.SHA}.jpg", cover_sha256=cls.SHA)
+
+    def test_missing_thumbnail_is_queued_and_redirects_to_the_original(self):
+        with mock.patch('apps.books.views.schedule_derivatives') as schedule:
+            response = self.client.get(f"/api/books/covers/{self.SHA}/thumbnail.webp")
+        schedule.assert_called_once_with(f"books/covers/ab/{self.SHA}.jpg", self.SHA)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(f"books/covers/ab/{self.SHA}.jpg"))
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_unknown_cover_is_not_found(self):
+        with mock.patch('apps.books.views.schedule_derivatives') as schedule:
+            response = self.client.get(f"/api/books/covers/{'cd' * 32}/thumbnail.webp")
+        schedule.assert_not_called()
+        self.assertEqual(response.status_code, 404)
@@ -1,7 +1,16 @@
-from .views import BookViewSet
+from django.urls import re_path
+from .views import BookViewSet, CoverUploadViewSet, cover_derivative
 from rest_framework_nested import routers
 
 router = routers.SimpleRouter()
+# Registered first, so books/cover-uploads/ is not taken for a book id
+router.register('books/cover-uploads', CoverUploadViewSet, 'cover-upload')
 router.register('books', BookViewSet, 'book')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = router.urls + [
+    re_path(
+        r'^books/covers/(?P<sha>[0-9a-f]{64})/(?P<size>[\w-]+)\.(?P<extension>[a-z]+)$',
+        cover_derivative,
+        name='book-cover'
+    ),
+]
@@ -1,40 +1,75 @@
-from django.shortcuts import render
+import logging
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
 
 # Create your views here.
-from .models import Book
-from .serializers import BookSerializer
-from rest_framework import viewsets
+from .models import Book, CoverUpload
+from .serializers import BookImportUploadSerializer, BookSerializer, CoverUploadSerializer
+from .cache import get_or_compute, make_cache_key
+from .covers import CONTENT_TYPES, derivative_name, schedule_derivatives
+from .filters import BookFilter, BookOrderingFilter, BookSearchFilter
+from .services import (
+    EXPORT_FIELDS,
+    UploadOffsetConflict,
+    abort_cover_upload,
+    append_cover_part,
+    complete_cover_upload,
+    get_book_facets,
+    import_books,
+    iter_book_export
+)
+from .suggest import suggestions
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import OrderingFilter, SearchFilter
+from project.conditional import ConditionalGetMixin
+from project.pagination import KeysetPagination
+from project.streaming import (
+    FEED_FORMATS,
+    FeedReadError,
+    detect_format,
+    gzip_chunks,
+    iter_records,
+    open_text,
+    write_records
+)
 
+logger = logging.getLogger(__name__)
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+
+class BookViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    # search_vector is only used inside the database
+    queryset = Book.objects.select_related('author', 'publisher').defer('search_vector')
     serializer_class = BookSerializer
     tags = ['Book']
     
+    # Conditional GET: lists and details answer If-None-Match with 304
+    last_modified_field = 'updated_at'
+    
+    # Page numbers by default, keyset pagination with ?cursor= (no OFFSET,
+    # count only with ?count=true)
+    pagination_class = KeysetPagination
+    
     # Filtering and ordering
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, BookOrderingFilter, BookSearchFilter]
     
-    # Filter fields - allows filtering on all model fields
-    filterset_fields = [
-        'name',
-        'author',
-        'publisher',
-        'publication_date',
-        'isbn',
-        # 'cover_photo',
-    ]
+    # Filter fields - author and publisher match names case-insensitively,
+    # author_id / publisher_id filter on the integer keys (see BookFilter)
+    filterset_class = BookFilter
     
-    # Search fields - allows search across multiple fields
-    search_fields = [
-        'name',
-        'author',
-        'publisher',
-        'isbn',
-    ]
+    # Search - ?search= matches name, author, publisher and isbn through the
+    # full-text index and substrings of name and isbn through pg_trgm,
+    # ranked by relevance unless ?ordering= is given (see BookSearchFilter)
     
-    # Ordering fields - allows sorting on all fields (ascending/descending)
+    # Ordering fields - allows sorting on all fields (ascending/descending);
+    # author and publisher sort by name
     ordering_fields = [
         'id',
         'name',
@@ -45,4 +80,383 @@ class BookViewSet(viewsets.ModelViewSet):
     ]
     
     # Default ordering
-    ordering = ['id']
\ No newline at end of file
+    ordering = ['id']
+    
+    # Parameters whose values are compared case-insensitively
+    case_insensitive_params = ('author', 'publisher', 'search')
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List books, served from the response cache when possible.
+        
+        Entries are keyed on the normalised query string (see
+        _get_list_params) and the catalog generation, so any book, author or
+        publisher write invalidates them all. The cached validators still
+        answer If-None-Match with 304.
+        """
+        if settings.BOOK_LIST_CACHE_TIMEOUT <= 0:
+            return super().list(request, *args, **kwargs)
+        
+        key = make_cache_key('list', self._get_list_params(request))
+        entry = get_or_compute(key, lambda: self._build_list_entry(request), settings.BOOK_LIST_CACHE_TIMEOUT)
+        
+        def render_page(request, *args, **kwargs):
+            return Response(entry['data'])
+        
+        return self._conditional_response(
+            request, (entry['version'], entry['last_modified']), render_page, *args, **kwargs
+        )
+    
+    @action(detail=False, methods=['get'], url_path='facets')
+    def facets(self, request):
+        """
+        Book counts per author, publisher and publication year.
+        
+        Accepts the same filter and search parameters as the list and counts
+        the matching books with a single GROUPING SETS query. Results are
+        cached per normalised filter set until the catalog changes.
+        
+        Query params:
+        - limit: values returned per facet, most frequent first (default: 20, max: 100)
+        """
+        try:
+            limit = int(request.query_params.get('limit', settings.BOOK_FACETS_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= 100:
+            return Response(
+                {'limit': 'Must be a whole number between 1 and 100'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        key = make_cache_key('facets', self._get_facet_params(request, limit))
+        facets = get_or_compute(
+            key,
+            lambda: get_book_facets(self.filter_queryset(self.get_queryset()), limit),
+            settings.BOOK_FACETS_CACHE_TIMEOUT
+        )
+        
+        return Response(facets)
+    
+    @action(detail=False, methods=['get'], url_path='suggest')
+    def suggest(self, request):
+        """
+        Typeahead completions for book titles and author names.
+        
+        Served from an in-process prefix index (see suggest.py), so it never
+        queries the books table.
+        
+        Query params:
+        - q: text typed so far (matched as a prefix, ignoring case and accents)
+        - limit: completions per kind (default: 10, max: 50)
+        """
+        try:
+            limit = int(request.query_params.get('limit', settings.BOOK_SUGGEST_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= 50:
+            return Response(
+                {'limit': 'Must be a whole number between 1 and 50'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        query = request.query_params.get('q', '')
+        return Response({'query': query, **suggestions.suggest(query, limit)})
+    
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Stream the whole (filtered) catalog as one NDJSON or CSV file.
+        
+        Accepts the same filter, search and ordering parameters as the list,
+        without pagination. Rows are read through a server-side cursor and
+        written to the response as they arrive, so the worker's memory stays
+        constant however large the catalog is.
+        
+        Query params:
+        - output: 'ndjson' (default) or 'csv'
+        - compress: 'gzip' to download a .gz file
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in FEED_FORMATS:
+            return Response(
+                {'output': f"Must be one of: {', '.join(FEED_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.query_params.get('compress', '')
+        if compress not in ('', 'gzip'):
+            return Response(
+                {'compress': "Must be 'gzip' or omitted"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        records = iter_book_export(queryset, chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE)
+        chunks = write_records(records, output, EXPORT_FIELDS)
+        
+        filename = f"books.{output}"
+        content_type = 'text/csv; charset=utf-8' if output == 'csv' else 'application/x-ndjson'
+        if compress:
+            chunks = gzip_chunks(chunks)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=[IsAdminUser], parser_classes=[MultiPartParser],
+        serializer_class=BookImportUploadSerializer
+    )
+    def bulk_import(self, request):
+        """
+        Create or update books from a CSV or NDJSON file (staff only).
+        
+        The upload is read in chunks; each chunk is validated, copied into a
+        staging table and upserted on isbn in one statement. Very large files
+        are better loaded with the import_books management command, which
+        isn't bound by request timeouts.
+        
+        Expected multipart payload:
+        - file: The books (.csv, .ndjson/.jsonl, optionally .gz)
+        - file_format (optional): 'csv' or 'ndjson'
+        - on_conflict (optional): 'update' (default) or 'skip' existing isbns
+        - chunk_size (optional): Rows per chunk
+        
+        Returns the import totals, per-chunk throughput and the first rejected rows.
+        """
+        serializer = BookImportUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        upload = serializer.validated_data['file']
+        feed_format = serializer.validated_data.get('file_format') or detect_format(upload.name)
+        if feed_format is None:
+            return Response(
+                {'file_format': ['Could not detect the file format from the file name.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chunks = []
+        try:
+            summary = import_books(
+                iter_records(open_text(upload.file, filename=upload.name), feed_format),
+                chunk_size=serializer.validated_data['chunk_size'],
+                on_conflict=serializer.validated_data['on_conflict'],
+                on_chunk=chunks.append
+            )
+        except FeedReadError as exc:
+            # Chunks before the unreadable part are already written
+            return Response(
+                {'file': [str(exc)], 'chunk_reports': chunks},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        summary['chunk_reports'] = chunks
+        
+        return Response(summary, status=status.HTTP_200_OK)
+    
+    def _get_facet_params(self, request, limit):
+        """
+        Return the filter and search parameters that affect the facet counts,
+        normalised so equivalent requests share a cache entry (ordering and
+        pagination parameters are dropped).
+        """
+        params = self._get_filter_params(request)
+        params['limit'] = [str(limit)]
+        return params
+    
+    def _get_list_params(self, request):
+        """
+        Return everything a list response depends on, normalised so that
+        equivalent requests share a cache entry: sorted filter values, the
+        effective ordering and the pagination parameters. The host is kept
+        because the response contains absolute links.
+        """
+        params = self._get_filter_params(request)
+        params['base_url'] = [request.build_absolute_uri('/')]
+        params['ordering'] = [self._get_canonical_ordering(request, searching='search' in params)]
+        
+        query = request.query_params
+        paginator = self.paginator
+        if paginator is not None:
+            page = query.get(paginator.page_query_param, '').strip()
+            if page and page != '1':
+                params['page'] = [page]
+            page_size = paginator.get_page_size(request)
+            params['page_size'] = [str(page_size)]
+            if paginator.page_size_query_param in query:
+                # Echoed in the next / previous links
+                params['page_size_param'] = [query[paginator.page_size_query_param]]
+            if getattr(paginator, 'cursor_query_param', None) in query:
+                params['cursor'] = [query[paginator.cursor_query_param]]
+                if query.get(paginator.count_query_param, '').lower() in ('1', 'true', 'yes'):
+                    params['count'] = ['true']
+        return params
+    
+    def _get_filter_params(self, request):
+        """Return the filter and search parameters, normalised."""
+        relevant = set(BookFilter.base_filters) | {BookSearchFilter.search_param}
+        params = {}
+        for name, values in request.query_params.lists():
+            if name not in relevant:
+                continue
+            values = [' '.join(value.split()) for value in values]
+            if name in self.case_insensitive_params:
+                values = [value.casefold() for value in values]
+            values = sorted(value for value in values if value)
+            if values:
+                params[name] = values
+        return params
+    
+    def _get_canonical_ordering(self, request, searching):
+        """
+        Return the ordering the filters will apply, as a string.
+        
+        Mirrors BookOrderingFilter (invalid fields are dropped, no valid field
+        means the default ordering) and BookSearchFilter (a search without
+        ?ordering= is ordered by rank).
+        """
+        param = request.query_params.get(BookOrderingFilter.ordering_param, '')
+        if searching and not param:
+            return 'rank'
+        
+        fields = []
+        seen = set()
+        for term in param.split(','):
+            term = term.strip()
+            name = term.lstrip('-')
+            if name in self.ordering_fields and name not in seen:
+                fields.append(term)
+                seen.add(name)
+        return ','.join(fields or self.ordering)
+    
+    def _build_list_entry(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            version, last_modified = self.get_list_validators(queryset)
+            data = self.get_serializer(queryset, many=True).data
+        else:
+            version, last_modified = self.get_page_validators(page)
+            data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        return {'version': version, 'last_modified': last_modified, 'data': data}
+
+
+class CoverUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    Chunked, resumable cover photo uploads.
+    
+    1. POST /api/books/cover-uploads/ with book, filename and size
+    2. PUT /api/books/cover-uploads/{id}/parts/?offset=N with the raw bytes
+       of the next part, repeated until offset == size
+    3. POST /api/books/cover-uploads/{id}/complete/ to set the book's cover
+    
+    Every part is streamed into storage as it arrives, so worker memory stays
+    bounded whatever the file size. After an interruption, GET the upload and
+    continue from its offset.
+    """
+    serializer_class = CoverUploadSerializer
+    tags = ['Book']
+    
+    def get_queryset(self):
+        return CoverUpload.objects.filter(user_id=self.request.user.pk)
+    
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+    
+    def perform_destroy(self, instance):
+        abort_cover_upload(instance)
+    
+    @action(detail=True, methods=['put'], url_path='parts')
+    def parts(self, request, pk=None):
+        """
+        Upload the next part of the file.
+        
+        Send the bytes as the raw request body (application/octet-stream) with
+        a Content-Length of at most BOOK_COVER_UPLOAD_MAX_PART_SIZE.
+        
+        Query params:
+        - offset: byte position of the part in the file; must equal the
+          upload's offset, otherwise 409 with the offset to resume from
+        """
+        upload = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response(
+                {'offset': 'Must be a whole number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < length <= settings.BOOK_COVER_UPLOAD_MAX_PART_SIZE:
+            return Response(
+                {'part': f"Send between 1 and {settings.BOOK_COVER_UPLOAD_MAX_PART_SIZE} bytes with a Content-Length"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset + length > upload.size:
+            return Response(
+                {'part': f"The part ends after the declared size of {upload.size} bytes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            append_cover_part(upload, offset, request.stream, length)
+        except UploadOffsetConflict as exc:
+            return Response(
+                {'offset': str(exc), 'expected_offset': exc.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response(self.get_serializer(upload).data)
+    
+    @action(detail=True, methods=['post'], url_path='complete')
+    def complete(self, request, pk=None):
+        """
+        Finish the upload and make it the book's cover photo.
+        
+        Expected payload (optional):
+        - sha256: hex SHA-256 of the whole file, checked before the cover is set
+        
+        Returns the updated book.
+        """
+        upload = self.get_object()
+        book = complete_cover_upload(upload, sha256=request.data.get('sha256'))
+        return Response(BookSerializer(book, context=self.get_serializer_context()).data)
+
+
+@require_safe
+def cover_derivative(request, sha, size, extension):
+    """
+    Serve a cover thumbnail (see covers.py).
+    
+    The URL names the content, so the response can be cached forever. A
+    thumbnail that the worker pool has not written yet is queued, and the
+    request is redirected to the original meanwhile (without caching).
+    """
+    if size not in settings.BOOK_COVER_SIZES or extension not in CONTENT_TYPES:
+        raise Http404
+    
+    etag = quote_etag(f"{sha}-{size}.{extension}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        name = derivative_name(sha, size, extension)
+        if not default_storage.exists(name):
+            original = Book.objects.filter(cover_sha256=sha).values_list('cover_photo', flat=True).first()
+            if not original:
+                raise Http404
+            # Failures are logged by the pool
+            schedule_derivatives(original, sha)
+            response = HttpResponseRedirect(default_storage.url(original))
+            response['Cache-Control'] = 'no-cache'
+            return response
+        response = FileResponse(default_storage.open(name, 'rb'), content_type=CONTENT_TYPES[extension])
+    
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
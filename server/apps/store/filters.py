@@ -0,0 +1,17 @@
+import django_filters
+from .models import DailySalesRollup
+
+
+class DailySalesRollupFilter(django_filters.FilterSet):
+    """Date range and product filters for the sales analytics endpoint."""
+    start = django_filters.DateFilter(field_name='day', lookup_expr='gte')
+    end = django_filters.DateFilter(field_name='day', lookup_expr='lte')
+    product_type = django_filters.ChoiceFilter(
+        field_name='content_type__model',
+        choices=[('book', 'book'), ('musicalbum', 'musicalbum'), ('softwarelicense', 'softwarelicense')]
+    )
+    product_id = django_filters.UUIDFilter(field_name='object_id')
+    
+    class Meta:
+        model = DailySalesRollup
+        fields = ['start', 'end', 'product_type', 'product_id']
@@ -0,0 +1,90 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.store.services import get_stale_carts, archive_stale_carts
+
+
+class Command(BaseCommand):
+    """
+    Archive (or purge) shopping carts that have been inactive for too long.
+    
+    Stale carts and their items are written to gzip-compressed JSON lines
+    under CART_ARCHIVE_DIR and then deleted in small batches, so the job can
+    run against the live database without holding long locks.
+    
+    Usage:
+        python manage.py archive_carts
+        python manage.py archive_carts --days 180 --anonymous-days 14
+        python manage.py archive_carts --purge --batch-size 200 --sleep 0.5
+        python manage.py archive_carts --dry-run
+    """
+    help = 'Move stale shopping carts to compressed JSONL cold storage'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CART_RETENTION_DAYS,
+            help='Archive user carts inactive for this many days'
+        )
+        parser.add_argument(
+            '--anonymous-days', type=int, default=settings.CART_ANONYMOUS_RETENTION_DAYS,
+            help='Archive anonymous carts (no user) inactive for this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.CART_ARCHIVE_BATCH_SIZE,
+            help='Number of carts moved per transaction'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches'
+        )
+        parser.add_argument(
+            '--output-dir', default=settings.CART_ARCHIVE_DIR,
+            help='Directory that receives the .jsonl.gz archive files'
+        )
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='Delete stale carts without writing an archive'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report how many carts would be archived'
+        )
+    
+    def handle(self, *args, **options):
+        now = timezone.now()
+        carts = get_stale_carts(
+            cutoff=now - timedelta(days=options['days']),
+            anonymous_cutoff=now - timedelta(days=options['anonymous_days'])
+        )
+        
+        if options['dry_run']:
+            self.stdout.write(f"{carts.count()} stale carts would be archived.")
+            return
+        
+        archive_path = None
+        if not options['purge']:
+            os.makedirs(options['output_dir'], exist_ok=True)
+            archive_path = os.path.join(
+                options['output_dir'], f"carts-{now:%Y%m%dT%H%M%S}.jsonl.gz"
+            )
+        
+        def progress(batch, cart_count, item_count):
+            self.stdout.write(f"Batch {batch}: {cart_count} carts, {item_count} items")
+        
+        totals = archive_stale_carts(
+            carts,
+            batch_size=options['batch_size'],
+            archive_path=archive_path,
+            sleep=options['sleep'],
+            progress=progress
+        )
+        
+        action = 'Archived' if archive_path else 'Purged'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {totals['carts']} carts and {totals['items']} items "
+            f"in {totals['batches']} batches."
+        ))
+        if archive_path and totals['carts']:
+            self.stdout.write(f"Archive written to {archive_path}")
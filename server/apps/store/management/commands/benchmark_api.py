@@ -0,0 +1,441 @@
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from itertools import accumulate
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from apps.books.models import Author, Book as CatalogBook, Publisher
+from apps.store.models import Book, MusicAlbum, ShoppingCart, ShoppingCartItem, SoftwareLicense
+from apps.users.authentication import get_tokens_for_user
+from apps.users.models import User
+
+SCENARIOS = ('my-cart', 'add-product', 'totals', 'remove-product', 'recommendations', 'book-list')
+LATENCY_METRICS = ('p50', 'p95', 'p99')
+SEARCH_WORDS = (
+    'the', 'war', 'love', 'history', 'night', 'city', 'garden', 'river', 'house', 'king', 'queen', 'secret',
+    'dark', 'light', 'world', 'life', 'death', 'star', 'winter', 'summer',
+)
+BOOK_ORDERINGS = ('name', '-name', 'publication_date', '-publication_date', 'author', '-isbn')
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the hot store and books endpoints.
+
+    Seeds products, purchase history and (when the catalog is small) books,
+    then drives each scenario through the full middleware and DRF stack,
+    in-process with the Django test client or against a running server with
+    --base-url. Each worker thread uses its own user and cart. Reports p50,
+    p95 and p99 latency, throughput and queries per request (read from the
+    Server-Timing header), saves the results as JSON, and fails when a
+    scenario got slower than the baseline by more than --max-regression or
+    runs more queries than it did. Seeded rows are deleted afterwards.
+
+    Usage:
+        python manage.py benchmark_api
+        python manage.py benchmark_api --requests 500 --concurrency 4
+        python manage.py benchmark_api --scenario add-product --scenario totals
+        python manage.py benchmark_api --base-url http://localhost:8000
+        python manage.py benchmark_api --save-baseline
+    """
+    help = 'Measure latency, throughput and queries per request of the hot API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario first')
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker threads, each with its own user')
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+            help='Scenario to run (repeatable, default: all)'
+        )
+        parser.add_argument('--products', type=int, default=300, help='Products seeded per product type')
+        parser.add_argument('--history-carts', type=int, default=500, help='Carts of purchase history seeded')
+        parser.add_argument('--books', type=int, default=2000, help='Seed catalog books up to this many')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--base-url', help='Benchmark a running server instead of running in-process')
+        parser.add_argument(
+            '--output', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'latest.json'),
+            help='Where to save the results'
+        )
+        parser.add_argument(
+            '--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+            help='Results to compare with (skipped when the file does not exist)'
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Also save the results as the baseline')
+        parser.add_argument(
+            '--max-regression', type=float, default=0.25,
+            help='Allowed latency increase over the baseline, as a fraction (0.25 = 25%%)'
+        )
+        parser.add_argument('--latency-metric', choices=LATENCY_METRICS, default='p95')
+        parser.add_argument('--keep-data', action='store_true', help='Do not delete the seeded rows')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+        self.rng = random.Random(options['seed'])
+        self.tag = f"bench{self.rng.randrange(10 ** 6):06d}"
+        scenarios = [name for name in SCENARIOS if name in (options['scenarios'] or SCENARIOS)]
+
+        started = time.perf_counter()
+        seeded = self._seed(options)
+        self.stdout.write(f"Seeded benchmark data in {time.perf_counter() - started:.1f}s")
+
+        # Request logs would flood the output and time the log handlers along with the views
+        quiet_loggers = [logging.getLogger(name) for name in ('project.requests', 'django.request')]
+        levels = [logger.level for logger in quiet_loggers]
+        for logger in quiet_loggers:
+            logger.setLevel(logging.ERROR)
+        try:
+            workers = [self._make_worker(user, seeded, options) for user in seeded['users'][1:]]
+            results = {}
+            for name in scenarios:
+                results[name] = self._run_scenario(name, workers, options)
+                self._write_result(name, results[name])
+        finally:
+            for logger, level in zip(quiet_loggers, levels):
+                logger.setLevel(level)
+            if not options['keep_data']:
+                self._cleanup(seeded)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'mode': 'http' if options['base_url'] else 'in-process',
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': results,
+        }
+        self._save(options['output'], report)
+        if options['save_baseline']:
+            self._save(options['baseline'], report)
+            self.stdout.write(f"Saved the baseline to {options['baseline']}")
+
+        regressions = self._compare(report, options)
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Saved the results to {options['output']}"))
+
+    # Seeding
+
+    def _seed(self, options):
+        """Create users, products, purchase history and catalog books for the run."""
+        rng = self.rng
+        # One staff user per worker thread (staff may read recommendations of all carts), plus the
+        # customer who owns the products and the purchase history, so that worker carts stay unique
+        users = [
+            User(
+                username=f"{self.tag}-{number}@benchmark.local", email=f"{self.tag}-{number}@benchmark.local",
+                is_staff=number > 0
+            )
+            for number in range(options['concurrency'] + 1)
+        ]
+        for user in users:
+            user.set_unusable_password()
+        User.objects.bulk_create(users)
+        owner = users[0]
+
+        def price():
+            return Decimal(rng.randrange(199, 9999)) / 100
+
+        def weight():
+            return Decimal(rng.randrange(5, 300)) / 100
+
+        count = options['products']
+        products = (
+            [Book(title=f"{self.tag} book {number}", author=owner, number_of_pages=rng.randint(80, 900),
+                  price_in_euros=price(), weight_in_kilograms=weight()) for number in range(count)] +
+            [MusicAlbum(artist=owner, number_of_tracks=rng.randint(6, 20),
+                        price_in_euros=price(), weight_in_kilograms=weight()) for _ in range(count)] +
+            [SoftwareLicense(price_in_euros=price(), weight_in_kilograms=Decimal('0.00')) for _ in range(count)]
+        )
+        for model in (Book, MusicAlbum, SoftwareLicense):
+            model.objects.bulk_create([product for product in products if isinstance(product, model)])
+        rng.shuffle(products)
+        # Zipf-like popularity: the n-th product is picked about 1/n as often as the first
+        cumulative_weights = list(accumulate(1 / rank for rank in range(1, len(products) + 1)))
+
+        content_types = ContentType.objects.get_for_models(Book, MusicAlbum, SoftwareLicense)
+        carts = [ShoppingCart(user=owner) for _ in range(options['history_carts'])]
+        ShoppingCart.objects.bulk_create(carts)
+        items = []
+        for cart in carts:
+            picked = {
+                product.pk: product
+                for product in rng.choices(products, cum_weights=cumulative_weights, k=rng.randint(1, 8))
+            }
+            # Saved one by one below the bulk insert, so created_at follows the order they were added
+            items.extend(
+                ShoppingCartItem(
+                    cart=cart, content_type=content_types[type(product)], object_id=product.pk,
+                    quantity=rng.randint(1, 3), product_price=product.price_in_euros,
+                    product_weight=product.weight_in_kilograms
+                )
+                for product in picked.values()
+            )
+        ShoppingCartItem.objects.bulk_create(items, batch_size=5000)
+
+        book_ids, author_ids, publisher_ids = self._seed_catalog(options['books'])
+        return {
+            'users': users,
+            'products': products,
+            'cumulative_weights': cumulative_weights,
+            'software_ids': [product.pk for product in products if isinstance(product, SoftwareLicense)],
+            'book_ids': book_ids,
+            'author_ids': author_ids,
+            'publisher_ids': publisher_ids,
+        }
+
+    def _seed_catalog(self, target):
+        """Add catalog books, authors and publishers until there are `target` books."""
+        missing = target - CatalogBook.objects.count()
+        if missing <= 0:
+            return [], [], []
+        rng = self.rng
+        authors = Author.objects.bulk_create(
+            [Author(name=f"{rng.choice(SEARCH_WORDS).title()} Writer {self.tag}-{n}") for n in range(max(1, missing // 20))]
+        )
+        publishers = Publisher.objects.bulk_create(
+            [Publisher(name=f"{rng.choice(SEARCH_WORDS).title()} Press {self.tag}-{n}") for n in range(max(1, missing // 200))]
+        )
+        books = CatalogBook.objects.bulk_create([
+            CatalogBook(
+                name=' '.join(rng.choice(SEARCH_WORDS) for _ in range(rng.randint(2, 5))).title(),
+                author=rng.choice(authors),
+                publisher=rng.choice(publishers),
+                publication_date=datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(27000)),
+                isbn=f"0{self.tag[-6:]}{number:06d}",
+            )
+            for number in range(missing)
+        ], batch_size=5000)
+        return [book.pk for book in books], [author.pk for author in authors], [p.pk for p in publishers]
+
+    def _cleanup(self, seeded):
+        # Products, carts and items go with their users (CASCADE)
+        CatalogBook.objects.filter(pk__in=seeded['book_ids']).delete()
+        Author.objects.filter(pk__in=seeded['author_ids']).delete()
+        Publisher.objects.filter(pk__in=seeded['publisher_ids']).delete()
+        ShoppingCartItem.objects.filter(object_id__in=seeded['software_ids']).delete()
+        SoftwareLicense.objects.filter(pk__in=seeded['software_ids']).delete()
+        User.objects.filter(pk__in=[user.pk for user in seeded['users']]).delete()
+
+    # Running
+
+    def _make_worker(self, user, seeded, options):
+        """A client for one user, its cart, and the products it added."""
+        token = str(get_tokens_for_user(user).access_token)
+        if options['base_url']:
+            client = HttpClient(options['base_url'], token)
+        else:
+            client = InProcessClient(token)
+        status, body, _, _ = client.get('/api/carts/my-cart/')
+        if status not in (200, 201):
+            raise CommandError(f"Could not create the benchmark cart: {status} {body[:200]!r}")
+        return {
+            'client': client,
+            'cart': json.loads(body)['id'],
+            'added': [],
+            'rng': random.Random(f"{options['seed']}-{user.pk}"),
+            'products': seeded['products'],
+            'cumulative_weights': seeded['cumulative_weights'],
+        }
+
+    def _run_scenario(self, name, workers, options):
+        request = getattr(self, f"_request_{name.replace('-', '_')}")
+        for number in range(options['warmup']):
+            request(workers[number % len(workers)])
+
+        share, extra = divmod(options['requests'], len(workers))
+        counts = [share + (1 if number < extra else 0) for number in range(len(workers))]
+
+        def run(worker, count):
+            samples = []
+            try:
+                for _ in range(count):
+                    samples.append(request(worker))
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            futures = [executor.submit(run, worker, count) for worker, count in zip(workers, counts)]
+            samples = [sample for future in futures for sample in future.result()]
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency, _ in samples)
+        queries = [count for _, _, count in samples if count is not None]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for status, _, _ in samples if status >= 400),
+            'p50_ms': round(self._percentile(latencies, 50), 3),
+            'p95_ms': round(self._percentile(latencies, 95), 3),
+            'p99_ms': round(self._percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(latencies[-1], 3),
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+
+    def _request_my_cart(self, worker):
+        return self._sample(worker['client'].get('/api/carts/my-cart/'))
+
+    def _request_add_product(self, worker):
+        product = worker['rng'].choices(worker['products'], cum_weights=worker['cumulative_weights'])[0]
+        worker['added'].append(product)
+        return self._sample(worker['client'].post(
+            f"/api/carts/{worker['cart']}/add-product/", self._product_payload(product)
+        ))
+
+    def _request_totals(self, worker):
+        return self._sample(worker['client'].get(f"/api/carts/{worker['cart']}/totals/"))
+
+    def _request_remove_product(self, worker):
+        if not worker['added']:
+            self._request_add_product(worker)
+        product = worker['added'].pop()
+        return self._sample(worker['client'].post(
+            f"/api/carts/{worker['cart']}/remove-product/", self._product_payload(product)
+        ))
+
+    def _request_recommendations(self, worker):
+        return self._sample(worker['client'].get('/api/carts/recommendations/?all_users=true'))
+
+    def _request_book_list(self, worker):
+        rng = worker['rng']
+        query = (
+            f"search={rng.choice(SEARCH_WORDS)}&ordering={rng.choice(BOOK_ORDERINGS)}"
+            f"&page={rng.randint(1, 2)}"
+        )
+        return self._sample(worker['client'].get(f"/api/books/?{query}"), allowed=(404,))
+
+    def _product_payload(self, product):
+        return {'product_type': type(product).__name__.lower(), 'product_id': str(product.pk), 'quantity': 1}
+
+    def _sample(self, response, allowed=()):
+        """(status, latency in ms, queries) of one response; allowed statuses don't count as errors."""
+        status, _, server_timing, latency = response
+        match = SERVER_TIMING_QUERIES.search(server_timing or '')
+        return (200 if status in allowed else status), latency, int(match.group(1)) if match else None
+
+    # Reporting
+
+    def _write_result(self, name, result):
+        queries = result['queries_per_request']
+        self.stdout.write(
+            f"{name:16} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:7.1f} req/s  "
+            f"{'-' if queries is None else queries} queries/req  {result['errors']} errors"
+        )
+
+    def _save(self, path, report):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    def _compare(self, report, options):
+        """Describe every scenario that regressed against the baseline."""
+        if options['save_baseline'] or not os.path.exists(options['baseline']):
+            return []
+        with open(options['baseline']) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        metric = f"{options['latency_metric']}_ms"
+        regressions = []
+        for name, result in report['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if previous is None:
+                continue
+            if result['errors']:
+                regressions.append(f"{name}: {result['errors']} failed requests")
+            limit = previous[metric] * (1 + options['max_regression'])
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {options['latency_metric']} {result[metric]:.2f} ms > "
+                    f"{limit:.2f} ms (baseline {previous[metric]:.2f} ms)"
+                )
+            if (result['queries_per_request'] is not None and previous.get('queries_per_request') is not None
+                    and result['queries_per_request'] > previous['queries_per_request']):
+                regressions.append(
+                    f"{name}: {result['queries_per_request']} queries per request "
+                    f"(baseline {previous['queries_per_request']})"
+                )
+        return regressions
+
+    def _percentile(self, ordered, pct):
+        """Nearest-rank percentile of an already sorted list."""
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+
+class InProcessClient:
+    """Requests through the Django test client: the whole stack, no network."""
+
+    def __init__(self, token):
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+        self.local = threading.local()
+
+    @property
+    def client(self):
+        # One test client per thread (it keeps cookies)
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        return self.local.client
+
+    def get(self, path):
+        started = time.perf_counter()
+        response = self.client.get(path, **self.headers)
+        return self._result(response, started)
+
+    def post(self, path, data):
+        started = time.perf_counter()
+        response = self.client.post(path, data, content_type='application/json', **self.headers)
+        return self._result(response, started)
+
+    def _result(self, response, started):
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        latency = (time.perf_counter() - started) * 1000
+        return response.status_code, body, response.get('Server-Timing'), latency
+
+
+class HttpClient:
+    """Requests to a running server over HTTP (keep-alive session per thread)."""
+
+    def __init__(self, base_url, token):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers['Authorization'] = f"Bearer {self.token}"
+        return self.local.session
+
+    def get(self, path):
+        started = time.perf_counter()
+        response = self.session.get(self.base_url + path)
+        return self._result(response, started)
+
+    def post(self, path, data):
+        started = time.perf_counter()
+        response = self.session.post(self.base_url + path, json=data)
+        return self._result(response, started)
+
+    def _result(self, response, started):
+        latency = (time.perf_counter() - started) * 1000
+        return response.status_code, response.content, response.headers.get('Server-Timing'), latency
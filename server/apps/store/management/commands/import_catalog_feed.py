@@ -0,0 +1,72 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.store.services import ingest_catalog_feed
+from project.streaming import FEED_FORMATS, FeedReadError, detect_format, iter_records, open_text
+
+
+class Command(BaseCommand):
+    """
+    Stream a supplier catalog feed (CSV or NDJSON) into the store products.
+    
+    Rows are validated and upserted in chunks, so memory use stays flat no
+    matter how large the feed is. Every row needs a product_type column
+    ('book', 'musicalbum' or 'softwarelicense'), the product id, and the
+    fields of that product type.
+    
+    Usage:
+        python manage.py import_catalog_feed feed.csv
+        python manage.py import_catalog_feed feed.ndjson.gz --chunk-size 10000
+        cat feed.ndjson | python manage.py import_catalog_feed - --format ndjson
+    """
+    help = 'Bulk create or update Book, MusicAlbum and SoftwareLicense rows from a feed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' to read from stdin")
+        parser.add_argument(
+            '--format', dest='feed_format', choices=FEED_FORMATS,
+            help='Feed format (detected from the file name when omitted)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.CATALOG_FEED_CHUNK_SIZE,
+            help='Rows validated and written per transaction'
+        )
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['feed_format'] or detect_format(path)
+        if feed_format is None:
+            raise CommandError('Could not detect the feed format, pass --format.')
+        
+        def on_chunk(report):
+            self.stdout.write(
+                f"Chunk {report['chunk']}: {report['rows']} rows, {report['upserted']} upserted, "
+                f"{report['rejected']} rejected in {report['seconds']}s "
+                f"({report['rows_per_second']} rows/s)"
+            )
+        
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        
+        try:
+            stream = open_text(binary, filename=path)
+            summary = ingest_catalog_feed(
+                iter_records(stream, feed_format),
+                chunk_size=options['chunk_size'],
+                on_chunk=on_chunk
+            )
+        except FeedReadError as exc:
+            raise CommandError(f"{exc} (the chunks reported above were imported)")
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+        
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows in {summary['seconds']}s "
+            f"({summary['rows_per_second']} rows/s): {summary['upserted']} upserted, "
+            f"{summary['rejected']} rejected."
+        ))
@@ -0,0 +1,207 @@
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.store.models import ShoppingCartItem
+
+
+class Command(BaseCommand):
+    """
+    Optional monthly range partitioning of ShoppingCartItem by created_at.
+
+    Partitioning is opt-in: the model and the ORM work the same on a plain or a
+    partitioned table. Once converted, old months can be detached (and dropped)
+    as whole tables instead of being deleted row by row.
+
+    PostgreSQL requires every unique constraint of a partitioned table to
+    include the partition key, so after conversion the primary key becomes
+    (id, created_at) and the (cart, content_type, object_id) uniqueness is
+    enforced by a unique index on each monthly partition.
+
+    Usage:
+        python manage.py partition_cart_items --convert
+        python manage.py partition_cart_items --months-ahead 6
+        python manage.py partition_cart_items --detach-before 2025-01-01 --drop
+    """
+    help = 'Convert, extend and detach monthly partitions of the cart item table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Rebuild the cart item table as a partitioned table (takes an exclusive lock)'
+        )
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Make sure partitions exist up to this many months in the future'
+        )
+        parser.add_argument(
+            '--detach-before', type=date.fromisoformat,
+            help='Detach partitions whose whole range ends on or before this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop partitions after detaching them'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Detach partitions even when they still contain rows'
+        )
+
+    def handle(self, *args, **options):
+        self.table = ShoppingCartItem._meta.db_table
+
+        with connection.cursor() as cursor:
+            partitioned = self._is_partitioned(cursor)
+
+        if options['convert']:
+            if partitioned:
+                raise CommandError(f"{self.table} is already partitioned.")
+            self._convert(options['months_ahead'])
+        elif not partitioned:
+            raise CommandError(
+                f"{self.table} is not partitioned. Run with --convert first."
+            )
+        else:
+            self._ensure_partitions(_month_start(timezone.now()), options['months_ahead'])
+
+        if options['detach_before']:
+            self._detach_before(options['detach_before'], options['drop'], options['force'])
+
+    def _is_partitioned(self, cursor):
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [self.table]
+        )
+        return cursor.fetchone()[0]
+
+    def _convert(self, months_ahead):
+        qn = connection.ops.quote_name
+        table = self.table
+        legacy = f"{table}_legacy"
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+
+            # Keep Django's constraint and index names so later migrations
+            # can still find them by introspection.
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+                [table]
+            )
+            constraints = cursor.fetchall()
+            cursor.execute(
+                "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+                "WHERE indrelid = %s::regclass AND NOT indisunique",
+                [table]
+            )
+            indexes = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+            cursor.execute(
+                f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS) "
+                f"PARTITION BY RANGE (created_at)"
+            )
+
+            cursor.execute(f"SELECT MIN(created_at) FROM {qn(legacy)}")
+            oldest = cursor.fetchone()[0] or timezone.now()
+            current = _month_start(timezone.now())
+            months_back = (current.year - oldest.year) * 12 + current.month - oldest.month
+            self._ensure_partitions(_month_start(oldest), months_back + months_ahead, cursor)
+
+            cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}")
+            moved = cursor.rowcount
+            cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + '_pkey')} "
+                f"PRIMARY KEY (id, created_at)"
+            )
+            for name, definition in constraints:
+                cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+            for definition in indexes:
+                cursor.execute(definition)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {table} to monthly partitions ({moved} rows moved)."
+        ))
+
+    def _ensure_partitions(self, start, months, cursor=None):
+        """Create the default partition and one partition per month from start."""
+        if cursor is None:
+            with transaction.atomic(), connection.cursor() as cursor:
+                return self._ensure_partitions(start, months, cursor)
+
+        qn = connection.ops.quote_name
+        table = self.table
+
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(table + '_default')} "
+            f"PARTITION OF {qn(table)} DEFAULT"
+        )
+        self._create_unique_index(cursor, table + '_default')
+
+        month = start
+        for _ in range(months + 1):
+            following = _next_month(month)
+            name = f"{table}_p{month:%Y%m}"
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, following]
+            )
+            self._create_unique_index(cursor, name)
+            month = following
+
+    def _create_unique_index(self, cursor, partition):
+        qn = connection.ops.quote_name
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {qn(partition + '_cart_product_uniq')} "
+            f"ON {qn(partition)} (cart_id, content_type_id, object_id)"
+        )
+
+    def _detach_before(self, cutoff, drop, force):
+        qn = connection.ops.quote_name
+        table = self.table
+        pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+                [table]
+            )
+            partitions = [row[0] for row in cursor.fetchall()]
+
+        for name in partitions:
+            match = pattern.match(name)
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if _next_month(month) > cutoff:
+                continue
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {qn(name)})")
+                if cursor.fetchone()[0] and not force:
+                    self.stdout.write(self.style.WARNING(
+                        f"Skipping {name}: it still has rows (archive the carts first or use --force)."
+                    ))
+                    continue
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+                if drop:
+                    cursor.execute(f"DROP TABLE {qn(name)}")
+
+            self.stdout.write(f"{'Dropped' if drop else 'Detached'} {name}")
+
+
+def _month_start(value):
+    """Return midnight UTC on the first day of the month containing value."""
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(value):
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.store.services import refresh_sales_rollups
+
+
+class Command(BaseCommand):
+    """
+    Refresh the daily sales rollup tables from shopping cart items.
+    
+    Meant to run every few minutes from cron. Each run only touches the
+    (day, product) groups with items changed since the previous run, plus a
+    short reconciliation window that picks up deleted items.
+    
+    Usage:
+        python manage.py refresh_sales_rollups
+        python manage.py refresh_sales_rollups --reconcile-days 7
+        python manage.py refresh_sales_rollups --full
+    """
+    help = 'Incrementally update the daily sales rollups'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild all rollups from the live cart items'
+        )
+        parser.add_argument(
+            '--reconcile-days', type=int, default=settings.SALES_ROLLUP_RECONCILE_DAYS,
+            help='Number of recent days to rebuild completely on each run'
+        )
+    
+    def handle(self, *args, **options):
+        stats = refresh_sales_rollups(
+            full=options['full'],
+            reconcile_days=options['reconcile_days']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {stats['rebuilt']} and refreshed {stats['refreshed']} rollup rows "
+            f"(watermark {stats['watermark']:%Y-%m-%d %H:%M:%S})."
+        ))
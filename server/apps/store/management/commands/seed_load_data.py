@@ -0,0 +1,265 @@
+import os
+import random
+import time
+from argparse import ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from apps.books.cache import bump_generation
+from apps.books.models import Author, Book as CatalogBook, Publisher
+from apps.store import seeding
+from apps.store.models import Book, MusicAlbum, ShoppingCart, ShoppingCartItem, SoftwareLicense
+from apps.users.models import User
+
+PRODUCT_MODELS = {'book': Book, 'musicalbum': MusicAlbum, 'softwarelicense': SoftwareLicense}
+# Share of each product type in the seeded store
+PRODUCT_SHARES = {'book': 5, 'musicalbum': 3, 'softwarelicense': 2}
+# Rows per task for users, catalog books and products (carts use --batch-size)
+ROW_BATCH = 20000
+FOLLOWERS_PER_PRODUCT = 3
+
+
+def size_range(value):
+    """'5' or '1-12' as (low, high)."""
+    low, _, high = value.partition('-')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise ArgumentTypeError(f"not a number or a range: {value}")
+    if not 0 <= low <= high:
+        raise ArgumentTypeError(f"invalid range: {value}")
+    return low, high
+
+
+class Command(BaseCommand):
+    """
+    Generate a large synthetic dataset for capacity and query plan testing.
+
+    Creates users, store products, carts with their items and optionally
+    catalog books (with authors and publishers). Rows are generated and
+    written with COPY by a pool of worker processes, a batch per task and
+    transaction, so millions of cart items load in minutes; the tables are
+    ANALYZEd at the end so the planner sees their real size.
+
+    The data is deterministic for a given --seed: product popularity follows
+    a Zipf distribution (--zipf), and after the first item of a cart the next
+    one is usually one of a few products that tend to follow the previous
+    one (--follow), which gives the recommendations something to find.
+    Timestamps are spread over the --days before now, and every cart belongs
+    to its own user, as my-cart expects.
+
+    Usage:
+        python manage.py seed_load_data --carts 100000 --items-per-cart 1-12
+        python manage.py seed_load_data --carts 1000000 --items-per-cart 2-18 --products 100000 --books 1000000
+        python manage.py seed_load_data --carts 1000 --password loadtest --seed 7
+        python manage.py seed_load_data --clear --seed 7
+    """
+    help = 'Seed users, products, carts, cart items and books for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=10000, help='Carts to create, one per user')
+        parser.add_argument(
+            '--items-per-cart', type=size_range, default=(1, 12),
+            help="Items per cart, a number or a range such as '1-12' (small carts are more common)"
+        )
+        parser.add_argument('--users', type=int, help='Users to create, at least --carts (default: --carts)')
+        parser.add_argument('--products', type=int, default=10000, help='Store products to create')
+        parser.add_argument('--books', type=int, default=0, help='Catalog books to create')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the product popularity')
+        parser.add_argument(
+            '--follow', type=float, default=0.6,
+            help='Probability that an item is one of the usual followers of the previous one'
+        )
+        parser.add_argument('--days', type=int, default=365, help='Period the timestamps are spread over')
+        parser.add_argument('--password', help='Password of every seeded user (default: unusable)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--workers', type=int, help='Writing processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Carts generated and copied per task')
+        parser.add_argument('--clear', action='store_true', help='Delete the data of --seed instead')
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        if options['clear']:
+            self._clear(seed)
+            return
+
+        users = options['users'] or options['carts']
+        if users < options['carts']:
+            raise CommandError('Every cart needs its own user: --users must be at least --carts.')
+        if options['products'] < 1 or options['carts'] < 0 or options['books'] < 0:
+            raise CommandError('--products must be positive, --carts and --books not negative.')
+        if options['items_per_cart'][1] > options['products']:
+            raise CommandError('--items-per-cart cannot exceed --products.')
+        if not 0 <= options['follow'] <= 1:
+            raise CommandError('--follow must be between 0 and 1.')
+        isbn_prefix = f"8{seed % 1000:03d}"
+        if (
+            User.objects.filter(username=seeding.seeded_username(seed, 0)).exists()
+            or Author.objects.filter(name=f"Load Author {seed}-0").exists()
+            or options['books'] and CatalogBook.objects.filter(isbn=f"{isbn_prefix}{0:09d}").exists()
+        ):
+            raise CommandError(f"Data for seed {seed} exists: use another --seed or run with --clear first.")
+
+        started = time.monotonic()
+        plan = self._plan(options, users, isbn_prefix)
+        first_phase = (
+            self._tasks('users', users, ROW_BATCH) + self._tasks('books', options['books'], ROW_BATCH)
+        )
+        # Products and carts reference the users, committed by the first phase
+        second_phase = (
+            self._tasks('products', options['products'], ROW_BATCH) +
+            self._tasks('carts', options['carts'], options['batch_size'])
+        )
+        workers = options['workers'] or os.cpu_count() or 1
+        totals = {}
+
+        # Forked workers must not share the parent's connection
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=seeding._init_worker, initargs=(plan,)) as executor:
+            for tasks in (first_phase, second_phase):
+                futures = [executor.submit(seeding.run_task, *task) for task in tasks]
+                for future in as_completed(futures):
+                    kind, batch, written = future.result()
+                    for table, rows in written.items():
+                        totals[table] = totals.get(table, 0) + rows
+                    self.stdout.write(
+                        f"{kind} batch {batch}: "
+                        + ', '.join(f"{rows} {table}" for table, rows in written.items())
+                        + f" ({time.monotonic() - started:.1f}s)"
+                    )
+
+        self.stdout.write('Analyzing the seeded tables...')
+        with connection.cursor() as cursor:
+            for table in totals:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+        if options['books']:
+            bump_generation()
+
+        seconds = time.monotonic() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {rows} rows with {workers} workers in {seconds:.1f}s ({rows / seconds:.0f} rows/s): "
+            + ', '.join(f"{count} {table}" for table, count in totals.items())
+        ))
+
+    def _plan(self, options, users, isbn_prefix):
+        """Everything the workers share: ids, products, popularity and followers."""
+        seed = options['seed']
+        rng = random.Random(f"{seed}:plan")
+        now = timezone.now().replace(microsecond=0)
+
+        product_types = rng.choices(list(PRODUCT_SHARES), weights=list(PRODUCT_SHARES.values()), k=options['products'])
+        # Products are ordered by popularity: index 0 is the most popular
+        products = [
+            (
+                product_type, str(seeding.seeded_id(seed, product_type, number)),
+                f"{rng.randrange(199, 9999) / 100:.2f}",
+                '0.00' if product_type == 'softwarelicense' else f"{rng.randrange(5, 300) / 100:.2f}",
+            )
+            for number, product_type in enumerate(product_types)
+        ]
+        cumulative_weights = seeding.zipf_cumulative_weights(len(products), options['zipf'])
+        population = range(len(products))
+        followers = [
+            rng.choices(population, cum_weights=cumulative_weights, k=FOLLOWERS_PER_PRODUCT) for _ in population
+        ]
+
+        author_ids, publisher_ids = self._create_names(seed, options['books'])
+        content_types = ContentType.objects.get_for_models(*PRODUCT_MODELS.values())
+        return {
+            'seed': seed,
+            'password': make_password(options['password']),
+            'started_at': now - timedelta(days=options['days']),
+            'ended_at': now,
+            'tables': {
+                'user': User._meta.db_table,
+                'catalog_book': CatalogBook._meta.db_table,
+                'cart': ShoppingCart._meta.db_table,
+                'item': ShoppingCartItem._meta.db_table,
+                **{product_type: model._meta.db_table for product_type, model in PRODUCT_MODELS.items()},
+            },
+            'isbn_prefix': isbn_prefix,
+            'author_ids': author_ids,
+            'author_weights': seeding.zipf_cumulative_weights(len(author_ids), 1.0),
+            'publisher_ids': publisher_ids,
+            # Users that store products are credited to
+            'artist_count': max(1, min(users, options['products'] // 10)),
+            'products': products,
+            'content_types': {
+                product_type: content_types[model].pk for product_type, model in PRODUCT_MODELS.items()
+            },
+            'cumulative_weights': cumulative_weights,
+            'followers': followers,
+            'follow': options['follow'],
+            'items_per_cart': options['items_per_cart'],
+        }
+
+    def _create_names(self, seed, books):
+        """Authors and publishers for the catalog books, as id lists."""
+        if not books:
+            return [], []
+        authors = Author.objects.bulk_create(
+            [Author(name=f"Load Author {seed}-{number}") for number in range(max(1, books // 25))],
+            batch_size=ROW_BATCH
+        )
+        publishers = Publisher.objects.bulk_create(
+            [Publisher(name=f"Load Press {seed}-{number}") for number in range(max(1, books // 1000))],
+            batch_size=ROW_BATCH
+        )
+        return [author.pk for author in authors], [publisher.pk for publisher in publishers]
+
+    def _tasks(self, kind, count, batch_size):
+        return [
+            (kind, batch, start, min(batch_size, count - start))
+            for batch, start in enumerate(range(0, count, batch_size))
+        ]
+
+    def _clear(self, seed):
+        """Delete everything seeded with this seed."""
+        started = time.monotonic()
+        users = User.objects.filter(username__startswith=f"load-{seed}-", username__endswith='@example.com')
+        carts = ShoppingCart.objects.filter(user__in=users)
+        items = self._delete(ShoppingCartItem.objects.filter(cart__in=carts))
+        carts = self._delete(carts)
+        self.stdout.write(f"Deleted {items} cart items and {carts} carts")
+
+        licenses = 0
+        for start in range(0, 10 ** 9, ROW_BATCH):
+            ids = [seeding.seeded_id(seed, 'softwarelicense', number) for number in range(start, start + ROW_BATCH)]
+            deleted = self._delete(SoftwareLicense.objects.filter(pk__in=ids))
+            licenses += deleted
+            if not deleted:
+                break
+        # The remaining products belong to the users
+        deleted, _ = users.delete()
+        self.stdout.write(f"Deleted {licenses} software licenses, and {deleted} users and their products")
+
+        books = self._delete(CatalogBook.objects.filter(author__name__startswith=f"Load Author {seed}-"))
+        Author.objects.filter(name__startswith=f"Load Author {seed}-").delete()
+        Publisher.objects.filter(name__startswith=f"Load Press {seed}-").delete()
+        if books:
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {books} catalog books in {time.monotonic() - started:.1f}s"
+        ))
+
+    def _delete(self, queryset):
+        """
+        Delete the rows of a queryset with one DELETE statement.
+
+        QuerySet.delete() loads every row first when the model has reverse
+        relations; seeded rows have none to follow.
+        """
+        model = queryset.model
+        sql, params = queryset.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)} "
+                f"WHERE {connection.ops.quote_name(model._meta.pk.column)} IN ({sql})",
+                params
+            )
+            return cursor.rowcount
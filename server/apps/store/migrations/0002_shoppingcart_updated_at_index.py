@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['updated_at'], name='store_cart_updated_at_idx'),
+        ),
+    ]
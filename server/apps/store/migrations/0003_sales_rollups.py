@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-19 08:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('store', '0002_shoppingcart_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('object_id', models.UUIDField()),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartitem',
+            index=models.Index(fields=['updated_at'], name='store_item_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartitem',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at'], name='store_item_product_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysalesrollup',
+            index=models.Index(fields=['content_type', 'day'], name='store_rollup_type_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'content_type', 'object_id'), name='store_rollup_day_product_uniq'),
+        ),
+    ]
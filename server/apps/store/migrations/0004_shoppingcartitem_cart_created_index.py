@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 09:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_sales_rollups'),
+    ]
+
+    operations = [
+        # Create the composite index before dropping the cart_id index it replaces
+        migrations.AddIndex(
+            model_name='shoppingcartitem',
+            index=models.Index(fields=['cart', 'created_at'], name='store_item_cart_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcartitem',
+            name='cart',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='store.shoppingcart'),
+        ),
+    ]
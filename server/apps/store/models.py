@@ -3,6 +3,7 @@ from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.db.models import Sum
+from django.utils import timezone
 from apps.users.models import User
 
 
@@ -37,6 +38,14 @@ class SoftwareLicense(models.Model):
         return str(self.id)
 
 
+# Product types that can be put in a shopping cart, keyed by ContentType model name
+PRODUCT_MODELS = {
+    'book': Book,
+    'musicalbum': MusicAlbum,
+    'softwarelicense': SoftwareLicense,
+}
+
+
 class ShoppingCart(models.Model):
     """Represents a shopping cart that can contain multiple products."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -46,6 +55,10 @@ class ShoppingCart(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Used by the retention job to find stale carts oldest-first
+            models.Index(fields=['updated_at'], name='store_cart_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"Shopping Cart {self.id}"
@@ -70,6 +83,7 @@ class ShoppingCart(models.Model):
             content_type=content_type,
             object_id=product.id,
             defaults={
+                'product': product,
                 'quantity': quantity,
                 'product_price': product.price_in_euros,
                 'product_weight': product.weight_in_kilograms
@@ -78,9 +92,12 @@ class ShoppingCart(models.Model):
         
         # If item already exists, update quantity
         if not created:
+            # save() reads the product; it is already loaded
+            cart_item.product = product
             cart_item.quantity += quantity
             cart_item.save()
         
+        self.touch()
         return cart_item
     
     def remove_product(self, product, quantity=1):
@@ -103,25 +120,43 @@ class ShoppingCart(models.Model):
                 object_id=product.id
             )
             
+            cart_item.product = product
+            
             # If removing all or more, delete the item
             if cart_item.quantity <= quantity:
                 cart_item.delete()
-                return True
             else:
                 # Reduce quantity
                 cart_item.quantity -= quantity
                 cart_item.save()
-                return True
+            self.touch()
+            return True
         except ShoppingCartItem.DoesNotExist:
             return False
     
+    def touch(self):
+        """
+        Bump updated_at after the cart's items changed.
+        
+        The cart's updated_at is its ETag / Last-Modified validator, so every
+        change to its items must move it.
+        """
+        self.updated_at = timezone.now()
+        ShoppingCart.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+    
     def calculate_total_price(self):
         """
         Calculate the total price of all items in the shopping cart.
         
+        Uses the prefetched items when available instead of querying again.
+        
         Returns:
             decimal.Decimal: Total price in euros
         """
+        items = self._get_prefetched_items()
+        if items is not None:
+            return sum(item.get_subtotal_price() for item in items)
+        
         total = self.items.aggregate(
             total=Sum(models.F('quantity') * models.F('product_price'))
         )['total']
@@ -131,14 +166,24 @@ class ShoppingCart(models.Model):
         """
         Calculate the total weight of all items in the shopping cart.
         
+        Uses the prefetched items when available instead of querying again.
+        
         Returns:
             decimal.Decimal: Total weight in kilograms
         """
+        items = self._get_prefetched_items()
+        if items is not None:
+            return sum(item.get_subtotal_weight() for item in items)
+        
         total = self.items.aggregate(
             total=Sum(models.F('quantity') * models.F('product_weight'))
         )['total']
         return total or 0
     
+    def _get_prefetched_items(self):
+        """Return the items loaded by prefetch_related('items'), or None."""
+        return getattr(self, '_prefetched_objects_cache', {}).get('items')
+    
     def get_total_price(self):
         """Alias for calculate_total_price for convenience."""
         return self.calculate_total_price()
@@ -151,7 +196,8 @@ class ShoppingCart(models.Model):
 class ShoppingCartItem(models.Model):
     """Represents a single item in a shopping cart."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name='items')
+    # Indexed by the composite (cart, created_at) index below
+    cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name='items', db_index=False)
     quantity = models.PositiveIntegerField(default=1)
     
     # Generic foreign key to support Book, MusicAlbum, and SoftwareLicense
@@ -169,6 +215,14 @@ class ShoppingCartItem(models.Model):
     class Meta:
         unique_together = ['cart', 'content_type', 'object_id']
         ordering = ['created_at']
+        indexes = [
+            # Used by the sales rollup job to find items changed since its watermark
+            models.Index(fields=['updated_at'], name='store_item_updated_at_idx'),
+            # A cart's items in the order they were added (cart pages, recommendations)
+            models.Index(fields=['cart', 'created_at'], name='store_item_cart_created_idx'),
+            # Used to re-aggregate a single product's items for one day
+            models.Index(fields=['content_type', 'object_id', 'created_at'], name='store_item_product_idx'),
+        ]
     
     def __str__(self):
         return f"{self.quantity}x {self.product} in cart {self.cart.id}"
@@ -197,3 +251,48 @@ class ShoppingCartItem(models.Model):
             decimal.Decimal: Subtotal weight (quantity * product_weight)
         """
         return self.quantity * self.product_weight
+
+
+class DailySalesRollup(models.Model):
+    """
+    Pre-aggregated cart item totals for one product on one day.
+    
+    Rows are maintained by the refresh_sales_rollups management command so that
+    analytics queries read thousands of rollup rows instead of scanning every
+    ShoppingCartItem.
+    """
+    day = models.DateField()
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.UUIDField()
+    
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    weight = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'content_type', 'object_id'],
+                name='store_rollup_day_product_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'day'], name='store_rollup_type_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.content_type.model}:{self.object_id}"
+
+
+class RollupWatermark(models.Model):
+    """Remembers how far an incremental job has processed its source rows."""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
@@ -0,0 +1,255 @@
+"""
+Synthetic load data, written with COPY by worker processes.
+
+Used by the seed_load_data command. Each task generates one batch of rows
+(users, catalog books, store products, or carts with their items) and
+COPYs it in one transaction on the worker's own database connection. The
+random generator is reseeded with (seed, kind, number) for every user, book,
+product and cart, so the same arguments produce the same data whatever the
+number of workers and the batch size.
+
+Product popularity is Zipfian: the n-th most popular product is added to
+carts about 1/n^s as often as the first. Items are added in a realistic
+order: after the first product, a shopper usually picks one of a few
+products that tend to follow the previous one, which is the pattern
+calculate_product_recommendations looks for.
+
+This module imports no models, so worker processes can load it (and set
+Django up in _init_worker) whatever the multiprocessing start method.
+"""
+import csv
+import io
+import random
+import uuid
+from datetime import date, timedelta
+
+# Namespace of the ids that have to be known across processes and runs
+SEED_NAMESPACE = uuid.UUID('9f1c4e37-52d6-4c1b-a0f5-7d2e8b61c0aa')
+
+USER_COLUMNS = (
+    'id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+    'is_active', 'date_joined', 'role', 'created_at', 'updated_at',
+)
+CATALOG_BOOK_COLUMNS = (
+    'name', 'author_id', 'publisher_id', 'publication_date', 'isbn', 'cover_sha256', 'updated_at',
+)
+PRODUCT_COLUMNS = {
+    'book': ('id', 'title', 'author_id', 'number_of_pages', 'price_in_euros', 'weight_in_kilograms'),
+    'musicalbum': ('id', 'artist_id', 'number_of_tracks', 'price_in_euros', 'weight_in_kilograms'),
+    'softwarelicense': ('id', 'price_in_euros', 'weight_in_kilograms'),
+}
+CART_COLUMNS = ('id', 'user_id', 'created_at', 'updated_at')
+ITEM_COLUMNS = (
+    'id', 'cart_id', 'content_type_id', 'object_id', 'quantity', 'product_price', 'product_weight',
+    'created_at', 'updated_at',
+)
+TITLE_WORDS = (
+    'the', 'night', 'river', 'garden', 'stone', 'history', 'ocean', 'silent', 'code', 'machine', 'learning',
+    'war', 'peace', 'kitchen', 'shadow', 'empire', 'winter', 'summer', 'dragon', 'secret', 'letters', 'journey',
+    'city', 'house', 'island', 'mountain', 'forest', 'king', 'queen', 'child', 'mother', 'father', 'love',
+    'death', 'light', 'dark', 'fire', 'water', 'earth', 'wind', 'star', 'moon', 'last', 'first', 'little',
+)
+
+# Set by _init_worker: the plan shared by every task
+_plan = None
+
+
+def seeded_id(seed, kind, number):
+    """The id of the number-th seeded row of a kind, the same in every process."""
+    return uuid.uuid5(SEED_NAMESPACE, f"{seed}:{kind}:{number}")
+
+
+def seeded_username(seed, number):
+    return f"load-{seed}-{number}@example.com"
+
+
+def zipf_cumulative_weights(count, exponent):
+    """Cumulative weights for random.choices: rank n is drawn about 1/n^exponent as often as rank 1."""
+    total = 0.0
+    weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+class _RowRandom(random.Random):
+    """A random generator restarted for every seeded row."""
+
+    def __init__(self, seed, kind):
+        super().__init__()
+        self.prefix = f"{seed}:{kind}:"
+
+    def start(self, number):
+        self.seed(self.prefix + str(number))
+
+
+def _init_worker(plan):
+    """Process pool initializer: set Django up when the process was spawned, and keep the plan."""
+    global _plan
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    _plan = plan
+
+
+def run_task(kind, batch, start, count):
+    """
+    Generate and COPY one batch.
+
+    Args:
+        kind: 'users', 'books', 'products' or 'carts'
+        batch: Batch number, for progress reports
+        start: Number of the first row (user, book, product or cart) of the batch
+        count: Number of rows
+
+    Returns:
+        tuple: (kind, batch, {table: rows written})
+    """
+    from django.db import connection, transaction
+
+    tables = globals()[f"_{kind}_rows"](_RowRandom(_plan['seed'], kind), start, count)
+    written = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, columns, rows in tables:
+            written[table] = copy_rows(cursor, table, columns, rows)
+    return kind, batch, written
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    COPY rows (tuples in column order) into a table and return the row count.
+
+    Empty strings are stored as such: NULL is spelled \\N, which no seeded
+    value is.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+    )
+    return count
+
+
+def _users_rows(rng, start, count):
+    plan = _plan
+    seed = plan['seed']
+    rows = []
+    for number in range(start, start + count):
+        rng.start(number)
+        joined = _timestamp(plan, rng.random()).isoformat()
+        username = seeded_username(seed, number)
+        rows.append((
+            seeded_id(seed, 'user', number), plan['password'], False, username, '', '', username, False,
+            True, joined, 'CUSTOMER', joined, joined,
+        ))
+    return [(plan['tables']['user'], USER_COLUMNS, rows)]
+
+
+def _books_rows(rng, start, count):
+    plan = _plan
+    authors = plan['author_ids']
+    author_weights = plan['author_weights']
+    publishers = plan['publisher_ids']
+    now = _timestamp(plan, 1.0).isoformat()
+    rows = []
+    for number in range(start, start + count):
+        rng.start(number)
+        title = ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 5))).capitalize()
+        author = rng.choices(authors, cum_weights=author_weights)[0]
+        published = date(1900, 1, 1) + timedelta(days=rng.randrange(45000))
+        rows.append((
+            title, author, rng.choice(publishers), published.isoformat(),
+            f"{plan['isbn_prefix']}{number:09d}", '', now,
+        ))
+    return [(plan['tables']['catalog_book'], CATALOG_BOOK_COLUMNS, rows)]
+
+
+def _products_rows(rng, start, count):
+    plan = _plan
+    seed = plan['seed']
+    artists = plan['artist_count']
+    rows = {product_type: [] for product_type in PRODUCT_COLUMNS}
+    for number in range(start, start + count):
+        rng.start(number)
+        product_type, object_id, price, weight = plan['products'][number]
+        artist = seeded_id(seed, 'user', rng.randrange(artists))
+        if product_type == 'book':
+            title = ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 4))).capitalize()
+            row = (object_id, title, artist, rng.randint(60, 1200), price, weight)
+        elif product_type == 'musicalbum':
+            row = (object_id, artist, rng.randint(4, 24), price, weight)
+        else:
+            row = (object_id, price, weight)
+        rows[product_type].append(row)
+    return [
+        (plan['tables'][product_type], PRODUCT_COLUMNS[product_type], product_rows)
+        for product_type, product_rows in rows.items() if product_rows
+    ]
+
+
+def _carts_rows(rng, start, count):
+    """Carts start..start+count-1, cart n owned by user n, with their items in add order."""
+    plan = _plan
+    seed = plan['seed']
+    products = plan['products']
+    content_types = plan['content_types']
+    cumulative_weights = plan['cumulative_weights']
+    followers = plan['followers']
+    follow = plan['follow']
+    low, high = plan['items_per_cart']
+    population = range(len(products))
+    carts = []
+    items = []
+
+    for number in range(start, start + count):
+        rng.start(number)
+        cart_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        # Skewed towards small carts, like real ones
+        size = min(high, int(rng.triangular(low, high + 1, low)))
+        added_at = _timestamp(plan, rng.random())
+        chosen = set()
+        previous = None
+
+        for _ in range(size):
+            if previous is not None and rng.random() < follow:
+                product = rng.choice(followers[previous])
+            else:
+                product = rng.choices(population, cum_weights=cumulative_weights)[0]
+            if product in chosen:
+                # One item per product and cart; a shopper adding it again raises the quantity instead
+                product = rng.choices(population, cum_weights=cumulative_weights)[0]
+                if product in chosen:
+                    continue
+            chosen.add(product)
+            previous = product
+
+            added_at += timedelta(seconds=rng.randint(5, 900))
+            product_type, object_id, price, weight = products[product]
+            roll = rng.random()
+            quantity = 1 if roll < 0.8 else 2 if roll < 0.95 else 3
+            timestamp = added_at.isoformat()
+            items.append((
+                uuid.UUID(int=rng.getrandbits(128), version=4), cart_id, content_types[product_type],
+                object_id, quantity, price, weight, timestamp, timestamp,
+            ))
+
+        # Opened when its first item was added, updated with its last one
+        opened_at = items[-len(chosen)][7] if chosen else added_at.isoformat()
+        carts.append((cart_id, seeded_id(seed, 'user', number), opened_at, added_at.isoformat()))
+
+    return [
+        (plan['tables']['cart'], CART_COLUMNS, carts),
+        (plan['tables']['item'], ITEM_COLUMNS, items),
+    ]
+
+
+def _timestamp(plan, fraction):
+    """A moment in the seeded period, fraction 0.0 being its start and 1.0 its end."""
+    return plan['started_at'] + (plan['ended_at'] - plan['started_at']) * fraction
@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from .models import ShoppingCart, ShoppingCartItem, Book, MusicAlbum, SoftwareLicense
+from django.db import models
+from project.streaming import FEED_FORMATS
+from .models import ShoppingCart, ShoppingCartItem, Book, MusicAlbum, SoftwareLicense, DailySalesRollup
 
 
 class ProductSerializer(serializers.Serializer):
@@ -71,8 +74,24 @@ class ShoppingCartItemSerializer(serializers.ModelSerializer):
         return obj.content_type.model
 
 
+class ShoppingCartListSerializer(serializers.ListSerializer):
+    """Serializes many carts with their items loaded for all of them at once."""
+    
+    def to_representation(self, data):
+        # Imported here: services imports this module
+        from .services import prefetch_cart_items
+        
+        carts = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return super().to_representation(prefetch_cart_items(carts))
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Serializer for shopping carts."""
+    """
+    Serializer for shopping carts.
+    
+    Items, their content types and products are loaded with a fixed number
+    of queries (see prefetch_cart_items), whatever the size of the cart.
+    """
     items = ShoppingCartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
     total_weight = serializers.SerializerMethodField()
@@ -91,6 +110,13 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             'updated_at',
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        list_serializer_class = ShoppingCartListSerializer
+    
+    def to_representation(self, instance):
+        if not isinstance(self.parent, ShoppingCartListSerializer):
+            from .services import prefetch_cart_items
+            prefetch_cart_items([instance])
+        return super().to_representation(instance)
     
     def get_total_price(self, obj):
         return str(obj.calculate_total_price())
@@ -192,3 +218,70 @@ class ProductRecommendationSerializer(serializers.Serializer):
     most_common_previous_product_type = serializers.CharField(allow_null=True)
     most_common_previous_product_name = serializers.CharField(allow_null=True)
     occurrence_count = serializers.IntegerField()
+
+
+class DailySalesRollupSerializer(serializers.ModelSerializer):
+    """Serializer for one day of pre-aggregated sales for a product."""
+    product_type = serializers.CharField(source='content_type.model', read_only=True)
+    product_id = serializers.UUIDField(source='object_id', read_only=True)
+    
+    class Meta:
+        model = DailySalesRollup
+        fields = [
+            'day',
+            'product_type',
+            'product_id',
+            'quantity',
+            'revenue',
+            'weight',
+            'item_count',
+        ]
+
+
+# Range of the integer columns, so out-of-range values are row errors rather
+# than a database error aborting the whole chunk
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class ProductFeedSerializer(serializers.Serializer):
+    """
+    Validates one row of a supplier catalog feed.
+    
+    Only checks the row itself (no database access), so whole chunks of rows
+    can be validated quickly; referenced users are checked per chunk.
+    """
+    id = serializers.UUIDField()
+    price_in_euros = serializers.DecimalField(max_digits=10, decimal_places=2)
+    weight_in_kilograms = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class BookFeedSerializer(ProductFeedSerializer):
+    """Feed row for a Book."""
+    title = serializers.CharField(max_length=255)
+    author_id = serializers.UUIDField()
+    number_of_pages = serializers.IntegerField(min_value=INT32_MIN, max_value=INT32_MAX)
+
+
+class MusicAlbumFeedSerializer(ProductFeedSerializer):
+    """Feed row for a MusicAlbum."""
+    artist_id = serializers.UUIDField()
+    number_of_tracks = serializers.IntegerField(min_value=INT32_MIN, max_value=INT32_MAX)
+
+
+class SoftwareLicenseFeedSerializer(ProductFeedSerializer):
+    """Feed row for a SoftwareLicense."""
+
+
+class CatalogFeedUploadSerializer(serializers.Serializer):
+    """Serializer for uploading a catalog feed file."""
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(
+        choices=FEED_FORMATS,
+        required=False,
+        help_text="'csv' or 'ndjson' (detected from the file name when omitted)"
+    )
+    chunk_size = serializers.IntegerField(
+        min_value=100,
+        max_value=50000,
+        default=settings.CATALOG_FEED_CHUNK_SIZE
+    )
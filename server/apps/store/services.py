@@ -1,18 +1,64 @@
 """
 Service layer for store app business logic.
 """
+import gzip
+import json
+import os
+import time
 from collections import defaultdict, Counter
-from .models import Book, MusicAlbum, SoftwareLicense
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
+from apps.users.models import User
+from project.metrics import RECOMMENDATION_SECONDS
+from project.streaming import chunked
+from .models import (
+    Book, MusicAlbum, SoftwareLicense, ShoppingCart, ShoppingCartItem,
+    DailySalesRollup, RollupWatermark, PRODUCT_MODELS
+)
+from .serializers import BookFeedSerializer, MusicAlbumFeedSerializer, SoftwareLicenseFeedSerializer
 
+SALES_ROLLUP_WATERMARK = 'daily_sales'
 
-def calculate_product_recommendations(carts):
+# Feed row serializer and referenced user field for each product type
+FEED_SERIALIZERS = {
+    Book: BookFeedSerializer,
+    MusicAlbum: MusicAlbumFeedSerializer,
+    SoftwareLicense: SoftwareLicenseFeedSerializer,
+}
+FEED_USER_FIELDS = {
+    Book: 'author_id',
+    MusicAlbum: 'artist_id',
+}
+
+# Related objects needed to display each product type (see ProductSerializer)
+PRODUCT_SELECT_RELATED = {
+    Book: ['author'],
+    MusicAlbum: ['artist'],
+}
+
+
+@RECOMMENDATION_SECONDS.time()
+def calculate_product_recommendations(carts, product_keys=None, known_products=None):
     """
     Calculate product recommendations based on the order products are added to carts.
     
     For each product, finds the most common product that was added before it.
+    All cart items are read with a single ordered query (streamed with a
+    server-side cursor), and product names are then looked up with one query
+    per product type.
     
     Args:
         carts: QuerySet or list of ShoppingCart instances
+        product_keys: Optional iterable of 'product_type:product_id' keys. When
+            given, only these products get recommendations and only carts
+            containing at least one of them are read.
+        known_products: Optional dict of product key to an already loaded
+            product instance, used instead of querying for its name
         
     Returns:
         dict: Dictionary mapping product identifiers to recommendation data
@@ -28,95 +74,194 @@ def calculate_product_recommendations(carts):
             }
         }
     """
+    items = ShoppingCartItem.objects.filter(cart__in=carts)
+    
+    if product_keys is not None:
+        product_keys = set(product_keys)
+        product_filter = _product_keys_filter(product_keys)
+        if product_filter is None:
+            return {}
+        items = items.filter(
+            cart__in=ShoppingCartItem.objects.filter(product_filter).values('cart_id')
+        )
+    
+    rows = (
+        items.order_by('cart_id', 'created_at')
+        .values_list('cart_id', 'content_type__model', 'object_id')
+    )
+    
     # Dictionary to track (previous_product, current_product) pairs and their counts
     product_sequences = defaultdict(Counter)
     
-    # Process each cart
-    for cart in carts:
-        # Get all items ordered by created_at (order they were added)
-        items = cart.items.select_related('content_type').order_by('created_at').all()
-        
-        if not items:
-            continue
-        
-        # Convert items to list for easier iteration
-        items_list = list(items)
-        
-        # Track sequences: for each item (except first), record what came before it
-        for i in range(1, len(items_list)):
-            current_item = items_list[i]
-            previous_item = items_list[i - 1]
-            
-            # Create unique keys for products
-            previous_key = f"{previous_item.content_type.model}:{previous_item.object_id}"
-            current_key = f"{current_item.content_type.model}:{current_item.object_id}"
-            
-            # Increment count for this sequence
+    # Items arrive grouped by cart in the order they were added, so each item
+    # only needs to be compared with the one right before it.
+    previous_cart = previous_key = None
+    for cart_id, product_type, object_id in rows.iterator(chunk_size=2000):
+        current_key = f"{product_type}:{object_id}"
+        if cart_id == previous_cart and (product_keys is None or current_key in product_keys):
             product_sequences[current_key][previous_key] += 1
+        previous_cart, previous_key = cart_id, current_key
+    
+    # Find the most common previous product for each product
+    most_common = {
+        current_key: previous_counts.most_common(1)[0]
+        for current_key, previous_counts in product_sequences.items()
+        if previous_counts
+    }
+    
+    # Get product names for every product involved, one query per type
+    known_products = known_products or {}
+    names = {key: _get_product_name(product) for key, product in known_products.items()}
+    names.update(_get_product_names(
+        (set(most_common) | {previous_key for previous_key, _ in most_common.values()})
+        - set(known_products)
+    ))
     
     # Build recommendation results
     recommendations = {}
     
-    for current_key, previous_counts in product_sequences.items():
-        if not previous_counts:
-            continue
-        
-        # Find the most common previous product
-        most_common_previous_key, occurrence_count = previous_counts.most_common(1)[0]
-        
-        # Parse current product info
+    for current_key, (most_common_previous_key, occurrence_count) in most_common.items():
         current_type, current_id = current_key.split(':')
-        
-        # Parse previous product info
         prev_type, prev_id = most_common_previous_key.split(':')
         
-        # Get product instances for names
-        current_product = None
-        previous_product = None
-        try:
-            current_product = _get_product_by_type_and_id(current_type, current_id)
-            previous_product = _get_product_by_type_and_id(prev_type, prev_id)
-            
-            current_name = _get_product_name(current_product)
-            previous_name = _get_product_name(previous_product) if previous_product else None
-        except Exception:
-            current_name = f"{current_type} {current_id}"
-            previous_name = f"{prev_type} {prev_id}" if previous_product else None
-        
         recommendations[current_key] = {
             'product_id': current_id,
             'product_type': current_type,
-            'product_name': current_name,
+            'product_name': names.get(current_key),
             'most_common_previous_product_id': prev_id,
             'most_common_previous_product_type': prev_type,
-            'most_common_previous_product_name': previous_name,
+            'most_common_previous_product_name': names.get(most_common_previous_key),
             'occurrence_count': occurrence_count
         }
     
     return recommendations
 
 
-def _get_product_by_type_and_id(product_type, product_id):
+def get_product_key(item):
     """
-    Helper function to get product instance by type and id.
+    Build the 'product_type:product_id' key used by the recommendation engine.
     
     Args:
-        product_type: ContentType model name (e.g., 'book', 'musicalbum', 'softwarelicense')
-        product_id: UUID string of the product
+        item: ShoppingCartItem instance (content_type should be loaded)
         
     Returns:
-        Product instance (Book, MusicAlbum, or SoftwareLicense) or None
+        str: Product key, e.g. 'book:0b1c...'
     """
-    from django.contrib.contenttypes.models import ContentType
+    return f"{item.content_type.model}:{item.object_id}"
+
+
+def prefetch_cart_products(items):
+    """
+    Load the products of many cart items with one query per product type.
     
-    try:
-        content_type = ContentType.objects.get(model=product_type.lower())
-        model_class = content_type.model_class()
-        if model_class:
-            return model_class.objects.get(id=product_id)
-    except Exception:
-        return None
-    return None
+    Fills the generic foreign key cache of each item, so serializing
+    item.product afterwards doesn't hit the database once per item. Items
+    whose product is already loaded are left alone.
+    
+    Args:
+        items: Iterable of ShoppingCartItem instances
+        
+    Returns:
+        list: The same items, as a list
+    """
+    items = list(items)
+    product_field = ShoppingCartItem._meta.get_field('product')
+    ids_by_type = defaultdict(set)
+    for item in items:
+        if not product_field.is_cached(item):
+            ids_by_type[item.content_type_id].add(item.object_id)
+    
+    products = {}
+    for content_type_id, ids in ids_by_type.items():
+        model_class = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model_class is None:
+            continue
+        for product in _load_products(model_class, ids):
+            products[(content_type_id, product.id)] = product
+    
+    for item in items:
+        product = products.get((item.content_type_id, item.object_id))
+        if product is not None:
+            product_field.set_cached_value(item, product)
+    
+    return items
+
+
+def prefetch_cart_items(carts):
+    """
+    Load the items of many carts, with their content types and products.
+    
+    Takes one query for the items and one per product type, however many
+    carts and items there are. Carts whose items were already prefetched
+    keep them.
+    
+    Args:
+        carts: Iterable of ShoppingCart instances
+        
+    Returns:
+        list: The same carts, as a list
+    """
+    carts = list(carts)
+    prefetch_related_objects(
+        carts,
+        Prefetch('items', queryset=ShoppingCartItem.objects.select_related('content_type'))
+    )
+    prefetch_cart_products(item for cart in carts for item in cart.items.all())
+    return carts
+
+
+def _product_keys_filter(product_keys):
+    """
+    Build a Q object matching cart items for the given product keys.
+    
+    Returns:
+        Q or None: None when no key refers to a known product type
+    """
+    content_types = ContentType.objects.get_for_models(*PRODUCT_MODELS.values())
+    
+    product_filter = None
+    for key in product_keys:
+        product_type, product_id = key.split(':')
+        model_class = PRODUCT_MODELS.get(product_type)
+        if model_class is None:
+            continue
+        condition = Q(content_type_id=content_types[model_class].id, object_id=product_id)
+        product_filter = condition if product_filter is None else product_filter | condition
+    return product_filter
+
+
+def _get_product_names(product_keys):
+    """
+    Helper function to get display names for many products at once.
+    
+    Args:
+        product_keys: Iterable of 'product_type:product_id' keys
+        
+    Returns:
+        dict: Mapping of product key to human-readable name (missing products are left out)
+    """
+    ids_by_type = defaultdict(set)
+    for key in product_keys:
+        product_type, product_id = key.split(':')
+        ids_by_type[product_type].add(product_id)
+    
+    names = {}
+    for product_type, ids in ids_by_type.items():
+        model_class = PRODUCT_MODELS.get(product_type)
+        if model_class is None:
+            continue
+        for product in _load_products(model_class, ids):
+            names[f"{product_type}:{product.id}"] = _get_product_name(product)
+    return names
+
+
+def _load_products(model_class, ids):
+    """Query products of one type by id, with what is needed to display them."""
+    queryset = model_class._default_manager.filter(id__in=ids)
+    related = PRODUCT_SELECT_RELATED.get(model_class)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset
 
 
 def _get_product_name(product):
@@ -140,3 +285,338 @@ def _get_product_name(product):
         return f"License {product.id}"
     return str(product)
 
+
+def get_stale_carts(cutoff, anonymous_cutoff=None):
+    """
+    Build a queryset of carts that have seen no activity since the given cutoffs.
+    
+    A cart is stale when neither the cart itself nor any of its items has been
+    updated since the cutoff. Anonymous carts (user=None) can use a shorter,
+    separate cutoff.
+    
+    Args:
+        cutoff: datetime; carts belonging to a user untouched since then are stale
+        anonymous_cutoff: datetime for carts without a user (default: cutoff)
+        
+    Returns:
+        QuerySet: Stale ShoppingCart instances, oldest first
+    """
+    anonymous_cutoff = anonymous_cutoff or cutoff
+    
+    def recent_items(since):
+        return Exists(ShoppingCartItem.objects.filter(cart=OuterRef('pk'), updated_at__gte=since))
+    
+    # One items check per branch, each with its own cutoff
+    return ShoppingCart.objects.filter(
+        Q(user__isnull=False, updated_at__lt=cutoff) & ~recent_items(cutoff) |
+        Q(user__isnull=True, updated_at__lt=anonymous_cutoff) & ~recent_items(anonymous_cutoff)
+    ).order_by('updated_at')
+
+
+def archive_stale_carts(carts, batch_size=500, archive_path=None, sleep=0, progress=None):
+    """
+    Move stale carts and their items out of the live tables in small batches.
+    
+    Each batch runs in its own short transaction: the carts are locked with
+    SKIP LOCKED (so requests touching a cart are never blocked by the job),
+    written to the archive as one gzip member of JSON lines, flushed to disk,
+    and only then deleted. A crash between batches leaves a readable archive
+    and at most one batch still in the database.
+    
+    Args:
+        carts: QuerySet of carts to remove (see get_stale_carts)
+        batch_size: Number of carts per transaction
+        archive_path: Path of the .jsonl.gz file to append to, or None to purge
+            without archiving
+        sleep: Seconds to pause between batches to let replicas catch up
+        progress: Optional callable receiving (batch_number, carts, items)
+        
+    Returns:
+        dict: {'batches': int, 'carts': int, 'items': int}
+    """
+    totals = {'batches': 0, 'carts': 0, 'items': 0}
+    
+    while True:
+        with transaction.atomic():
+            cart_rows = list(
+                carts.select_for_update(skip_locked=True, of=('self',))
+                .values('id', 'user_id', 'created_at', 'updated_at')[:batch_size]
+            )
+            if not cart_rows:
+                break
+            
+            cart_ids = [row['id'] for row in cart_rows]
+            item_rows = list(
+                ShoppingCartItem.objects.filter(cart_id__in=cart_ids)
+                .order_by('cart_id', 'created_at')
+                .values(
+                    'id', 'cart_id', 'content_type__app_label', 'content_type__model',
+                    'object_id', 'quantity', 'product_price', 'product_weight',
+                    'created_at', 'updated_at'
+                )
+            )
+            
+            if archive_path:
+                items_by_cart = defaultdict(list)
+                for item in item_rows:
+                    items_by_cart[item.pop('cart_id')].append(item)
+                
+                # One complete gzip member per batch: the file stays valid
+                # (and zcat-able) even if the job dies halfway through.
+                with open(archive_path, 'ab') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                        for cart in cart_rows:
+                            cart['items'] = items_by_cart.get(cart['id'], [])
+                            line = json.dumps(cart, cls=DjangoJSONEncoder)
+                            archive.write(line.encode('utf-8') + b'\n')
+                    raw.flush()
+                    os.fsync(raw.fileno())
+            
+            ShoppingCartItem.objects.filter(cart_id__in=cart_ids).delete()
+            ShoppingCart.objects.filter(id__in=cart_ids).delete()
+        
+        totals['batches'] += 1
+        totals['carts'] += len(cart_rows)
+        totals['items'] += len(item_rows)
+        if progress:
+            progress(totals['batches'], len(cart_rows), len(item_rows))
+        
+        if len(cart_rows) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    
+    return totals
+
+
+def refresh_sales_rollups(full=False, reconcile_days=None):
+    """
+    Bring the DailySalesRollup table up to date with ShoppingCartItem.
+    
+    Incremental runs only re-aggregate the (day, product) groups that contain
+    an item created or updated since the last watermark. Deleted items leave
+    no trace to pick up from, so the last `reconcile_days` days are also
+    rebuilt from scratch on every run. Older days are left alone, which keeps
+    carts removed by the retention job counted in the history.
+    
+    Args:
+        full: Rebuild every rollup row from the live cart items
+        reconcile_days: Number of recent days to rebuild completely
+            (default: settings.SALES_ROLLUP_RECONCILE_DAYS)
+        
+    Returns:
+        dict: {'rebuilt': int, 'refreshed': int, 'watermark': datetime}
+    """
+    if reconcile_days is None:
+        reconcile_days = settings.SALES_ROLLUP_RECONCILE_DAYS
+    
+    # Leave recently written rows for the next run: a transaction that started
+    # before `upper` may still commit rows stamped earlier than it.
+    upper = timezone.now() - timedelta(seconds=settings.SALES_ROLLUP_LAG_SECONDS)
+    stats = {'rebuilt': 0, 'refreshed': 0, 'watermark': upper}
+    
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+            name=SALES_ROLLUP_WATERMARK
+        )
+        
+        if full or watermark.value is None:
+            DailySalesRollup.objects.all().delete()
+            stats['rebuilt'] = _aggregate_sales_rollups()
+        else:
+            if reconcile_days:
+                since = timezone.localdate() - timedelta(days=reconcile_days)
+                DailySalesRollup.objects.filter(day__gte=since).delete()
+                stats['rebuilt'] = _aggregate_sales_rollups(since=since)
+            stats['refreshed'] = _aggregate_sales_rollups(
+                changed_after=watermark.value, changed_until=upper
+            )
+        
+        watermark.value = upper
+        watermark.save()
+    
+    return stats
+
+
+def _aggregate_sales_rollups(since=None, changed_after=None, changed_until=None):
+    """
+    Upsert rollup rows aggregated from cart items in a single statement.
+    
+    Args:
+        since: Only aggregate items created on or after this date
+        changed_after / changed_until: Only aggregate the (day, product) groups
+            that have an item updated inside this window
+        
+    Returns:
+        int: Number of rollup rows written
+    """
+    qn = connection.ops.quote_name
+    items = qn(ShoppingCartItem._meta.db_table)
+    rollups = qn(DailySalesRollup._meta.db_table)
+    day = "(i.created_at AT TIME ZONE %s)::date"
+    params = [settings.TIME_ZONE]
+    
+    joins = ''
+    where = ''
+    if changed_after is not None:
+        joins = f"""
+            JOIN (
+                SELECT DISTINCT (c.created_at AT TIME ZONE %s)::date AS day, c.content_type_id, c.object_id
+                FROM {items} c
+                WHERE c.updated_at > %s AND c.updated_at <= %s
+            ) changed
+              ON changed.content_type_id = i.content_type_id
+             AND changed.object_id = i.object_id
+             AND changed.day = {day}
+        """
+        params += [settings.TIME_ZONE, changed_after, changed_until, settings.TIME_ZONE]
+    if since is not None:
+        where = "WHERE i.created_at >= %s"
+        params.append(timezone.make_aware(datetime.combine(since, datetime.min.time())))
+    
+    sql = f"""
+        INSERT INTO {rollups}
+            (day, content_type_id, object_id, quantity, revenue, weight, item_count, updated_at)
+        SELECT {day}, i.content_type_id, i.object_id,
+               SUM(i.quantity), SUM(i.quantity * i.product_price),
+               SUM(i.quantity * i.product_weight), COUNT(*), NOW()
+        FROM {items} i
+        {joins}
+        {where}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, content_type_id, object_id) DO UPDATE SET
+            quantity = EXCLUDED.quantity,
+            revenue = EXCLUDED.revenue,
+            weight = EXCLUDED.weight,
+            item_count = EXCLUDED.item_count,
+            updated_at = EXCLUDED.updated_at
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def ingest_catalog_feed(records, chunk_size=5000, on_chunk=None, max_errors=100):
+    """
+    Create or update store products from a supplier feed, one chunk at a time.
+    
+    Each chunk is validated row by row (without database access), the users
+    it references are checked with one query, and every product type in the
+    chunk is then written with a single INSERT ... ON CONFLICT (id) DO UPDATE.
+    Only one chunk is held in memory at a time.
+    
+    Args:
+        records: Iterable of (line_number, record, error) tuples, as produced
+            by project.streaming.iter_records. Each record needs a
+            'product_type' ('book', 'musicalbum' or 'softwarelicense') plus
+            the fields of that product.
+        chunk_size: Number of rows validated and written per transaction
+        on_chunk: Optional callable receiving each chunk report
+        max_errors: Maximum number of rejected rows described in the summary
+        
+    Returns:
+        dict: Totals ('rows', 'upserted', 'rejected', 'chunks', 'seconds',
+        'rows_per_second') and the first rejected rows under 'errors'
+    """
+    summary = {'rows': 0, 'upserted': 0, 'rejected': 0, 'chunks': 0, 'errors': []}
+    started = time.monotonic()
+    
+    for number, chunk in enumerate(chunked(records, chunk_size), start=1):
+        chunk_started = time.monotonic()
+        valid, rejected = _validate_feed_chunk(chunk)
+        
+        upserted = 0
+        with transaction.atomic():
+            for model_class, rows in valid.items():
+                if not rows:
+                    continue
+                model_class.objects.bulk_create(
+                    [model_class(**data) for _, data in rows.values()],
+                    batch_size=1000,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=[
+                        field.name for field in model_class._meta.concrete_fields
+                        if not field.primary_key
+                    ]
+                )
+                upserted += len(rows)
+        
+        seconds = time.monotonic() - chunk_started
+        report = {
+            'chunk': number,
+            'rows': len(chunk),
+            'upserted': upserted,
+            'rejected': len(rejected),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(len(chunk) / seconds) if seconds else None,
+        }
+        
+        summary['chunks'] += 1
+        summary['rows'] += len(chunk)
+        summary['upserted'] += upserted
+        summary['rejected'] += len(rejected)
+        for line_number, errors in rejected:
+            if len(summary['errors']) >= max_errors:
+                break
+            summary['errors'].append({'line': line_number, 'errors': errors})
+        
+        if on_chunk:
+            on_chunk(report)
+    
+    seconds = time.monotonic() - started
+    summary['seconds'] = round(seconds, 3)
+    summary['rows_per_second'] = round(summary['rows'] / seconds) if seconds else None
+    return summary
+
+
+def _validate_feed_chunk(chunk):
+    """
+    Validate the rows of one feed chunk.
+    
+    Returns:
+        tuple: ({model_class: {product_id: (line_number, data)}}, [(line_number, errors)])
+        When a product appears twice in a chunk the last row wins.
+    """
+    valid = defaultdict(dict)
+    rejected = []
+    
+    for line_number, record, error in chunk:
+        if error:
+            rejected.append((line_number, {'non_field_errors': [error]}))
+            continue
+        
+        product_type = str(record.get('product_type', '')).lower()
+        model_class = PRODUCT_MODELS.get(product_type)
+        if model_class is None:
+            rejected.append((line_number, {
+                'product_type': [f"Must be one of: {', '.join(PRODUCT_MODELS)}"]
+            }))
+            continue
+        
+        serializer = FEED_SERIALIZERS[model_class](data=record)
+        if not serializer.is_valid():
+            rejected.append((line_number, serializer.errors))
+            continue
+        
+        data = serializer.validated_data
+        valid[model_class][data['id']] = (line_number, data)
+    
+    # Check every referenced user with a single query
+    user_ids = {
+        data[field]
+        for model_class, field in FEED_USER_FIELDS.items()
+        for _, data in valid[model_class].values()
+    }
+    existing_users = set(
+        User.objects.filter(id__in=user_ids).values_list('id', flat=True)
+    ) if user_ids else set()
+    
+    for model_class, field in FEED_USER_FIELDS.items():
+        rows = valid[model_class]
+        for product_id, (line_number, data) in list(rows.items()):
+            if data[field] not in existing_users:
+                rejected.append((line_number, {field: [f"User {data[field]} does not exist."]}))
+                del rows[product_id]
+    
+    return valid, rejected
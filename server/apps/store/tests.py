@@ -1,3 +1,451 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.users.models import User
+from .models import Book, MusicAlbum, ShoppingCart, ShoppingCartItem, SoftwareLicense
+from .services import get_stale_carts
 
-# Create your tests here.
+# Tables big enough in production that a sequential scan on them is a bug
+LARGE_TABLES = {'store_shoppingcart', 'store_shoppingcartitem', 'users_user', 'books_book'}
+
+
+def create_products(owner, count):
+    """count products of every type, returned interleaved (book, album, license, book, ...)."""
+    books = Book.objects.bulk_create([
+        Book(title=f"Book {n}", author=owner, number_of_pages=100 + n,
+             price_in_euros=Decimal('12.50'), weight_in_kilograms=Decimal('0.40'))
+        for n in range(count)
+    ])
+    albums = MusicAlbum.objects.bulk_create([
+        MusicAlbum(artist=owner, number_of_tracks=10, price_in_euros=Decimal('9.99'),
+                   weight_in_kilograms=Decimal('0.10'))
+        for _ in range(count)
+    ])
+    licenses = SoftwareLicense.objects.bulk_create([
+        SoftwareLicense(price_in_euros=Decimal('49.00'), weight_in_kilograms=Decimal('0.00'))
+        for _ in range(count)
+    ])
+    return [product for products in zip(books, albums, licenses) for product in products]
+
+
+def fill_cart(cart, products):
+    content_types = ContentType.objects.get_for_models(Book, MusicAlbum, SoftwareLicense)
+    ShoppingCartItem.objects.bulk_create([
+        ShoppingCartItem(
+            cart=cart, content_type=content_types[type(product)], object_id=product.pk, quantity=2,
+            product_price=product.price_in_euros, product_weight=product.weight_in_kilograms
+        )
+        for product in products
+    ])
+
+
+def plan_nodes(plan):
+    """Every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+class QueryPlanAssertions:
+    """assertNoSeqScans for test cases that seed LARGE_TABLES with realistic sizes."""
+
+    def assertNoSeqScans(self, queries):
+        """
+        EXPLAIN every captured SELECT, UPDATE and DELETE and fail on a
+        sequential scan of a large table.
+
+        Args:
+            queries: captured_queries of a CaptureQueriesContext
+        """
+        explained = 0
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            explained += 1
+            scans = [
+                node['Relation Name'] for node in plan_nodes(plan[0]['Plan'])
+                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES
+            ]
+            self.assertFalse(
+                scans, f"Sequential scan of {', '.join(scans)} in:\n{sql}\n\n{json.dumps(plan, indent=2)}"
+            )
+        self.assertTrue(explained, 'No query was explained')
+
+
+@override_settings(BOOK_SUGGEST_PRELOAD=False)
+class ShoppingCartQueryCountTests(TestCase):
+    """
+    Every ShoppingCartViewSet action runs the same number of queries however
+    many items the cart has and however large the catalog and the other
+    carts are. QUERY_BUDGETS pins the numbers so that an extra query per
+    request shows up too.
+    """
+    SMALL_CART = 3
+    LARGE_CART = 30
+
+    # Queries per action with a cart of items of all three product types
+    QUERY_BUDGETS = {
+        'list': 6,
+        'create': 2,
+        'retrieve': 6,
+        'update': 7,
+        'partial_update': 6,
+        'destroy': 3,
+        'add-product': 11,
+        'remove-product': 9,
+        'totals': 4,
+        'my-cart': 5,
+        'clear': 4,
+        'cart-page': 6,
+        'recommendations': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper@example.com', email='shopper@example.com')
+        cls.other = User.objects.create_user(username='other@example.com', email='other@example.com')
+        cls.products = create_products(cls.other, cls.LARGE_CART)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_cart(self, size):
+        """A fresh cart of the user (their only one) with size items, in add order."""
+        ShoppingCart.objects.filter(user=self.user).delete()
+        cart = ShoppingCart.objects.create(user=self.user)
+        fill_cart(cart, self.products[:size])
+        return cart
+
+    def grow_catalog(self):
+        """More products, and other shoppers' carts full of them."""
+        products = create_products(self.other, self.LARGE_CART)
+        for start in range(0, len(products), 15):
+            fill_cart(ShoppingCart.objects.create(user=self.other), products[start:start + 15])
+
+    def assertConstantQueries(self, action, request, status=200):
+        """
+        Run request(cart) with a small cart, then with a large cart and a
+        larger catalog, and compare the queries of both.
+        """
+        counts = []
+        for size in (self.SMALL_CART, self.LARGE_CART):
+            if size == self.LARGE_CART:
+                self.grow_catalog()
+            cart = self.make_cart(size)
+            # Content types are cached for the life of the process
+            ContentType.objects.get_for_models(Book, MusicAlbum, SoftwareLicense)
+            with CaptureQueriesContext(connection) as queries:
+                response = request(cart)
+            self.assertEqual(response.status_code, status, response.content[:500])
+            counts.append(queries)
+
+        small, large = counts
+        listing = '\n'.join(query['sql'] for query in large.captured_queries)
+        self.assertEqual(
+            len(small), len(large),
+            f"{action}: {len(small)} queries with {self.SMALL_CART} items, {len(large)} with "
+            f"{self.LARGE_CART} items:\n{listing}"
+        )
+        self.assertLessEqual(
+            len(large), self.QUERY_BUDGETS[action],
+            f"{action} ran {len(large)} queries, more than its budget:\n{listing}"
+        )
+        return response
+
+    def payload(self, product):
+        return {'product_type': type(product).__name__.lower(), 'product_id': str(product.pk), 'quantity': 1}
+
+    def test_list(self):
+        response = self.assertConstantQueries('list', lambda cart: self.client.get('/api/carts/'))
+        self.assertEqual(len(response.data['results'][0]['items']), self.LARGE_CART)
+
+    def test_create(self):
+        self.assertConstantQueries('create', lambda cart: self.client.post('/api/carts/', {}), status=201)
+
+    def test_retrieve(self):
+        response = self.assertConstantQueries('retrieve', lambda cart: self.client.get(f"/api/carts/{cart.pk}/"))
+        self.assertEqual(response.data['item_count'], self.LARGE_CART)
+        self.assertEqual(response.data['items'][0]['product']['author'], str(self.other))
+
+    def test_update(self):
+        self.assertConstantQueries(
+            'update', lambda cart: self.client.put(f"/api/carts/{cart.pk}/", {'user': str(self.user.pk)})
+        )
+
+    def test_partial_update(self):
+        self.assertConstantQueries(
+            'partial_update', lambda cart: self.client.patch(f"/api/carts/{cart.pk}/", {})
+        )
+
+    def test_destroy(self):
+        self.assertConstantQueries(
+            'destroy', lambda cart: self.client.delete(f"/api/carts/{cart.pk}/"), status=204
+        )
+
+    def test_add_product(self):
+        product = self.products[-1]
+        response = self.assertConstantQueries(
+            'add-product',
+            lambda cart: self.client.post(f"/api/carts/{cart.pk}/add-product/", self.payload(product), format='json')
+        )
+        self.assertEqual(response.data['cart']['item_count'], self.LARGE_CART + 1)
+
+    def test_remove_product(self):
+        product = self.products[0]
+        response = self.assertConstantQueries(
+            'remove-product',
+            lambda cart: self.client.post(
+                f"/api/carts/{cart.pk}/remove-product/", self.payload(product), format='json'
+            )
+        )
+        self.assertEqual(response.data['cart']['items'][0]['quantity'], 1)
+
+    def test_totals(self):
+        self.assertConstantQueries('totals', lambda cart: self.client.get(f"/api/carts/{cart.pk}/totals/"))
+
+    def test_my_cart(self):
+        self.assertConstantQueries('my-cart', lambda cart: self.client.get('/api/carts/my-cart/'))
+
+    def test_clear(self):
+        self.assertConstantQueries('clear', lambda cart: self.client.delete(f"/api/carts/{cart.pk}/clear/"))
+
+    def test_cart_page(self):
+        self.assertConstantQueries('cart-page', lambda cart: self.client.get('/api/carts/cart-page/'))
+
+    def test_recommendations(self):
+        self.assertConstantQueries('recommendations', lambda cart: self.client.get('/api/carts/recommendations/'))
+
+
+@override_settings(BOOK_SUGGEST_PRELOAD=False)
+class ShoppingCartQueryPlanTests(QueryPlanAssertions, TestCase):
+    """
+    The queries of the hot cart endpoints use indexes on production-sized
+    tables: the seeded carts, items and users are large enough that the
+    planner only picks a sequential scan when no index fits.
+    """
+    CARTS = 20000
+    ITEMS_PER_CART = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper@example.com', email='shopper@example.com')
+        owner = User.objects.create_user(username='seller@example.com', email='seller@example.com')
+        cls.products = create_products(owner, 100)
+        content_types = ContentType.objects.get_for_models(Book, MusicAlbum, SoftwareLicense)
+
+        with connection.cursor() as cursor:
+            # One user and cart per row of the series, ITEMS_PER_CART items each, in SQL for speed
+            cursor.execute(
+                "INSERT INTO users_user (id, password, is_superuser, username, first_name, last_name, email, "
+                "is_staff, is_active, date_joined, role, created_at, updated_at) "
+                "SELECT gen_random_uuid(), '!', false, 'load-' || n, '', '', 'load-' || n || '@example.com', "
+                "false, true, now(), 'CUSTOMER', now(), now() FROM generate_series(1, %s) AS n",
+                [cls.CARTS]
+            )
+            cursor.execute(
+                "INSERT INTO store_shoppingcart (id, user_id, created_at, updated_at) "
+                "SELECT gen_random_uuid(), id, now() - random() * interval '365 days', now() "
+                "FROM users_user WHERE username LIKE 'load-%%'"
+            )
+            cursor.execute(
+                "INSERT INTO store_shoppingcartitem (id, cart_id, content_type_id, object_id, quantity, "
+                "product_price, product_weight, created_at, updated_at) "
+                "SELECT gen_random_uuid(), cart.id, %s, product.id, 1, product.price_in_euros, "
+                "product.weight_in_kilograms, cart.created_at + product.position * interval '1 minute', now() "
+                "FROM store_shoppingcart AS cart "
+                "CROSS JOIN LATERAL (SELECT id, price_in_euros, weight_in_kilograms, "
+                "row_number() OVER () AS position FROM store_book "
+                "ORDER BY md5(cart.id::text || store_book.id::text) LIMIT %s) AS product",
+                [content_types[Book].pk, cls.ITEMS_PER_CART]
+            )
+            for table in ('users_user', 'store_shoppingcart', 'store_shoppingcartitem'):
+                cursor.execute(f"ANALYZE {table}")
+
+        cls.cart = ShoppingCart.objects.create(user=cls.user)
+        fill_cart(cls.cart, cls.products[:9])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRequestUsesIndexes(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400, response.content[:500])
+        self.assertNoSeqScans(queries.captured_queries)
+
+    def payload(self, product):
+        return {'product_type': type(product).__name__.lower(), 'product_id': str(product.pk)}
+
+    def test_items_by_cart_in_add_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(ShoppingCartItem.objects.filter(cart=self.cart).order_by('created_at'))
+        self.assertNoSeqScans(queries.captured_queries)
+
+    def test_carts_by_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(ShoppingCart.objects.filter(user=self.user))
+        self.assertNoSeqScans(queries.captured_queries)
+
+    def test_list(self):
+        self.assertRequestUsesIndexes('get', '/api/carts/')
+
+    def test_retrieve(self):
+        self.assertRequestUsesIndexes('get', f"/api/carts/{self.cart.pk}/")
+
+    def test_my_cart(self):
+        self.assertRequestUsesIndexes('get', '/api/carts/my-cart/')
+
+    def test_totals(self):
+        self.assertRequestUsesIndexes('get', f"/api/carts/{self.cart.pk}/totals/")
+
+    def test_add_product(self):
+        self.assertRequestUsesIndexes('post', f"/api/carts/{self.cart.pk}/add-product/", self.payload(self.products[20]))
+
+    def test_remove_product(self):
+        self.assertRequestUsesIndexes('post', f"/api/carts/{self.cart.pk}/remove-product/", self.payload(self.products[0]))
+
+    def test_cart_page(self):
+        self.assertRequestUsesIndexes('get', '/api/carts/cart-page/')
+
+    def test_recommendations(self):
+        self.assertRequestUsesIndexes('get', '/api/carts/recommendations/')
+
+
+class ShoppingCartConditionalGetTests(TestCase):
+    """ETag / Last-Modified answers of the cart detail."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper@example.com', email='shopper@example.com')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_malformed_id_is_not_found(self):
+        response = self.client.get('/api/carts/current/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_cart_is_not_modified(self):
+        cart = ShoppingCart.objects.create(user=self.user)
+        etag = self.client.get(f"/api/carts/{cart.pk}/")['ETag']
+        response = self.client.get(f"/api/carts/{cart.pk}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class CatalogFeedUploadTests(TestCase):
+    """Malformed feed uploads are client errors, not server errors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff@example.com', email='staff@example.com', is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, name, content):
+        return self.client.post('/api/store/catalog-feed/', {'file': SimpleUploadedFile(name, content)})
+
+    def test_unreadable_files(self):
+        files = {
+            'not gzip': ('feed.csv.gz', b'product_type,id\n'),
+            'truncated gzip': ('feed.csv.gz', gzip.compress(b'product_type,id\n' * 100)[:40]),
+            'not utf-8': ('feed.csv', 'product_type,title\nbook,Caf\xe9\n'.encode('latin-1')),
+            'oversized field': ('feed.csv', b'product_type,title\nbook,"' + b'x' * (csv.field_size_limit() + 1) + b'"\n'),
+        }
+        for name, (filename, content) in files.items():
+            with self.subTest(name):
+                response = self.upload(filename, content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('file', response.data)
+
+    def test_out_of_range_integers_are_rejected_rows(self):
+        rows = [
+            {'product_type': 'book', 'id': str(uuid.uuid4()), 'title': 'Big', 'author_id': str(self.staff.pk),
+             'number_of_pages': pages, 'price_in_euros': '10.00', 'weight_in_kilograms': '0.50'}
+            for pages in (2 ** 31, 300)
+        ]
+        content = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+        response = self.upload('feed.ndjson', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['upserted'], response.data['rejected']), (1, 1))
+        self.assertIn('number_of_pages', response.data['errors'][0]['errors'])
+
+
+class StaleCartTests(TestCase):
+    """get_stale_carts applies each cutoff to its own kind of cart, items included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper@example.com', email='shopper@example.com')
+        cls.product = create_products(cls.user, 1)[0]
+
+    def cart(self, user, cart_age, item_age=None):
+        now = timezone.now()
+        cart = ShoppingCart.objects.create(user=user)
+        if item_age is not None:
+            fill_cart(cart, [self.product])
+            ShoppingCartItem.objects.filter(cart=cart).update(updated_at=now - timedelta(days=item_age))
+        ShoppingCart.objects.filter(pk=cart.pk).update(updated_at=now - timedelta(days=cart_age))
+        return cart
+
+    def test_cutoffs(self):
+        carts = {
+            'anonymous, items idle 60 days': (self.cart(None, 100, item_age=60), True),
+            'anonymous, items touched 10 days ago': (self.cart(None, 100, item_age=10), False),
+            'user, items idle 60 days': (self.cart(self.user, 100, item_age=60), False),
+            'user, items idle 100 days': (self.cart(self.user, 100, item_age=100), True),
+            'anonymous, empty': (self.cart(None, 60), True),
+        }
+        now = timezone.now()
+        stale = set(get_stale_carts(now - timedelta(days=90), now - timedelta(days=30)).values_list('pk', flat=True))
+        for name, (cart, expected) in carts.items():
+            with self.subTest(name):
+                self.assertEqual(cart.pk in stale, expected)
+
+
+class CartPageTests(TestCase):
+    """my-cart and the cart page pick the same cart, however many the user owns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper@example.com', email='shopper@example.com')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_creates_a_cart(self):
+        response = self.client.get('/api/carts/cart-page/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(str(ShoppingCart.objects.get(user=self.user).pk), str(response.data['cart']['id']))
+
+    def test_latest_of_several_carts(self):
+        older = ShoppingCart.objects.create(user=self.user)
+        latest = ShoppingCart.objects.create(user=self.user)
+        ShoppingCart.objects.filter(pk=older.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        response = self.client.get('/api/carts/cart-page/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(response.data['cart']['id']), str(latest.pk))
+        response = self.client.get('/api/carts/my-cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(response.data['id']), str(latest.pk))
@@ -1,8 +1,10 @@
-from .views import ShoppingCartViewSet
+from .views import ShoppingCartViewSet, SalesAnalyticsViewSet, CatalogFeedViewSet
 from rest_framework_nested import routers
 
 router = routers.SimpleRouter()
 router.register('carts', ShoppingCartViewSet, 'cart')
+router.register('store/analytics', SalesAnalyticsViewSet, 'sales-analytics')
+router.register('store/catalog-feed', CatalogFeedViewSet, 'catalog-feed')
 
 urlpatterns = router.urls
 
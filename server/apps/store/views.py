@@ -1,18 +1,32 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import ShoppingCart
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from django.db.models import Sum
+from django_filters.rest_framework import DjangoFilterBackend
+from .filters import DailySalesRollupFilter
+from .models import ShoppingCart, DailySalesRollup
 from .serializers import (
     ShoppingCartSerializer,
     AddProductSerializer,
     RemoveProductSerializer,
-    ProductRecommendationSerializer
+    ProductRecommendationSerializer,
+    DailySalesRollupSerializer,
+    CatalogFeedUploadSerializer
 )
-from .services import calculate_product_recommendations
+from .services import (
+    calculate_product_recommendations,
+    get_product_key,
+    prefetch_cart_items,
+    ingest_catalog_feed
+)
+from project.conditional import ConditionalGetMixin
+from project.streaming import FeedReadError, detect_format, iter_records, open_text
 
 
-class ShoppingCartViewSet(viewsets.ModelViewSet):
+class ShoppingCartViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing shopping carts.
     
@@ -22,18 +36,26 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
     - Add products to cart
     - Remove products from cart
     - Get cart totals
+    
+    List and detail responses carry ETag / Last-Modified validators based on
+    the carts' updated_at, which every item change bumps (see
+    ShoppingCart.touch). The ETags are weak because embedded product details
+    can change without the cart changing.
     """
     serializer_class = ShoppingCartSerializer
     permission_classes = [IsAuthenticated]
     tags = ['Shopping Cart']
+    weak_etag = True
+    conditional_cache_control = {'private': True, 'no_cache': True}
+    conditional_vary = ('Authorization', 'Cookie')
     
     def get_queryset(self):
         """Return shopping carts for the authenticated user."""
-        return ShoppingCart.objects.filter(user=self.request.user)
+        return ShoppingCart.objects.filter(user_id=self.request.user.pk)
     
     def perform_create(self, serializer):
         """Automatically assign the cart to the authenticated user."""
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.pk)
     
     @action(detail=True, methods=['post'], url_path='add-product')
     def add_product(self, request, pk=None):
@@ -126,9 +148,7 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
         """
         Get or create the current user's active shopping cart.
         """
-        cart, created = ShoppingCart.objects.get_or_create(
-            user=request.user
-        )
+        cart, created = self._get_current_cart(request)
         
         serializer = self.get_serializer(cart)
         return Response(
@@ -143,6 +163,7 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
         """
         cart = self.get_object()
         cart.items.all().delete()
+        cart.touch()
         
         serializer = self.get_serializer(cart)
         return Response(
@@ -153,6 +174,47 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
     
+    @action(detail=False, methods=['get'], url_path='cart-page')
+    def get_cart_page(self, request):
+        """
+        Everything needed to render the cart page in a single round trip.
+        
+        Returns the current user's active cart (their most recently updated
+        one, created if they have none), its totals, and recommendations for
+        just the products in that cart. Items and their products are loaded
+        once and shared by all three parts.
+        
+        Query Parameters:
+        - user_id / all_users: Same as the recommendations endpoint
+        """
+        cart, created = self._get_current_cart(request)
+        
+        prefetch_cart_items([cart])
+        items = list(cart.items.all())
+        
+        recommendations = []
+        if items:
+            cart_products = {get_product_key(item): item.product for item in items}
+            recommendations_dict = calculate_product_recommendations(
+                self._get_recommendation_carts(request),
+                product_keys=cart_products.keys(),
+                known_products=cart_products
+            )
+            recommendations = list(recommendations_dict.values())
+        
+        return Response(
+            {
+                'cart': ShoppingCartSerializer(cart).data,
+                'totals': {
+                    'total_price': str(cart.calculate_total_price()),
+                    'total_weight': str(cart.calculate_total_weight()),
+                    'item_count': len(items),
+                },
+                'recommendations': ProductRecommendationSerializer(recommendations, many=True).data,
+            },
+            status=status.HTTP_200_OK if not created else status.HTTP_201_CREATED
+        )
+    
     @action(detail=False, methods=['get'], url_path='recommendations')
     def get_recommendations(self, request):
         """
@@ -166,19 +228,7 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
         - user_id (optional): Filter recommendations based on a specific user's carts
         - all_users (optional): If true, analyze all carts (admin only)
         """
-        # Get carts to analyze
-        user_id = request.query_params.get('user_id')
-        all_users = request.query_params.get('all_users', 'false').lower() == 'true'
-        
-        if all_users and request.user.is_staff:
-            # Admin can view all carts
-            carts = ShoppingCart.objects.prefetch_related('items__content_type').all()
-        elif user_id and (request.user.is_staff or str(request.user.id) == user_id):
-            # User can view their own carts or admin can view any user's carts
-            carts = ShoppingCart.objects.prefetch_related('items__content_type').filter(user_id=user_id)
-        else:
-            # Default: user's own carts
-            carts = ShoppingCart.objects.prefetch_related('items__content_type').filter(user=request.user)
+        carts = self._get_recommendation_carts(request)
         
         # Calculate recommendations
         recommendations_dict = calculate_product_recommendations(carts)
@@ -194,3 +244,165 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
             'total_carts_analyzed': carts.count(),
             'total_recommendations': len(recommendations_list)
         }, status=status.HTTP_200_OK)
+    
+    def _get_current_cart(self, request):
+        """
+        The user's active cart: their most recently updated one, created if
+        they have none. Users can own several carts (POST /api/carts/).
+        
+        Returns:
+            tuple: (cart, created)
+        """
+        cart = ShoppingCart.objects.filter(user_id=request.user.pk).order_by('-updated_at').first()
+        if cart is not None:
+            return cart, False
+        return ShoppingCart.objects.create(user_id=request.user.pk), True
+    
+    def _get_recommendation_carts(self, request):
+        """
+        Carts to learn recommendations from, based on the query parameters.
+        
+        - all_users=true: every cart (staff only)
+        - user_id=<uuid>: that user's carts (staff, or the user themselves)
+        - otherwise: the authenticated user's own carts
+        """
+        user_id = request.query_params.get('user_id')
+        all_users = request.query_params.get('all_users', 'false').lower() == 'true'
+        
+        if all_users and request.user.is_staff:
+            # Admin can view all carts
+            return ShoppingCart.objects.all()
+        elif user_id and (request.user.is_staff or str(request.user.id) == user_id):
+            # User can view their own carts or admin can view any user's carts
+            return ShoppingCart.objects.filter(user_id=user_id)
+        # Default: user's own carts
+        return ShoppingCart.objects.filter(user_id=request.user.pk)
+
+
+class SalesAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to the daily sales rollups (staff only).
+    
+    Provides endpoints to:
+    - List rollup rows (one per day and product), filtered by date range and product
+    - Summarise the filtered rollups by day, product type or product
+    
+    The rollups are refreshed by the refresh_sales_rollups management command,
+    so these endpoints never aggregate raw cart items.
+    """
+    queryset = DailySalesRollup.objects.select_related('content_type')
+    serializer_class = DailySalesRollupSerializer
+    permission_classes = [IsAdminUser]
+    tags = ['Sales Analytics']
+    
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = DailySalesRollupFilter
+    ordering_fields = ['day', 'quantity', 'revenue', 'weight']
+    ordering = ['-day', 'id']
+    
+    summary_groups = {
+        'day': ['day'],
+        'product_type': ['content_type__model'],
+        'product': ['content_type__model', 'object_id'],
+    }
+    summary_labels = {
+        'content_type__model': 'product_type',
+        'object_id': 'product_id',
+    }
+    
+    @action(detail=False, methods=['get'], url_path='summary')
+    def summary(self, request):
+        """
+        Sum quantity, revenue and weight over the filtered rollups.
+        
+        Query Parameters:
+        - group_by: 'day', 'product_type' (default) or 'product'
+        - start / end: Inclusive date range (YYYY-MM-DD)
+        - product_type / product_id: Restrict to one type or product
+        """
+        group_by = request.query_params.get('group_by', 'product_type')
+        if group_by not in self.summary_groups:
+            return Response(
+                {'group_by': f"Must be one of: {', '.join(self.summary_groups)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        fields = self.summary_groups[group_by]
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .values(*fields)
+            .annotate(
+                quantity=Sum('quantity'),
+                revenue=Sum('revenue'),
+                weight=Sum('weight'),
+                item_count=Sum('item_count'),
+            )
+            .order_by(*fields)
+        )
+        
+        rows = []
+        for row in self.paginate_queryset(queryset):
+            entry = {self.summary_labels.get(field, field): row[field] for field in fields}
+            entry.update({
+                'quantity': row['quantity'],
+                'revenue': str(row['revenue']),
+                'weight': str(row['weight']),
+                'item_count': row['item_count'],
+            })
+            rows.append(entry)
+        return self.get_paginated_response(rows)
+
+
+class CatalogFeedViewSet(viewsets.ViewSet):
+    """
+    Bulk upload of supplier catalog feeds (staff only).
+    
+    Accepts a CSV or NDJSON file (optionally gzipped) and creates or updates
+    Book, MusicAlbum and SoftwareLicense rows in chunks. Very large feeds are
+    better loaded with the import_catalog_feed management command, which
+    isn't bound by request timeouts.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    serializer_class = CatalogFeedUploadSerializer
+    tags = ['Catalog Feed']
+    
+    def create(self, request):
+        """
+        Import a feed file.
+        
+        Expected multipart payload:
+        - file: The feed (.csv, .ndjson/.jsonl, optionally .gz)
+        - file_format (optional): 'csv' or 'ndjson'
+        - chunk_size (optional): Rows per chunk
+        
+        Returns the import totals, per-chunk throughput and the first rejected rows.
+        """
+        serializer = CatalogFeedUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        upload = serializer.validated_data['file']
+        feed_format = serializer.validated_data.get('file_format') or detect_format(upload.name)
+        if feed_format is None:
+            return Response(
+                {'file_format': ['Could not detect the feed format from the file name.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chunks = []
+        try:
+            summary = ingest_catalog_feed(
+                iter_records(open_text(upload.file, filename=upload.name), feed_format),
+                chunk_size=serializer.validated_data['chunk_size'],
+                on_chunk=chunks.append
+            )
+        except FeedReadError as exc:
+            # Chunks before the unreadable part are already written
+            return Response(
+                {'file': [str(exc)], 'chunk_reports': chunks},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        summary['chunk_reports'] = chunks
+        
+        return Response(summary, status=status.HTTP_200_OK)
@@ -0,0 +1,123 @@
+"""
+Stateless JWT authentication.
+
+Access tokens carry the user's id, role and staff flags as claims, so an
+authenticated request builds a ClaimsUser from the token instead of loading
+the User row. What a token cannot know is whether the user was deactivated,
+deleted or lost a role after it was issued; that is checked against a small
+per-user state cached for JWT_REVOCATION_CACHE_SECONDS and cleared whenever
+the user is saved or deleted (in every worker only when they share the cache).
+
+Tokens issued before the claims existed still authenticate, through the
+regular database lookup.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from project.metrics import record_cache
+from .models import Roles, User
+
+# Claims copied from the user into every token; the revocation check compares them too
+USER_CLAIMS = ('role', 'is_staff', 'is_superuser')
+
+
+def get_tokens_for_user(user):
+    """
+    Issue a refresh/access token pair carrying the user's claims.
+
+    Args:
+        user: The authenticated User
+
+    Returns:
+        RefreshToken: Its access_token carries the same claims
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.get_username()
+    for claim in USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+def user_state_key(user_id):
+    return f"users:auth-state:{user_id}"
+
+
+def get_user_state(user_id):
+    """
+    Return the revocation-relevant columns of a user, cached briefly.
+
+    Returns:
+        dict or None: is_active plus USER_CLAIMS, None when the user is gone
+    """
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    record_cache('users:auth-state', state is not None)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values('is_active', *USER_CLAIMS).first()
+        # Remember missing users too, so a deleted user's tokens do not query every time
+        state = row or {}
+        cache.set(key, state, settings.JWT_REVOCATION_CACHE_SECONDS)
+    return state or None
+
+
+def clear_user_state(user_id):
+    cache.delete(user_state_key(user_id))
+
+
+class ClaimsUser(TokenUser):
+    """
+    A User stand-in built from token claims.
+
+    Provides what permissions and views read from request.user (id, pk,
+    is_staff, is_superuser, role and the role helpers of User) without a
+    query. Use request.user.pk for foreign keys: this is not a model instance.
+    """
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', Roles.USER)
+
+    def is_super_admin(self):
+        return self.role == Roles.SUPER_ADMIN or self.is_superuser
+
+    def is_admin_user(self):
+        return self.role in [Roles.ADMIN, Roles.SUPER_ADMIN]
+
+    def is_user(self):
+        return self.role == Roles.USER
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the token's claims instead of loading the user.
+
+    The only per-request lookup is the cached user state: a token is rejected
+    once its user is inactive or deleted, or when its claims no longer match
+    the user's role and staff flags (the user has to log in again).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            # Issued before tokens carried claims
+            return super().get_user(validated_token)
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if any(validated_token[claim] != state[claim] for claim in USER_CLAIMS):
+            raise AuthenticationFailed(_('Token is out of date, please log in again'), code='token_outdated')
+
+        return ClaimsUser(validated_token)
@@ -0,0 +1,42 @@
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Value
+from django.db.models.functions import Lower
+from .models import User
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticate with the email address, ignoring case.
+
+    The lookup is LOWER(email) = LOWER(<email>), one probe of the unique
+    users_user_email_lower_uniq index. Values without an '@' are looked up by
+    username instead (the admin login), also through a unique index. When no
+    user matches, the password is still hashed, so a miss takes as long as a
+    wrong password and doesn't reveal which emails are registered.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        identifier = email or username or kwargs.get(User.USERNAME_FIELD)
+        if not identifier or password is None:
+            return None
+
+        try:
+            user = self.get_user_by_identifier(identifier)
+        except User.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            User().set_password(password)
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user_by_identifier(self, identifier):
+        users = User._default_manager
+        if '@' not in identifier:
+            return users.get_by_natural_key(identifier)
+        # The blank-email condition matches the partial index's, so the planner can use it
+        return users.alias(email_lower=Lower('email')).exclude(email='').get(
+            email_lower=Lower(Value(identifier.strip()))
+        )
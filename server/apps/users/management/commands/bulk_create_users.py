@@ -0,0 +1,75 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.users.services import provision_users
+from project.streaming import FEED_FORMATS, detect_format, iter_records, open_text
+
+
+class Command(BaseCommand):
+    """
+    Create user accounts in bulk from a CSV or NDJSON file.
+    
+    Every row needs username and email; password, name, first_name,
+    last_name and role are optional. Passwords are hashed in a pool of
+    processes (one per CPU by default), so throughput scales with the cores
+    available. Users whose username or email already exists are skipped.
+    
+    Usage:
+        python manage.py bulk_create_users partner.csv
+        python manage.py bulk_create_users partner.ndjson.gz --workers 8
+        cat partner.ndjson | python manage.py bulk_create_users - --format ndjson
+    """
+    help = 'Bulk create users from a CSV or NDJSON file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Import file, or '-' to read from stdin")
+        parser.add_argument(
+            '--format', dest='feed_format', choices=FEED_FORMATS,
+            help='File format (detected from the file name when omitted)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.USER_IMPORT_CHUNK_SIZE,
+            help='Rows hashed and inserted together'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.USER_IMPORT_WORKERS or None,
+            help='Password hashing processes (default: one per CPU)'
+        )
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['feed_format'] or detect_format(path)
+        if feed_format is None:
+            raise CommandError('Could not detect the file format, pass --format.')
+        
+        def on_chunk(report):
+            self.stdout.write(
+                f"Chunk {report['chunk']}: {report['rows']} rows, {report['created']} created, "
+                f"{report['skipped']} skipped, {report['rejected']} rejected in {report['seconds']}s "
+                f"({report['rows_per_second']} rows/s)"
+            )
+        
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        
+        try:
+            stream = open_text(binary, filename=path)
+            summary = provision_users(
+                iter_records(stream, feed_format),
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                on_chunk=on_chunk
+            )
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+        
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {summary['rows']} rows with {summary['workers']} hashing workers in "
+            f"{summary['seconds']}s ({summary['rows_per_second']} rows/s): {summary['created']} created, "
+            f"{summary['skipped']} skipped, {summary['rejected']} rejected."
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='users_user_created_id_idx'),
+        ),
+    ]
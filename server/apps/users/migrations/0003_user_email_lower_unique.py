@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-19 09:28
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+# Login has always sent the email as the username, so accounts without an
+# email get theirs from the username. Duplicates (ignoring case) keep the
+# email on the account most likely in use: active, most recently logged in,
+# then the oldest. The others are blanked and can still log in by username.
+BACKFILL_AND_DEDUPLICATE_EMAILS = """
+UPDATE users_user SET email = BTRIM(email) WHERE email <> BTRIM(email);
+
+UPDATE users_user SET email = username WHERE email = '' AND username LIKE '%_@_%';
+
+WITH ranked AS (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY LOWER(email)
+        ORDER BY is_active DESC, last_login DESC NULLS LAST, date_joined, id
+    ) AS position
+    FROM users_user
+    WHERE email <> ''
+)
+UPDATE users_user SET email = ''
+FROM ranked
+WHERE users_user.id = ranked.id AND ranked.position > 1;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_AND_DEDUPLICATE_EMAILS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='users_user_email_lower_uniq', violation_error_message='A user with that email already exists.'),
+        ),
+    ]
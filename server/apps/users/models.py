@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils.translation import gettext_lazy as _
 
 from django.contrib.auth.models import AbstractUser
@@ -18,6 +19,22 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the user directory
+            models.Index(fields=['created_at', 'id'], name='users_user_created_id_idx'),
+        ]
+        constraints = [
+            # Case-insensitive email login (EmailBackend) probes this index;
+            # blank emails are allowed more than once
+            models.UniqueConstraint(
+                Lower('email'),
+                condition=~models.Q(email=''),
+                name='users_user_email_lower_uniq',
+                violation_error_message=_('A user with that email already exists.'),
+            ),
+        ]
+    
     def is_super_admin(self):
         return self.role == Roles.SUPER_ADMIN or self.is_superuser
 
@@ -0,0 +1,21 @@
+"""
+Password hashing for process pools.
+
+Kept free of model imports, so a worker process can unpickle hash_passwords
+without setting Django up (workers started with 'spawn' instead of 'fork'
+only have the settings module from the environment).
+"""
+from django.contrib.auth.hashers import make_password
+
+
+def hash_passwords(passwords):
+    """
+    Hash a batch of raw passwords with the default hasher.
+
+    Args:
+        passwords: Raw passwords; None or '' gives an unusable password
+
+    Returns:
+        list: Encoded passwords, in the same order
+    """
+    return [make_password(password or None) for password in passwords]
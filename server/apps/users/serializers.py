@@ -6,6 +6,61 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
     
 class UserSerializer(serializers.ModelSerializer):
+    """
+    Lean user projection for the directory: plain columns only, so a list
+    is one query. Groups and permissions come with ?expand=permissions
+    (UserWithPermissionsSerializer).
+    """
     class Meta:
         model = User
-        exclude = ['password']
+        fields = [
+            'id',
+            'username',
+            'email',
+            'name',
+            'first_name',
+            'last_name',
+            'role',
+            'is_active',
+            'is_staff',
+            'is_superuser',
+            'last_login',
+            'date_joined',
+            'created_at',
+            'updated_at',
+        ]
+
+
+class UserWithPermissionsSerializer(UserSerializer):
+    """UserSerializer plus group names and 'app_label.codename' permissions."""
+    groups = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
+    user_permissions = serializers.SerializerMethodField()
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ['groups', 'user_permissions']
+
+    def get_user_permissions(self, user):
+        # Reads the prefetched permissions (with their content types)
+        return [
+            f"{permission.content_type.app_label}.{permission.codename}"
+            for permission in user.user_permissions.all()
+        ]
+
+
+class UserImportSerializer(serializers.ModelSerializer):
+    """
+    Validates one row of a bulk user import.
+
+    Uniqueness of username and email is not checked per row: existing users
+    are looked up once per chunk, and the insert skips any conflict left.
+    A blank password gives the account an unusable one (set it with a reset).
+    """
+    password = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+
+    class Meta:
+        model = User
+        fields = ['username', 'email', 'password', 'name', 'first_name', 'last_name', 'role']
+        extra_kwargs = {
+            'username': {'validators': [User.username_validator]},
+            'email': {'required': True, 'allow_blank': False},
+        }
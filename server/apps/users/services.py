@@ -0,0 +1,175 @@
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework.exceptions import ValidationError
+from project.streaming import chunked
+from .models import User
+from .passwords import hash_passwords
+from .serializers import UserImportSerializer
+
+
+def provision_users(records, chunk_size=1000, workers=None, on_chunk=None, max_errors=100):
+    """
+    Create user accounts from a CSV / NDJSON feed.
+
+    Password hashing is what makes creating users slow (hundreds of
+    milliseconds each, by design), so it runs in a process pool, one slice of
+    every chunk per worker: throughput grows with the number of cores. While
+    the workers hash the next chunk, the current one is inserted with
+    bulk_create.
+
+    Rows whose username or email (ignoring case) already exists, or repeats an
+    earlier row of the chunk, are skipped before hashing. Conflicts that get
+    past that check (a concurrent signup, a repeat in the previous chunk) are
+    skipped by the insert (ON CONFLICT DO NOTHING).
+
+    Args:
+        records: Iterable of (line_number, record, error) tuples, as produced
+            by project.streaming.iter_records
+        chunk_size: Number of rows hashed and inserted together
+        workers: Number of hashing processes (default: one per CPU)
+        on_chunk: Optional callable receiving each chunk report
+        max_errors: Maximum number of rejected rows described in the summary
+
+    Returns:
+        dict: Totals ('rows', 'created', 'skipped', 'rejected', 'chunks',
+        'workers', 'seconds', 'rows_per_second') and the first rejected rows
+        under 'errors'
+    """
+    workers = workers or os.cpu_count() or 1
+    summary = {
+        'rows': 0, 'created': 0, 'skipped': 0, 'rejected': 0, 'chunks': 0,
+        'workers': workers, 'errors': [],
+    }
+    serializer = UserImportSerializer()
+    started = last_finished = time.monotonic()
+
+    def finish(number, rows, valid, rejected, hashing):
+        nonlocal last_finished
+        passwords = [password for future in hashing for password in future.result()]
+        created = _insert_user_chunk(valid, passwords)
+
+        # Chunks overlap, so a chunk's time is measured from the previous one's end
+        finished = time.monotonic()
+        seconds, last_finished = finished - last_finished, finished
+        report = {
+            'chunk': number,
+            'rows': rows,
+            'created': created,
+            'skipped': rows - len(rejected) - created,
+            'rejected': len(rejected),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds) if seconds else None,
+        }
+
+        summary['chunks'] += 1
+        summary['rows'] += rows
+        summary['created'] += created
+        summary['skipped'] += report['skipped']
+        summary['rejected'] += len(rejected)
+        for line_number, errors in rejected:
+            if len(summary['errors']) >= max_errors:
+                break
+            summary['errors'].append({'line': line_number, 'errors': errors})
+
+        if on_chunk:
+            on_chunk(report)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = None
+        for number, chunk in enumerate(chunked(records, chunk_size), start=1):
+            valid, rejected = _validate_user_chunk(serializer, chunk)
+            valid = _exclude_existing_users(valid)
+
+            # One slice per worker; results are joined back in order
+            passwords = [data.pop('password', '') for data in valid]
+            step = -(-len(passwords) // workers) or 1
+            hashing = [
+                executor.submit(hash_passwords, passwords[start:start + step])
+                for start in range(0, len(passwords), step)
+            ]
+
+            if pending:
+                finish(*pending)
+            pending = (number, len(chunk), valid, rejected, hashing)
+        if pending:
+            finish(*pending)
+
+    seconds = time.monotonic() - started
+    summary['seconds'] = round(seconds, 3)
+    summary['rows_per_second'] = round(summary['rows'] / seconds) if seconds else None
+    return summary
+
+
+def _validate_user_chunk(serializer, chunk):
+    """
+    Validate the rows of one provisioning chunk and drop repeats within it.
+
+    Returns:
+        tuple: ([validated data], [(line_number, errors)])
+    """
+    valid = []
+    rejected = []
+    usernames = set()
+    emails = set()
+
+    for line_number, record, error in chunk:
+        if error:
+            rejected.append((line_number, {'non_field_errors': [error]}))
+            continue
+        try:
+            data = serializer.run_validation(record)
+        except ValidationError as exc:
+            rejected.append((line_number, exc.detail))
+            continue
+        email = data['email'].lower()
+        if data['username'] in usernames or email in emails:
+            continue
+        usernames.add(data['username'])
+        emails.add(email)
+        valid.append(data)
+
+    return valid, rejected
+
+
+def _exclude_existing_users(valid):
+    """Drop rows whose username or email is taken, with one query per chunk."""
+    if not valid:
+        return valid
+    existing = User.objects.alias(email_lower=Lower('email')).filter(
+        Q(username__in=[data['username'] for data in valid]) |
+        Q(email_lower__in=[data['email'].lower() for data in valid]) & ~Q(email='')
+    ).values_list('username', 'email')
+
+    usernames = set()
+    emails = set()
+    for username, email in existing:
+        usernames.add(username)
+        emails.add(email.lower())
+    return [
+        data for data in valid
+        if data['username'] not in usernames and data['email'].lower() not in emails
+    ]
+
+
+def _insert_user_chunk(valid, passwords):
+    """
+    Insert one chunk of users, skipping conflicts on username and email.
+
+    Returns:
+        int: Number of users created
+    """
+    if not valid:
+        return 0
+    users = [
+        User(id=uuid.uuid4(), password=password, **data)
+        for data, password in zip(valid, passwords)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=len(users), ignore_conflicts=True)
+        # ignore_conflicts doesn't report which rows were inserted; the ids are ours
+        return User.objects.filter(pk__in=[user.pk for user in users]).count()
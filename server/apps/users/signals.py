@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import clear_user_state
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_cached_user_state(sender, instance, **kwargs):
+    """
+    Make a deactivation, deletion or role change reach stateless tokens at once.
+
+    "At once" assumes a cache shared by every worker; with the local-memory
+    cache only this process forgets the state, and the others keep it for up
+    to JWT_REVOCATION_CACHE_SECONDS. Changes made with QuerySet.update() skip
+    this and take that long everywhere.
+    """
+    transaction.on_commit(lambda: clear_user_state(instance.pk))
@@ -1,3 +1,47 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from project.pagination import KeysetPagination
+from .models import User
 
-# Create your tests here.
+encode_cursor = KeysetPagination().encode_cursor
+
+
+class UserCursorTests(TestCase):
+    """Tampered keyset cursors of the user directory are answered with 404."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff@example.com', email='staff@example.com', is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_values_of_the_wrong_type(self):
+        for name, values in {'text date': ['abc', 1], 'nested list': [[1], 1], 'text id': ['2020-01-01T00:00:00+00:00', 'abc']}.items():
+            with self.subTest(name):
+                cursor = encode_cursor(['created_at', 'id'], values)
+                response = self.client.get(f"/api/users/?cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+
+class UserDirectoryPermissionTests(TestCase):
+    """Only staff can list and retrieve accounts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer@example.com', email='customer@example.com')
+        cls.staff = User.objects.create_user(username='staff@example.com', email='staff@example.com', is_staff=True)
+
+    def test_customers_are_forbidden(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        for path in ('/api/users/', '/api/users/?expand=permissions', f"/api/users/{self.staff.pk}/"):
+            with self.subTest(path):
+                self.assertEqual(client.get(path).status_code, 403)
+
+    def test_staff_can_list_and_retrieve(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        self.assertEqual(client.get('/api/users/?expand=permissions').status_code, 200)
+        self.assertEqual(client.get(f"/api/users/{self.customer.pk}/").status_code, 200)
@@ -1,43 +1,105 @@
 from django.contrib.auth import authenticate, login
+from django.contrib.auth.models import Group, Permission
+from django.db.models import Prefetch
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework import status
-from .serializers import LoginSerializer, UserSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from .authentication import get_tokens_for_user
+from .serializers import LoginSerializer, UserSerializer, UserWithPermissionsSerializer
 from .models import User
 from .permissions import AnonWriteOnly
+from project.pagination import KeysetPagination
 class UserViewSet(ReadOnlyModelViewSet):
     """
     A viewset for viewing and editing user instances.
     Provides a login action to authenticate users and return JWT tokens.
+    The token action does the same without creating a session or touching
+    last_login, so it writes nothing; API clients should prefer it.
+    
+    The directory only loads the columns UserSerializer shows, so listing
+    users is one query per page (plus the count). ?expand=permissions adds
+    group names and permissions, fetched with two prefetch queries for the
+    whole page. Send ?cursor= for keyset pagination on created_at. Listing
+    and retrieving users is for staff only.
     """
     tags = ['User']
     serializer_class = UserSerializer
-    queryset = User.objects.all()
+    queryset = User.objects.only(*UserSerializer.Meta.fields)
+    
+    # Page numbers by default, keyset pagination with ?cursor= (served by
+    # the (created_at, id) index)
+    pagination_class = KeysetPagination
+    ordering_fields = ['created_at', 'username']
+    ordering = ['created_at']
+    
+    expand_query_param = 'expand'
+    expandable = ('permissions',)
     
     def get_permissions(self):
-        if self.action == 'login':
+        if self.action in ('login', 'token'):
             permission_classes = [AnonWriteOnly]
+        else:
+            # The directory shows every account's email and staff flags
+            permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'permissions' in self.get_expand():
+            queryset = queryset.prefetch_related(
+                Prefetch('groups', queryset=Group.objects.only('id', 'name')),
+                Prefetch('user_permissions', queryset=Permission.objects.select_related('content_type')),
+            )
+        return queryset
+
     def get_serializer_class(self):
-        if self.action == 'login':
+        if self.action in ('login', 'token'):
             return LoginSerializer
+        if 'permissions' in self.get_expand():
+            return UserWithPermissionsSerializer
         return UserSerializer
 
+    def get_expand(self):
+        """Return the relations requested with ?expand=a,b."""
+        value = self.request.query_params.get(self.expand_query_param, '')
+        expand = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = expand.difference(self.expandable)
+        if unknown:
+            raise ValidationError({
+                self.expand_query_param: f"Unknown value(s): {', '.join(sorted(unknown))}. Use: {', '.join(self.expandable)}"
+            })
+        return expand
+
     @action(detail=False, methods=['post'], url_path='login')
     def login(self, request):
+        return self._authenticate(request, create_session=True)
+
+    @action(detail=False, methods=['post'], url_path='token')
+    def token(self, request):
+        return self._authenticate(request, create_session=False)
+
+    def _authenticate(self, request, create_session):
+        """
+        Check the credentials and return a refresh/access token pair.
+
+        Args:
+            request: The login request (email and password)
+            create_session: Also log the user in with a Django session (and
+                update last_login), for the browsable API and admin
+        """
         serializer = self.get_serializer_class()(data=request.data)
         if serializer.is_valid():
             email = serializer.validated_data['email']
             password = serializer.validated_data['password']
             user = authenticate(request, username=email, password=password)
             if user is not None:
-                login(request, user)
-                refresh = RefreshToken.for_user(user)
+                if create_session:
+                    login(request, user)
+                refresh = get_tokens_for_user(user)
                 return Response({
                     'refresh': str(refresh),
                     'access': str(refresh.access_token),
@@ -0,0 +1,57 @@
+"""
+Gunicorn configuration (read automatically when gunicorn starts in this directory).
+
+    gunicorn project.wsgi
+
+Sets up the shared directory the Prometheus client uses to aggregate the
+metrics of all workers (see project/metrics.py): it is emptied when the
+server starts, and a worker's live values are dropped when it exits.
+
+Runs one worker by default on the default local-memory cache, and refuses to
+start several (-w / GUNICORN_WORKERS) on it: each worker would only see its
+own invalidations, so the others would serve stale book lists and facets for
+their whole timeout, accept revoked tokens for up to
+JWT_REVOCATION_CACHE_SECONDS and never refresh their typeahead index from the
+catalog generation. Configure a shared cache (DJANGO_CACHE_BACKEND) for
+several workers, or set DJANGO_CACHE_ALLOW_LOCAL=true to accept per-process
+invalidation.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+local_cache = os.getenv('DJANGO_CACHE_BACKEND', 'locmem.LocMemCache').endswith('LocMemCache')
+workers = int(os.getenv('GUNICORN_WORKERS', 1 if local_cache else multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+# Must be set before the workers import prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-metrics'))
+
+
+def on_starting(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    from django.conf import settings
+
+    # The count gunicorn runs, after -w on the command line
+    workers = server.cfg.workers
+    if workers > 1 and settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+        message = (
+            f"{workers} workers share no cache: invalidations (book lists, facets, revoked tokens, "
+            "suggestions) only reach the worker that made the change. Set DJANGO_CACHE_BACKEND to a "
+            "shared cache, run one worker, or set DJANGO_CACHE_ALLOW_LOCAL=true."
+        )
+        if os.getenv('DJANGO_CACHE_ALLOW_LOCAL', 'false').lower() != 'true':
+            raise RuntimeError(message)
+        server.log.warning(message)
+
+    # Values from a previous run would be added to this one's
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,150 @@
+"""
+Conditional GET (ETag / Last-Modified) support for DRF viewsets.
+
+The validators are computed before anything is serialized, so an unchanged
+resource is answered with an empty 304.
+"""
+import hashlib
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    Add ETag and Last-Modified headers to the list and retrieve actions and
+    answer If-None-Match / If-Modified-Since with 304 Not Modified.
+
+    Paginated list validators come from the rows of the page itself plus the
+    count and page links; unpaginated lists use MAX(last_modified_field) and
+    COUNT(*) of the filtered queryset (the count catches deletions); details
+    use the object's own last_modified_field. All are combined with the query
+    string, the user and the rendered format, so different views of the data
+    never share an ETag.
+
+    Attributes:
+        last_modified_field: Timestamp field bumped on every change
+        weak_etag: Send weak ETags when embedded data may change without the
+            timestamp moving
+        conditional_cache_control: Cache-Control directives for these responses
+        conditional_vary: Extra request headers the response varies on
+    """
+    last_modified_field = 'updated_at'
+    weak_etag = False
+    conditional_cache_control = {'no_cache': True}
+    conditional_vary = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+
+        def render(request, *args, **kwargs):
+            if page is None:
+                return Response(self.get_serializer(queryset, many=True).data)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        if page is None:
+            validators = self.get_list_validators(queryset)
+        else:
+            validators = self.get_page_validators(page)
+        return self._conditional_response(request, validators, render, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_object_validators()
+        return self._conditional_response(request, validators, super().retrieve, *args, **kwargs)
+
+    def get_list_validators(self, queryset):
+        """
+        Return (version, last_modified) for a filtered queryset.
+
+        Args:
+            queryset: The filtered (but not paginated) queryset
+
+        Returns:
+            tuple: A string that changes whenever the list changes, and the
+            newest timestamp (or None for an empty list)
+        """
+        stats = queryset.aggregate(
+            last_modified=Max(self.last_modified_field),
+            count=Count('pk')
+        )
+        last_modified = stats['last_modified']
+        version = f"{last_modified.isoformat() if last_modified else '-'}:{stats['count']}"
+        return version, last_modified
+
+    def get_page_validators(self, page):
+        """
+        Return (version, last_modified) for a page that was already fetched.
+
+        The rows' own timestamps plus the total count and the links to the
+        neighbouring pages (when the paginator has them) identify the page, so
+        no extra query is needed and keyset pages still skip COUNT(*).
+        """
+        paginator = self.paginator
+        count = getattr(paginator, 'count', None)
+        if count is None and getattr(paginator, 'page', None) is not None:
+            count = paginator.page.paginator.count
+        parts = [str(count), str(paginator.get_next_link()), str(paginator.get_previous_link())]
+
+        last_modified = None
+        for row in page:
+            modified = getattr(row, self.last_modified_field)
+            parts.append(f"{row.pk}:{modified.isoformat() if modified else '-'}")
+            if modified and (last_modified is None or modified > last_modified):
+                last_modified = modified
+        return '|'.join(parts), last_modified
+
+    def get_object_validators(self):
+        """
+        Return (version, last_modified) for the requested object, or None when
+        it does not exist so the normal 404 handling applies.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.get_queryset().filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+            row = queryset.values_list('pk', self.last_modified_field).first()
+        except (TypeError, ValueError, ValidationError):
+            # A malformed id (e.g. not a number or UUID): retrieve answers 404
+            return None
+        if row is None:
+            return None
+        pk, last_modified = row
+        return f"{pk}:{last_modified.isoformat() if last_modified else '-'}", last_modified
+
+    def _conditional_response(self, request, validators, handler, *args, **kwargs):
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        version, last_modified = validators
+        etag = self._make_etag(request, version)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, **self.conditional_cache_control)
+            if self.conditional_vary:
+                patch_vary_headers(response, self.conditional_vary)
+        return response
+
+    def _make_etag(self, request, version):
+        renderer = getattr(request, 'accepted_renderer', None)
+        parts = [
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            str(getattr(request.user, 'pk', '') or ''),
+            getattr(renderer, 'format', '') or '',
+            version,
+        ]
+        digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+        etag = quote_etag(digest)
+        return f"W/{etag}" if self.weak_etag else etag
@@ -0,0 +1,215 @@
+"""
+Per-request performance instrumentation.
+
+RequestMetricsMiddleware times every request and, through a database
+execute wrapper, counts its queries and their time. The results go out as a
+Server-Timing header (visible in the browser's network panel) and as one
+structured log record per request on the 'project.requests' logger:
+
+    Server-Timing: db;dur=4.1;desc="6 queries", app;dur=9.8, total;dur=13.9
+
+It also flags N+1 patterns: the same SQL shape (the statement with its
+parameters and IN lists collapsed) run more than N_PLUS_ONE_THRESHOLD times in
+one request is logged on 'project.queries' with the stack that ran it.
+
+Requests are named after the view action, e.g. 'cart-add-product' or
+'book-list'. JsonFormatter writes log records, with their extra fields, as
+one JSON object per line (LOG_FORMAT=json).
+"""
+import json
+import logging
+import re
+import time
+import traceback
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from . import metrics as prometheus
+
+logger = logging.getLogger('project.requests')
+query_logger = logging.getLogger('project.queries')
+
+# Standard viewset actions share a URL name ('cart-detail'); name them by action instead
+_VIEWSET_ACTIONS = ('list', 'create', 'retrieve', 'update', 'partial_update', 'destroy')
+# IN (%s, %s, ...) and VALUES (...), (...) vary in length with the data, not the code path
+_REPEATED_PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+_REPEATED_ROWS = re.compile(r'\((%s(?:, %s)*)\)(?:\s*,\s*\(\1\))+')
+
+
+def sql_shape(sql):
+    """Collapse the variable-length parts of a parameterized statement."""
+    return _REPEATED_PLACEHOLDERS.sub('%s...', _REPEATED_ROWS.sub(r'(\1)...', sql))
+
+
+class RequestMetrics:
+    """
+    What one request cost.
+
+    Available as request.metrics while the request is processed.
+
+    Attributes:
+        name: View action name, e.g. 'cart-add-product' (None when unresolved)
+        queries: Number of SQL statements executed
+        db_seconds: Time spent in the database
+        total_seconds: Time until the response was returned (streamed bodies
+            are not included)
+        repeated: {sql shape: count} of the shapes over the N+1 threshold
+    """
+    __slots__ = ('name', 'queries', 'db_seconds', 'total_seconds', 'repeated', '_shapes', '_started', '_threshold')
+
+    def __init__(self, threshold):
+        self.name = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.total_seconds = 0.0
+        self.repeated = {}
+        self._shapes = {}
+        self._started = time.perf_counter()
+        self._threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper: time the query and watch its shape."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            if self._threshold:
+                self._count_shape(sql)
+
+    def _count_shape(self, sql):
+        shape = sql_shape(sql)
+        count = self._shapes.get(shape, 0) + 1
+        self._shapes[shape] = count
+        if count > self._threshold:
+            if shape not in self.repeated:
+                # Only the first time over the threshold: the stack is the expensive part
+                query_logger.warning(
+                    "Possible N+1: the same query ran more than %s times in %s\n%s\nCalled from:\n%s",
+                    self._threshold, self.name or 'one request', shape, ''.join(_application_stack())
+                )
+            self.repeated[shape] = count
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._started
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'app;dur={(self.total_seconds - self.db_seconds) * 1000:.1f}, '
+            f'total;dur={self.total_seconds * 1000:.1f}'
+        )
+
+    def as_dict(self):
+        return {
+            'view': self.name,
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'total_ms': round(self.total_seconds * 1000, 2),
+            'repeated_queries': [
+                {'sql': shape, 'count': count} for shape, count in self.repeated.items()
+            ],
+        }
+
+
+def _application_stack():
+    """The innermost frames of the current stack that belong to this project."""
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(str(settings.BASE_DIR))
+        and frame.filename != __file__
+        and 'site-packages' not in frame.filename
+    ]
+    return traceback.format_list(frames[-settings.N_PLUS_ONE_STACK_DEPTH:])
+
+
+def view_name(request, view_func):
+    """
+    Name a request after its view action: 'cart-add-product', 'book-list',
+    'cart-destroy'. Falls back to the URL name, then to the view's name.
+    """
+    match = request.resolver_match
+    name = match.url_name if match else None
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower())
+        basename = view_func.initkwargs.get('basename')
+        if action in _VIEWSET_ACTIONS and basename:
+            return f"{basename}-{action.replace('_', '-')}"
+    return name or getattr(view_func, '__name__', None)
+
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line, extra fields included."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record queries, DB time and total time of every request.
+
+    Settings:
+        REQUEST_METRICS_ENABLED: Turn the middleware off entirely
+        SERVER_TIMING_HEADER: Send the Server-Timing header
+        METRICS_ENABLED: Also record the request in the Prometheus metrics
+        N_PLUS_ONE_THRESHOLD: Repeats of one SQL shape that are flagged (0 disables)
+        N_PLUS_ONE_STACK_DEPTH: Application frames logged with a flagged query
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.REQUEST_METRICS_ENABLED
+        self.server_timing = settings.SERVER_TIMING_HEADER
+        self.export = settings.METRICS_ENABLED
+        self.threshold = settings.N_PLUS_ONE_THRESHOLD
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = request.metrics = RequestMetrics(self.threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        metrics.finish()
+
+        if self.export:
+            prometheus.record_request(metrics, request.method, response.status_code)
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing()
+        logger.info(
+            "%s %s %s %s: %s queries, %.1f ms db, %.1f ms total",
+            request.method, request.path, response.status_code, metrics.name,
+            metrics.queries, metrics.db_seconds * 1000, metrics.total_seconds * 1000,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **metrics.as_dict(),
+            }
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.name = view_name(request, view_func)
@@ -0,0 +1,96 @@
+"""
+Prometheus metrics, served at /metrics in the text exposition format.
+
+    http_request_duration_seconds{view,method,status}   histogram
+    http_request_db_queries_total{view}                 counter
+    http_request_db_seconds_total{view}                 counter
+    cache_requests_total{cache,result}                  counter (hit / miss)
+    store_recommendation_seconds                        histogram
+
+Request metrics are recorded by project.instrumentation.RequestMetricsMiddleware
+from the numbers it already collects, so recording costs a few label lookups
+and additions per request, not per query.
+
+Under gunicorn every worker is a separate process. With PROMETHEUS_MULTIPROC_DIR
+set (gunicorn.conf.py does it), each worker writes its values to memory-mapped
+files in that directory and /metrics adds up the files of all workers, so
+scraping any worker of a pod returns the numbers of the whole pod.
+"""
+import hmac
+import os
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'Time until the response was returned, per view action',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Counter('http_request_db_queries', 'SQL statements executed by requests', ['view'])
+DB_SECONDS = Counter('http_request_db_seconds', 'Time requests spent in the database', ['view'])
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups by cache and result', ['cache', 'result'])
+RECOMMENDATION_SECONDS = Histogram(
+    'store_recommendation_seconds',
+    'Time to compute product recommendations',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# (view, method, status) -> the labelled children; .labels() costs more than the update itself
+_request_series = {}
+
+
+def record_request(metrics, method, status):
+    """
+    Record one finished request.
+
+    Args:
+        metrics: project.instrumentation.RequestMetrics of the request
+        method: HTTP method
+        status: Response status code
+    """
+    key = (metrics.name or 'unmatched', method, status)
+    series = _request_series.get(key)
+    if series is None:
+        view = key[0]
+        series = _request_series[key] = (
+            REQUEST_SECONDS.labels(*key), DB_QUERIES.labels(view), DB_SECONDS.labels(view)
+        )
+    duration, queries, db_seconds = series
+    duration.observe(metrics.total_seconds)
+    if metrics.queries:
+        queries.inc(metrics.queries)
+        db_seconds.inc(metrics.db_seconds)
+
+
+def record_cache(cache_name, hit):
+    """Count a lookup in one of our caches, e.g. 'books:list'."""
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@require_safe
+def metrics_view(request):
+    """
+    Serve every metric in the Prometheus text format.
+
+    When METRICS_AUTH_TOKEN is set, the scraper has to send it as
+    'Authorization: Bearer <token>'.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,243 @@
+"""
+Keyset (cursor) pagination that works with the OrderingFilter.
+
+Unlike page numbers it never runs OFFSET, so deep pages cost the same as the
+first one, and the COUNT(*) is only run when asked for.
+"""
+import base64
+import binascii
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorValueEncoder(DjangoJSONEncoder):
+    """JSON encoder that keeps full microsecond precision for datetimes."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Opt-in keyset pagination on top of the regular page-number pagination.
+
+    Requests without a cursor parameter are paginated by page number exactly as
+    before. Send ?cursor= (empty) for the first page and follow the `next`
+    links from there. The rows are ordered by the queryset's ordering (as set
+    by OrderingFilter) plus the primary key as a tiebreaker, and each page
+    starts right after the last row of the previous one:
+
+        WHERE publication_date >= :d AND (publication_date > :d OR (publication_date = :d AND id > :id))
+        ORDER BY publication_date, id LIMIT :size
+
+    so an index on (field, id) serves every page. Pass ?count=true to also get
+    the total number of rows.
+
+    Only forward paging is supported, and the ordering fields must not be
+    nullable.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        ordering = self.get_keyset_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        cursor = self.decode_cursor(request, ordering, queryset)
+        if cursor is not None:
+            queryset = queryset.filter(self.build_keyset_filter(ordering, cursor))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        self.next_cursor = None
+        if self.has_next:
+            last = self.page_rows[-1]
+            values = [self.get_value(last, field) for field, _ in self.parse_ordering(ordering)]
+            self.next_cursor = self.encode_cursor(ordering, values)
+        return self.page_rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        body = {'next': self.get_next_link()}
+        if self.count is not None:
+            body['count'] = self.count
+        body['results'] = data
+        return Response(body)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return None
+
+    def get_keyset_ordering(self, queryset):
+        """
+        Return the queryset's ordering with a primary key tiebreaker.
+
+        The tiebreaker follows the direction of the first field so that a
+        single (field, id) index can be scanned forwards or backwards. Orderings
+        that already end on a unique field are left alone.
+        """
+        ordering = [force_str(field) for field in queryset.query.order_by] or ['pk']
+        model = queryset.model
+        pk_name = model._meta.pk.name
+
+        normalized = []
+        for field in ordering:
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = pk_name
+            normalized.append(f"-{name}" if descending else name)
+
+        last = self._get_field(model, normalized[-1].lstrip('-'))
+        if last is None or not last.unique:
+            direction = '-' if normalized[0].startswith('-') else ''
+            normalized.append(f"{direction}{pk_name}")
+
+        for field in normalized:
+            model_field = self._get_field(model, field.lstrip('-'))
+            if model_field is None and field.lstrip('-') not in queryset.query.annotations:
+                raise ValidationError({self.cursor_query_param: f"Cannot paginate by cursor on '{field.lstrip('-')}'."})
+            if model_field is not None and model_field.null:
+                raise ValidationError({self.cursor_query_param: f"Cannot paginate by cursor on nullable field '{field.lstrip('-')}'."})
+        return normalized
+
+    def build_keyset_filter(self, ordering, values):
+        """
+        Build the "rows after this one" condition for the given ordering.
+
+        Args:
+            ordering: Normalized ordering (see get_keyset_ordering)
+            values: Values of the ordering fields in the last row seen
+
+        Returns:
+            Q: A leading range condition on the first field (so the index range
+            scan starts at the right place) AND-ed with the exact row-wise
+            comparison
+        """
+        fields = self.parse_ordering(ordering)
+        after = Q()
+        for position, (field, descending) in enumerate(fields):
+            step = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[position]})
+            for previous, (previous_field, _) in enumerate(fields[:position]):
+                step &= Q(**{previous_field: values[previous]})
+            after |= step
+
+        first_field, first_descending = fields[0]
+        leading = Q(**{f"{first_field}__{'lte' if first_descending else 'gte'}": values[0]})
+        return leading & after
+
+    def parse_ordering(self, ordering):
+        return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def get_value(self, obj, field):
+        value = obj
+        for part in field.split('__'):
+            value = getattr(value, part)
+        return value
+
+    def encode_cursor(self, ordering, values):
+        payload = json.dumps({'o': ordering, 'v': values}, cls=CursorValueEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, ordering, queryset):
+        """
+        Return the values stored in the cursor, or None for the first page.
+
+        Each value is converted and validated by its ordering field (or the
+        output field of an annotation), so a tampered cursor is a 404 rather
+        than a database error.
+        """
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            cursor_ordering, values = payload['o'], payload['v']
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor is only valid for the ordering it was issued for
+        if cursor_ordering != ordering or not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        converted = []
+        for (name, _), value in zip(self.parse_ordering(ordering), values):
+            field = self._get_field(queryset.model, name)
+            if field is None:
+                field = queryset.query.annotations[name].output_field
+            if value is None or isinstance(value, (list, dict)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            converted.append(value)
+        return converted
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.extend([
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset pagination cursor. Send it empty for the first page, then follow `next`.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'With a cursor, also return the total number of results.',
+                'schema': {'type': 'boolean'},
+            },
+        ])
+        return parameters
+
+    def _get_field(self, model, path):
+        """Resolve a field path like 'author__name', or None for annotations."""
+        field = None
+        for part in path.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation and field.related_model is not None:
+                model = field.related_model
+        return field
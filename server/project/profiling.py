@@ -0,0 +1,247 @@
+"""
+On-demand profiling of single requests.
+
+A staff user (session, JWT or basic auth) sends 'X-Profile: 1' and that one
+request runs under cProfile with every SQL statement timed. Instead of the
+normal body the response is a JSON summary: the functions with the most
+cumulative and own time, the slowest SQL shapes, the status the view
+returned and the profile id. The raw profile (.prof, for pstats or snakeviz)
+and the summary (.json) are kept in PROFILE_DIR under that id, which is the
+X-Request-ID header when the client sent one. Staff download them from
+/admin/profiles/.
+
+Requests without the header only pay for one dict lookup.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, Http404, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from .instrumentation import sql_shape
+
+PROFILE_ID = re.compile(r'^[\w-]{1,64}$')
+PROFILE_FILES = {'prof': 'application/octet-stream', 'json': 'application/json'}
+
+
+class SQLProfile:
+    """Database execute wrapper collecting time and count per SQL shape."""
+
+    def __init__(self):
+        self.shapes = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            entry = self.shapes[sql_shape(sql)]
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    def summary(self, limit):
+        ordered = sorted(self.shapes.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'sql': shape, 'count': count, 'total_ms': round(seconds * 1000, 3)}
+            for shape, (count, seconds) in ordered[:limit]
+        ]
+
+
+def function_summary(stats, limit, key):
+    """
+    The top functions of a profile, as JSON-friendly dicts.
+
+    Args:
+        stats: pstats.Stats of the profile
+        limit: Number of functions
+        key: 'cumulative' (time in the function and its callees) or 'own'
+    """
+    position = 3 if key == 'cumulative' else 2
+    ordered = sorted(stats.stats.items(), key=lambda item: item[1][position], reverse=True)
+    return [
+        {
+            'function': f"{_short_filename(filename)}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in ordered[:limit]
+    ]
+
+
+def _short_filename(filename):
+    if 'site-packages/' in filename:
+        return filename.split('site-packages/', 1)[1]
+    if filename.startswith(str(settings.BASE_DIR)):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    return filename
+
+
+def is_staff_request(request):
+    """
+    Whether the request comes from a staff user.
+
+    Middleware runs before DRF authenticates, so besides the session user
+    this tries the API's token and basic authenticators (only for requests
+    that asked to be profiled).
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        if issubclass(authentication_class, SessionAuthentication):
+            continue
+        try:
+            result = authentication_class().authenticate(request)
+        except APIException:
+            return False
+        if result is not None:
+            return bool(result[0].is_staff)
+    return False
+
+
+def list_profiles(limit=None):
+    """Summaries of the saved profiles, newest first."""
+    try:
+        names = [name for name in os.listdir(settings.PROFILE_DIR) if name.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    paths = sorted(
+        (os.path.join(settings.PROFILE_DIR, name) for name in names),
+        key=os.path.getmtime, reverse=True
+    )
+    profiles = []
+    for summary_path in paths[:limit]:
+        try:
+            with open(summary_path) as summary_file:
+                profiles.append(json.load(summary_file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def _prune_profiles():
+    """Keep only the newest PROFILE_KEEP profiles."""
+    for profile in list_profiles()[settings.PROFILE_KEEP:]:
+        for extension in PROFILE_FILES:
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, f"{profile['id']}.{extension}"))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that send 'X-Profile: 1' when they come from staff.
+
+    Settings:
+        PROFILING_ENABLED: Remove the middleware entirely when false
+        PROFILE_DIR: Where profiles are saved
+        PROFILE_KEEP: Number of profiles kept
+        PROFILE_TOP: Functions and SQL shapes listed in a summary
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get('HTTP_X_PROFILE') != '1' or not is_staff_request(request):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        profile_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not PROFILE_ID.match(profile_id) or os.path.exists(self._path(profile_id, 'json')):
+            profile_id = uuid.uuid4().hex
+
+        sql = SQLProfile()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connections['default'].execute_wrapper(sql):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        total_seconds = time.perf_counter() - started
+
+        metrics = getattr(request, 'metrics', None)
+        stats = pstats.Stats(profiler)
+        summary = {
+            'id': profile_id,
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': metrics.name if metrics else None,
+            'user': str(getattr(request.user, 'pk', None) or ''),
+            'status': response.status_code,
+            'total_ms': round(total_seconds * 1000, 3),
+            'queries': sum(count for count, _ in sql.shapes.values()),
+            'db_ms': round(sum(seconds for _, seconds in sql.shapes.values()) * 1000, 3),
+            'functions': function_summary(stats, settings.PROFILE_TOP, 'cumulative'),
+            'hotspots': function_summary(stats, settings.PROFILE_TOP, 'own'),
+            'sql': sql.summary(settings.PROFILE_TOP),
+        }
+
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(self._path(profile_id, 'prof'))
+        with open(self._path(profile_id, 'json'), 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        _prune_profiles()
+
+        result = JsonResponse(summary)
+        result['X-Profile-Id'] = profile_id
+        return result
+
+    def _path(self, profile_id, extension):
+        return os.path.join(settings.PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def profile_list_view(request):
+    """Admin page listing the saved profiles."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': list_profiles(settings.PROFILE_KEEP),
+    }
+    return TemplateResponse(request, 'admin/profiles.html', context)
+
+
+def profile_download_view(request, profile_id, extension):
+    """Download a profile's .prof (pstats) or .json (summary) file."""
+    if not PROFILE_ID.match(profile_id) or extension not in PROFILE_FILES:
+        raise Http404
+    try:
+        profile_file = open(os.path.join(settings.PROFILE_DIR, f"{profile_id}.{extension}"), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(
+        profile_file, as_attachment=True, filename=f"{profile_id}.{extension}",
+        content_type=PROFILE_FILES[extension]
+    )
+
+
+def get_admin_urls():
+    """URL patterns of the profile pages, to be included before admin.site.urls."""
+    return [
+        path('admin/profiles/', admin.site.admin_view(profile_list_view), name='admin-profiles'),
+        path(
+            'admin/profiles/<str:profile_id>.<str:extension>',
+            admin.site.admin_view(profile_download_view),
+            name='admin-profile-download'
+        ),
+    ]
@@ -71,6 +71,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'apps.users',
     'apps.books',
     'apps.store',
@@ -83,11 +84,13 @@ ASGI_APPLICATION = 'project.asgi.application'
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'project.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'project.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -99,7 +102,7 @@ AUTH_USER_MODEL = 'users.User'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [os.path.join(BASE_DIR, 'project', 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -131,13 +134,23 @@ DATABASES = {
     }
 }
 
+#Auth
+# Build request.user from the access token's claims instead of loading the user
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', "true").lower() == 'true'
+# How long a deactivation or role change made without User.save() can take to revoke tokens
+JWT_REVOCATION_CACHE_SECONDS = int(os.getenv('JWT_REVOCATION_CACHE_SECONDS', 30))
+# Fallbacks after JWT, for the browsable API and scripts
+API_BASIC_AUTH = os.getenv('API_BASIC_AUTH', "true").lower() == 'true'
+API_SESSION_AUTH = os.getenv('API_SESSION_AUTH', "true").lower() == 'true'
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
-    'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-    ),
+    'DEFAULT_AUTHENTICATION_CLASSES': tuple(authentication for authentication in (
+        'apps.users.authentication.StatelessJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_framework.authentication.BasicAuthentication' if API_BASIC_AUTH else None,
+        'rest_framework.authentication.SessionAuthentication' if API_SESSION_AUTH else None,
+    ) if authentication),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
@@ -152,8 +165,15 @@ REST_FRAMEWORK = {
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=os.environ.get('SIMPLE_JWT_ACCESS_TOKEN_LIFETIME', 5)),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=os.environ.get('SIMPLE_JWT_REFRESH_TOKEN_LIFETIME', 30))
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=os.environ.get('SIMPLE_JWT_REFRESH_TOKEN_LIFETIME', 30)),
+    'TOKEN_USER_CLASS': 'apps.users.authentication.ClaimsUser',
 }
+
+AUTHENTICATION_BACKENDS = [
+    # Email (case-insensitive) or username; replaces ModelBackend, so a miss costs one lookup
+    'apps.users.backends.EmailBackend',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -196,6 +216,9 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+MEDIA_ROOT = os.getenv('DJANGO_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = os.getenv('DJANGO_MEDIA_URL', '/media/')
+
 DEFAULT_STORAGE = os.getenv('DJANGO_DEFAULT_STORAGE', 'DEFAULT')
 OVERRIDE_DEFAULT_STORAGE_IN_DEBUG = os.getenv('DJANGO_OVERRIDE_DEFAULT_STORAGE_IN_DEBUG', True)
 if DEBUG and not OVERRIDE_DEFAULT_STORAGE_IN_DEBUG and not DEFAULT_STORAGE == 'DEFAULT':
@@ -217,6 +240,128 @@ if DEBUG and not OVERRIDE_DEFAULT_STORAGE_IN_DEBUG and not DEFAULT_STORAGE == 'D
 #FE
 WEBAPP_URL = os.getenv('WEBAPP_URL', 'http://localhost:3000')
 
+#Cache
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+# The local-memory cache lives in each worker's heap, and so do invalidations:
+# use a shared backend with several workers (gunicorn.conf.py refuses to start
+# them otherwise). Bound it by entry count
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', 2000)),
+        'CULL_FREQUENCY': int(os.getenv('DJANGO_CACHE_CULL_FREQUENCY', 4)),
+    }
+
+#Books - response cache
+BOOK_LIST_CACHE_TIMEOUT = int(os.getenv('BOOK_LIST_CACHE_TIMEOUT', 60))
+BOOK_CACHE_LOCK_TIMEOUT = int(os.getenv('BOOK_CACHE_LOCK_TIMEOUT', 30))
+BOOK_CACHE_LOCK_WAIT = float(os.getenv('BOOK_CACHE_LOCK_WAIT', 2))
+
+#Books - facets
+BOOK_FACETS_LIMIT = int(os.getenv('BOOK_FACETS_LIMIT', 20))
+BOOK_FACETS_CACHE_TIMEOUT = int(os.getenv('BOOK_FACETS_CACHE_TIMEOUT', 300))
+
+#Books - bulk import
+BOOK_IMPORT_CHUNK_SIZE = int(os.getenv('BOOK_IMPORT_CHUNK_SIZE', 5000))
+
+#Books - export
+BOOK_EXPORT_CHUNK_SIZE = int(os.getenv('BOOK_EXPORT_CHUNK_SIZE', 2000))
+
+#Books - cover thumbnails
+# name:WIDTHxHEIGHT pairs; each size is rendered as JPEG and WebP
+BOOK_COVER_SIZES = {
+    name: tuple(int(pixels) for pixels in dimensions.split('x'))
+    for name, dimensions in (
+        size.split(':') for size in os.getenv('BOOK_COVER_SIZES', 'thumbnail:160x240,medium:320x480').split(',')
+    )
+}
+BOOK_COVER_WORKERS = int(os.getenv('BOOK_COVER_WORKERS', 2))
+
+#Books - chunked cover uploads
+BOOK_COVER_UPLOAD_MAX_SIZE = int(os.getenv('BOOK_COVER_UPLOAD_MAX_SIZE', 200 * 1024 * 1024))
+BOOK_COVER_UPLOAD_MAX_PART_SIZE = int(os.getenv('BOOK_COVER_UPLOAD_MAX_PART_SIZE', 8 * 1024 * 1024))
+BOOK_COVER_UPLOAD_EXPIRY_HOURS = int(os.getenv('BOOK_COVER_UPLOAD_EXPIRY_HOURS', 24))
+
+#Books - typeahead
+BOOK_SUGGEST_PRELOAD = os.getenv('BOOK_SUGGEST_PRELOAD', "true").lower() == 'true'
+BOOK_SUGGEST_REFRESH_SECONDS = int(os.getenv('BOOK_SUGGEST_REFRESH_SECONDS', 60))
+# Rebuild an index older than this (0 = never); other workers' writes are only
+# seen through the generation when the cache is shared
+BOOK_SUGGEST_MAX_AGE = int(os.getenv(
+    'BOOK_SUGGEST_MAX_AGE', 600 if CACHES['default']['BACKEND'].endswith('LocMemCache') else 0
+))
+BOOK_SUGGEST_LIMIT = int(os.getenv('BOOK_SUGGEST_LIMIT', 10))
+
+#Users - bulk provisioning
+USER_IMPORT_CHUNK_SIZE = int(os.getenv('USER_IMPORT_CHUNK_SIZE', 1000))
+# 0 starts one password hashing process per CPU
+USER_IMPORT_WORKERS = int(os.getenv('USER_IMPORT_WORKERS', 0))
+
+#Instrumentation
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', "true").lower() == 'true'
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', "true").lower() == 'true'
+# Repeats of one SQL shape in a request that are logged as a possible N+1 (0 disables)
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+N_PLUS_ONE_STACK_DEPTH = int(os.getenv('N_PLUS_ONE_STACK_DEPTH', 8))
+
+#Profiling
+# Staff requests sent with 'X-Profile: 1' are profiled (see project/profiling.py)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', "true").lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', 25))
+
+#Metrics
+# Prometheus metrics at /metrics; set PROMETHEUS_MULTIPROC_DIR with several worker processes
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', "true").lower() == 'true'
+# When set, scrapers must send 'Authorization: Bearer <token>'
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN', '')
+
+#Logging
+# 'json' for one structured record per line, 'text' for humans
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# INFO adds a line per request (project.requests) and per background job
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            'format': "[%(asctime)s] %(levelname)s [%(name)s] %(message)s",
+        },
+        'json': {
+            '()': 'project.instrumentation.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+        },
+    },
+    'loggers': {
+        'apps': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'project': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+#Store - cart retention
+CART_RETENTION_DAYS = int(os.getenv('CART_RETENTION_DAYS', 90))
+CART_ANONYMOUS_RETENTION_DAYS = int(os.getenv('CART_ANONYMOUS_RETENTION_DAYS', 30))
+CART_ARCHIVE_DIR = os.getenv('CART_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive', 'carts'))
+CART_ARCHIVE_BATCH_SIZE = int(os.getenv('CART_ARCHIVE_BATCH_SIZE', 500))
+
+#Store - sales rollups
+SALES_ROLLUP_LAG_SECONDS = int(os.getenv('SALES_ROLLUP_LAG_SECONDS', 60))
+SALES_ROLLUP_RECONCILE_DAYS = int(os.getenv('SALES_ROLLUP_RECONCILE_DAYS', 2))
+
+#Store - catalog feed
+CATALOG_FEED_CHUNK_SIZE = int(os.getenv('CATALOG_FEED_CHUNK_SIZE', 5000))
+
 # import sys    
 # LOGGING = {
 #     'version': 1,
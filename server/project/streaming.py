@@ -0,0 +1,187 @@
+"""
+Helpers for reading and writing large CSV / NDJSON feeds one record at a time.
+
+Used by the bulk import and export commands and endpoints so that
+arbitrarily large files are processed in fixed-size chunks with flat memory
+use.
+"""
+import csv
+import gzip
+import io
+import json
+import zlib
+from itertools import islice
+
+FEED_FORMATS = ('csv', 'ndjson')
+
+# Raised while reading a stream that is not what its name says: not gzip,
+# truncated, not UTF-8, or CSV the csv module rejects (NUL bytes, huge fields)
+_READ_ERRORS = (OSError, EOFError, zlib.error, UnicodeDecodeError, csv.Error)
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.json': 'ndjson',
+}
+
+
+def detect_format(filename, default=None):
+    """
+    Guess the feed format from a file name.
+
+    Args:
+        filename: Name of the uploaded or local file (a trailing .gz is ignored)
+        default: Value returned when the extension is unknown
+
+    Returns:
+        str: 'csv', 'ndjson' or the default
+    """
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    for extension, feed_format in _EXTENSIONS.items():
+        if name.endswith(extension):
+            return feed_format
+    return default
+
+
+class FeedReadError(ValueError):
+    """The feed file itself cannot be read, as opposed to a row being invalid."""
+
+
+def open_text(fileobj, filename=None):
+    """
+    Wrap a binary file (upload, local file or stdin) as a UTF-8 text stream.
+
+    Gzip-compressed input is decompressed on the fly when the file name ends
+    with .gz.
+    """
+    if filename and filename.lower().endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def iter_records(stream, feed_format):
+    """
+    Yield the records of a CSV or NDJSON text stream without loading it all.
+
+    Empty CSV cells and blank NDJSON lines are skipped, so optional columns can
+    simply be left empty.
+
+    Args:
+        stream: Text stream (see open_text)
+        feed_format: 'csv' or 'ndjson'
+
+    Yields:
+        tuple: (line_number, record dict or None, error message or None)
+
+    Raises:
+        FeedReadError: When the stream stops being readable; the records
+            yielded before stay valid
+    """
+    if feed_format not in FEED_FORMATS:
+        raise ValueError(f"Unsupported feed format '{feed_format}'. Use one of: {', '.join(FEED_FORMATS)}")
+
+    line_number = 0
+    try:
+        for line_number, record, error in _read_records(stream, feed_format):
+            yield line_number, record, error
+    except _READ_ERRORS as exc:
+        where = f" after line {line_number}" if line_number else ''
+        raise FeedReadError(f"The file cannot be read{where}: {exc}") from exc
+
+
+def _read_records(stream, feed_format):
+    if feed_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            record = {key: value for key, value in row.items() if key and value not in ('', None)}
+            yield reader.line_num, record, None
+    elif feed_format == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Each line must be a JSON object."
+                continue
+            yield line_number, record, None
+
+
+def write_records(records, feed_format, fieldnames, batch_size=500):
+    """
+    Encode records as CSV or NDJSON, yielding UTF-8 byte chunks.
+
+    Records are buffered batch_size at a time, so a StreamingHttpResponse
+    sends a few large chunks instead of one tiny one per row.
+
+    Args:
+        records: Iterable of dicts with JSON-serializable values
+        feed_format: 'csv' or 'ndjson'
+        fieldnames: CSV columns in order (the header row); ignored for NDJSON
+        batch_size: Records per yielded chunk
+
+    Yields:
+        bytes: Encoded chunks of the document
+    """
+    buffer = io.StringIO()
+    if feed_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(fieldnames)
+
+        def write(record):
+            writer.writerow([record[name] for name in fieldnames])
+    elif feed_format == 'ndjson':
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+        def write(record):
+            buffer.write(encoder.encode(record))
+            buffer.write('\n')
+    else:
+        raise ValueError(f"Unsupported feed format '{feed_format}'. Use one of: {', '.join(FEED_FORMATS)}")
+
+    pending = 0
+    for record in records:
+        write(record)
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Gzip-compress a stream of byte chunks on the fly.
+
+    Args:
+        chunks: Iterable of bytes (e.g. from write_records)
+        level: zlib compression level
+
+    Yields:
+        bytes: Parts of a single gzip member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from any iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
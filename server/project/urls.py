@@ -4,6 +4,8 @@ from django.urls import path,include
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view as swagger_get_shema_view
 from django.conf import settings
+from project.metrics import metrics_view
+from project.profiling import get_admin_urls as get_profile_admin_urls
 
 schema_view = swagger_get_shema_view(
     openapi.Info(
@@ -26,12 +28,15 @@ schema_view = swagger_get_shema_view(
 )
 
 
-urlpatterns = [
+urlpatterns = get_profile_admin_urls() + [
     path('admin/', admin.site.urls),
     path('swagger/schema/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
 
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
+
 apps=[
     'apps.users',
     'apps.books',